@@ -0,0 +1,18 @@
+from django.contrib import admin
+from .models import AccessEvent
+
+@admin.register(AccessEvent)
+class AccessEventAdmin(admin.ModelAdmin):
+    list_display = ('occurred_at', 'action', 'user_id', 'user_type', 'patient_id', 'record_id', 'ip_address')
+    list_filter = ('action', 'user_type')
+    search_fields = ('=patient_id', '=user_id', '=record_id')
+    readonly_fields = [field.name for field in AccessEvent._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
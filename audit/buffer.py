@@ -0,0 +1,141 @@
+"""
+Tampon en mémoire des événements d'audit, écrit par lots par un thread de fond.
+
+Les requêtes n'ajoutent qu'un élément à une file bornée ; un thread démon
+vide la file par bulk_create toutes les AUDIT_FLUSH_INTERVAL secondes ou dès
+qu'un lot est plein. Si la file est pleine, la requête écrit elle-même le lot
+en attente : les événements ne sont jamais perdus, l'écriture redevient
+simplement synchrone. Le reste de la file est écrit à l'arrêt du processus.
+Un lot refusé par la base est réécrit ligne par ligne : seule la ligne fautive
+est perdue.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+
+class AuditBuffer:
+    def __init__(self, max_size, batch_size, flush_interval):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_size)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.written = 0
+        self.failed = 0
+
+    def add(self, event):
+        """Mettre un AccessEvent (non enregistré) en file"""
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self._write(self._drain(self.batch_size) + [event])
+
+    def flush(self):
+        """Écrire immédiatement tout ce qui est en file"""
+        while True:
+            batch = self._drain(self.batch_size)
+            if not batch:
+                return
+            self._write(batch)
+
+    def shutdown(self, timeout=5):
+        """Arrêter le thread puis écrire le reste de la file"""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout)
+        self.flush()
+
+    def _ensure_thread(self):
+        # Après un fork (workers gunicorn), le thread du parent n'existe pas dans l'enfant
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            self._write([first] + self._drain(self.batch_size - 1), recycle=True)
+
+    def _drain(self, limit):
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch, recycle=False):
+        from .models import AccessEvent
+
+        if not batch:
+            return
+        try:
+            if recycle:
+                # Thread de fond uniquement : sur le thread d'une requête, ce serait
+                # la connexion de la vue (et sa transaction) qui serait fermée
+                close_old_connections()
+            # Point de sauvegarde : écriture synchrone possible dans la transaction d'une vue
+            with transaction.atomic():
+                AccessEvent.objects.bulk_create(batch, batch_size=self.batch_size)
+            self.written += len(batch)
+        except Exception:
+            # Une ligne invalide fait échouer tout le lot : on réessaie ligne par ligne
+            logger.exception("Échec d'écriture d'un lot de %d événements d'audit, écriture une à une", len(batch))
+            for event in batch:
+                self._write_one(event)
+
+    def _write_one(self, event):
+        try:
+            with transaction.atomic():
+                event.save()
+            self.written += 1
+        except Exception:
+            # Ne jamais faire échouer une requête ni tuer le thread pour l'audit
+            self.failed += 1
+            logger.exception("Échec d'écriture d'un événement d'audit (%s)", event.action)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = AuditBuffer(
+                    max_size=settings.AUDIT_BUFFER_SIZE,
+                    batch_size=settings.AUDIT_BATCH_SIZE,
+                    flush_interval=settings.AUDIT_FLUSH_INTERVAL,
+                )
+                atexit.register(_buffer.shutdown)
+    return _buffer
+
+
+def flush():
+    """Écrire les événements en attente (arrêt d'un worker, commandes, tests)"""
+    if _buffer is not None:
+        _buffer.flush()
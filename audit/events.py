@@ -0,0 +1,89 @@
+"""
+Enregistrement des accès aux données médicales depuis les vues
+"""
+import ipaddress
+
+from django.conf import settings
+
+from .buffer import get_buffer
+from .models import AccessEvent
+
+
+def client_ip(request):
+    """
+    Adresse du client : REMOTE_ADDR, ou l'entrée de X-Forwarded-For ajoutée par
+    le premier des AUDIT_TRUSTED_PROXIES mandataires de confiance. Les entrées
+    plus à gauche sont fournies par le client et ne sont jamais lues. None si
+    l'adresse n'est pas valide.
+    """
+    value = request.META.get('REMOTE_ADDR')
+    proxies = settings.AUDIT_TRUSTED_PROXIES
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if proxies and forwarded:
+        entries = [entry.strip() for entry in forwarded.split(',')]
+        value = entries[-min(proxies, len(entries))]
+    try:
+        return str(ipaddress.ip_address(value))
+    except ValueError:
+        return None
+
+
+def record_access(request, action, patient_id=None, record_id=None, path=None, **detail):
+    """
+    Journaliser un accès ; l'écriture en base est différée sauf si AUDIT_ASYNC est désactivé.
+
+    path remplace le chemin de la requête quand celui-ci contient un secret (jeton d'accès).
+    """
+    if not settings.AUDIT_ENABLED:
+        return
+    user = getattr(request, 'user', None)
+    authenticated = user is not None and user.is_authenticated
+    event = AccessEvent(
+        action=action,
+        user_id=user.pk if authenticated else None,
+        user_type=user.user_type if authenticated else '',
+        patient_id=patient_id,
+        record_id=record_id,
+        ip_address=client_ip(request),
+        path=(request.path if path is None else path)[:255],
+        detail=detail,
+    )
+    if settings.AUDIT_ASYNC:
+        get_buffer().add(event)
+    else:
+        event.save()
+
+
+def _patient_of(row):
+    patient = row.get('patient')
+    if isinstance(patient, dict):
+        return patient.get('id')
+    return patient
+
+
+def record_rows_access(request, action, rows, **detail):
+    """
+    Journaliser une liste de dossiers sérialisés : un événement par patient.
+
+    Si ?fields= exclut patient ou id, un seul événement sans patient est écrit.
+    """
+    if not settings.AUDIT_ENABLED:
+        return
+    by_patient = {}
+    for row in rows:
+        by_patient.setdefault(_patient_of(row), []).append(row.get('id'))
+    if not by_patient:
+        record_access(request, action, records=[], **detail)
+        return
+    for patient_id, record_ids in by_patient.items():
+        record_access(request, action, patient_id=patient_id,
+                      records=[record_id for record_id in record_ids if record_id is not None], **detail)
+
+
+def record_response_access(request, action, response, **detail):
+    """Journaliser les dossiers renvoyés par une réponse de liste (paginée ou non)"""
+    if response.status_code >= 400:
+        return
+    data = response.data
+    rows = data.get('results', []) if isinstance(data, dict) else data
+    record_rows_access(request, action, rows, **detail)
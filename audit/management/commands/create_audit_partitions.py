@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from core.partitioning import ensure_partitions, list_partitions, supports_partitioning
+from audit.models import AccessEvent
+
+
+class Command(BaseCommand):
+    help = "Créer à l'avance les partitions mensuelles du journal d'accès (à lancer chaque jour par cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=settings.AUDIT_PARTITION_MONTHS_AHEAD)
+
+    def handle(self, *args, **options):
+        if not supports_partitioning(connection):
+            self.stdout.write("Base sans partitionnement (PostgreSQL requis) : rien à faire.")
+            return
+
+        table = AccessEvent._meta.db_table
+        now = timezone.now()
+        created = ensure_partitions(connection, table, now, now + timedelta(days=31 * (options['months_ahead'] + 1)))
+        for name in created:
+            self.stdout.write(f"Partition créée : {name}")
+        self.stdout.write(self.style.SUCCESS(f"{len(list_partitions(connection, table))} partitions pour {table}."))
@@ -0,0 +1,77 @@
+# Generated by Django 4.2.30 on 2026-10-19 17:55
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+import django.utils.timezone
+
+from core.partitioning import convert_to_partitioned, ensure_partitions, supports_partitioning
+
+TABLE = 'audit_accessevent'
+
+
+def partition_table(apps, schema_editor):
+    # PostgreSQL : partitions mensuelles sur occurred_at, table en ajout seul
+    connection = schema_editor.connection
+    if not supports_partitioning(connection):
+        return
+    convert_to_partitioned(schema_editor, TABLE, 'occurred_at')
+    now = timezone.now()
+    ensure_partitions(connection, TABLE, now, now + timedelta(days=93), interval='month')
+    schema_editor.execute(
+        "CREATE FUNCTION audit_append_only() RETURNS trigger AS $$ "
+        "BEGIN RAISE EXCEPTION 'audit_accessevent est en ajout seul'; END; "
+        "$$ LANGUAGE plpgsql"
+    )
+    schema_editor.execute(
+        f"CREATE TRIGGER {TABLE}_append_only BEFORE UPDATE OR DELETE ON {TABLE} "
+        f"FOR EACH STATEMENT EXECUTE PROCEDURE audit_append_only()"
+    )
+
+
+def unpartition_table(apps, schema_editor):
+    if supports_partitioning(schema_editor.connection):
+        schema_editor.execute("DROP FUNCTION IF EXISTS audit_append_only() CASCADE")
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccessEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('occurred_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('action', models.CharField(choices=[('record_view', "Consultation d'un dossier"), ('record_list', 'Liste de dossiers'), ('search', 'Recherche'), ('pdf_download', 'Téléchargement PDF'), ('export', 'Export')], max_length=20)),
+                ('user_id', models.BigIntegerField(null=True)),
+                ('user_type', models.CharField(blank=True, max_length=10)),
+                ('patient_id', models.BigIntegerField(null=True)),
+                ('record_id', models.BigIntegerField(null=True)),
+                ('ip_address', models.GenericIPAddressField(null=True)),
+                ('path', models.CharField(blank=True, max_length=255)),
+                ('detail', models.JSONField(blank=True, default=dict)),
+            ],
+            options={
+                'ordering': ['-occurred_at'],
+            },
+        ),
+        migrations.RunPython(partition_table, unpartition_table),
+        migrations.AddIndex(
+            model_name='accessevent',
+            index=models.Index(fields=['patient_id', '-occurred_at'], name='audit_patient_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accessevent',
+            index=models.Index(fields=['user_id', '-occurred_at'], name='audit_user_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accessevent',
+            index=models.Index(fields=['record_id'], name='audit_record_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 18:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audit', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='accessevent',
+            name='action',
+            field=models.CharField(choices=[('record_view', "Consultation d'un dossier"), ('record_list', 'Liste de dossiers'), ('search', 'Recherche'), ('pdf_download', 'Téléchargement PDF'), ('export', 'Export'), ('emergency_card', "Fiche d'urgence")], max_length=20),
+        ),
+    ]
@@ -0,0 +1,63 @@
+from django.db import models
+from django.utils import timezone
+
+
+class AppendOnlyError(Exception):
+    """Tentative de modification ou de suppression d'un événement d'audit"""
+
+
+class AccessEventQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        raise AppendOnlyError("Le journal d'accès est en ajout seul.")
+
+    def delete(self):
+        raise AppendOnlyError("Le journal d'accès est en ajout seul.")
+
+
+class AccessEvent(models.Model):
+    """
+    Accès à des données médicales (lecture, téléchargement, recherche, export).
+
+    Table en ajout seul, partitionnée par mois sous PostgreSQL. Les identifiants
+    sont de simples entiers (pas de clés étrangères) pour que le journal
+    survive à la suppression des comptes et des dossiers.
+    """
+    ACTION_CHOICES = (
+        ('record_view', 'Consultation d\'un dossier'),
+        ('record_list', 'Liste de dossiers'),
+        ('search', 'Recherche'),
+        ('pdf_download', 'Téléchargement PDF'),
+        ('export', 'Export'),
+        ('emergency_card', 'Fiche d\'urgence'),
+    )
+
+    occurred_at = models.DateTimeField(default=timezone.now)
+    action = models.CharField(max_length=20, choices=ACTION_CHOICES)
+    user_id = models.BigIntegerField(null=True)
+    user_type = models.CharField(max_length=10, blank=True)
+    patient_id = models.BigIntegerField(null=True)
+    record_id = models.BigIntegerField(null=True)
+    ip_address = models.GenericIPAddressField(null=True)
+    path = models.CharField(max_length=255, blank=True)
+    detail = models.JSONField(default=dict, blank=True)
+
+    objects = AccessEventQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-occurred_at']
+        indexes = [
+            models.Index(fields=['patient_id', '-occurred_at'], name='audit_patient_time_idx'),
+            models.Index(fields=['user_id', '-occurred_at'], name='audit_user_time_idx'),
+            models.Index(fields=['record_id'], name='audit_record_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise AppendOnlyError("Le journal d'accès est en ajout seul.")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise AppendOnlyError("Le journal d'accès est en ajout seul.")
+
+    def __str__(self):
+        return f"{self.get_action_display()} - utilisateur {self.user_id} - {self.occurred_at:%d/%m/%Y %H:%M}"
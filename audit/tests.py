@@ -0,0 +1,60 @@
+from unittest import mock
+
+from django.db import transaction
+from django.test import RequestFactory, TestCase, override_settings
+
+from core.models import User
+
+from .buffer import AuditBuffer
+from .events import client_ip
+from .models import AccessEvent
+
+
+class ClientIpTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_forwarded_header_ignored_without_trusted_proxy(self):
+        request = self.factory.get('/', REMOTE_ADDR='10.0.0.5', HTTP_X_FORWARDED_FOR='1.2.3.4')
+        self.assertEqual(client_ip(request), '10.0.0.5')
+
+    @override_settings(AUDIT_TRUSTED_PROXIES=1)
+    def test_entry_added_by_trusted_proxy(self):
+        # La première entrée est fournie par le client, la dernière par le proxy
+        request = self.factory.get('/', REMOTE_ADDR='10.0.0.5', HTTP_X_FORWARDED_FOR='6.6.6.6, 203.0.113.7')
+        self.assertEqual(client_ip(request), '203.0.113.7')
+
+    @override_settings(AUDIT_TRUSTED_PROXIES=1)
+    def test_invalid_address_stored_as_null(self):
+        request = self.factory.get('/', REMOTE_ADDR='10.0.0.5', HTTP_X_FORWARDED_FOR="'; DROP TABLE")
+        self.assertIsNone(client_ip(request))
+
+
+class AuditBufferTests(TestCase):
+    def test_rejected_batch_written_row_by_row(self):
+        buffer = AuditBuffer(max_size=10, batch_size=10, flush_interval=1)
+        events = [AccessEvent(action='record_view', user_id=index) for index in range(3)]
+        # action NOT NULL : ce seul événement fait échouer le bulk_create du lot
+        events.insert(1, AccessEvent(action=None, user_id=99))
+
+        with self.assertLogs('audit.buffer', level='ERROR'):
+            buffer._write(events)
+
+        self.assertEqual(buffer.written, 3)
+        self.assertEqual(buffer.failed, 1)
+        self.assertEqual(sorted(AccessEvent.objects.values_list('user_id', flat=True)), [0, 1, 2])
+
+    def test_synchronous_write_keeps_the_view_connection(self):
+        buffer = AuditBuffer(max_size=1, batch_size=10, flush_interval=60)
+        with mock.patch.object(buffer, '_ensure_thread'), \
+                mock.patch('audit.buffer.close_old_connections') as close_old_connections, \
+                transaction.atomic():
+            User.objects.create_user(email='avant@tohpitoh.local')
+            buffer.add(AccessEvent(action='record_view', user_id=1))
+            # File pleine : la requête écrit elle-même le lot, dans sa transaction
+            buffer.add(AccessEvent(action='record_view', user_id=2))
+            User.objects.create_user(email='apres@tohpitoh.local')
+
+        close_old_connections.assert_not_called()
+        self.assertEqual(User.objects.count(), 2)
+        self.assertEqual(AccessEvent.objects.count(), 2)
@@ -0,0 +1,234 @@
+"""
+Import en masse de patients et de docteurs (CSV ou NDJSON).
+
+Chaque ligne est validée séparément ; les lignes valides sont créées par blocs
+de ONBOARDING_CHUNK_SIZE, chaque bloc dans sa propre transaction avec deux
+bulk_create (utilisateurs puis profils). Si un bloc échoue malgré tout (course
+avec une autre écriture), ses lignes sont rejouées une à une dans des points de
+sauvegarde pour isoler la ligne fautive.
+
+Mots de passe : en mode 'activation' (par défaut) aucun hachage n'a lieu à
+l'import, chaque compte reçoit un lien d'activation ; en mode 'hash' les mots
+de passe fournis sont hachés dans le pool de processus.
+"""
+import codecs
+import csv
+import json
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.tokens import default_token_generator
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from core.analytics import invalidate_cohort_stats
+from core.models import Doctor, Patient, User
+from core.process_pool import process_pool
+from core.serializers import OnboardingRowSerializer
+
+PASSWORD_MODES = ('activation', 'hash')
+
+
+class CSVRowsParser(BaseParser):
+    """Fichier CSV avec en-tête : une ligne par compte, cellules vides ignorées"""
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        reader = csv.DictReader(codecs.iterdecode(stream, 'utf-8-sig'))
+        try:
+            return [{key: value for key, value in row.items() if key and value not in (None, '')}
+                    for row in reader]
+        except (csv.Error, UnicodeDecodeError) as exc:
+            raise ParseError(f"CSV invalide : {exc}")
+
+
+class NDJSONRowsParser(BaseParser):
+    """Un objet JSON par ligne"""
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        rows = []
+        for number, line in enumerate(codecs.iterdecode(stream, 'utf-8-sig'), start=1):
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except ValueError as exc:
+                raise ParseError(f"Ligne {number} : JSON invalide ({exc})")
+        return rows
+
+
+def rows_from_upload(upload):
+    """Lire un fichier envoyé en multipart selon son extension ou son type"""
+    name = (upload.name or '').lower()
+    if name.endswith(('.ndjson', '.jsonl')) or upload.content_type == NDJSONRowsParser.media_type:
+        return NDJSONRowsParser().parse(upload)
+    return CSVRowsParser().parse(upload)
+
+
+def activation_url(user):
+    query = urlencode({
+        'uid': urlsafe_base64_encode(force_bytes(user.pk)),
+        'token': default_token_generator.make_token(user),
+    })
+    return f'{settings.ONBOARDING_ACTIVATION_URL}?{query}'
+
+
+def _hash_passwords(passwords):
+    if len(passwords) < 2:
+        return [make_password(password) for password in passwords]
+    with process_pool() as pool:
+        return list(pool.map(make_password, passwords, chunksize=max(1, len(passwords) // 32)))
+
+
+class BulkOnboarding:
+    """Validation puis création par blocs ; results contient un compte rendu par ligne"""
+
+    def __init__(self, rows, password_mode='activation', dry_run=False):
+        self.rows = rows
+        self.password_mode = password_mode
+        self.dry_run = dry_run
+        self.results = []
+
+    def run(self):
+        valid = self._validate()
+        if not self.dry_run:
+            if self.password_mode == 'hash':
+                hashes = _hash_passwords([data['password'] for _, data in valid])
+                for (_, data), encoded in zip(valid, hashes):
+                    data['password'] = encoded
+            chunk_size = settings.ONBOARDING_CHUNK_SIZE
+            for start in range(0, len(valid), chunk_size):
+                self._create_chunk(valid[start:start + chunk_size])
+            # bulk_create n'envoie pas de signaux
+            invalidate_cohort_stats()
+        self.results.sort(key=lambda result: result['row'])
+        return self.results
+
+    def summary(self):
+        counts = {}
+        for result in self.results:
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+        return {'rows': len(self.rows), 'password_mode': self.password_mode, 'dry_run': self.dry_run, **counts}
+
+    def _fail(self, row, email, errors):
+        self.results.append({'row': row, 'email': email, 'status': 'error', 'errors': errors})
+
+    def _validate(self):
+        context = {'password_mode': self.password_mode}
+        candidates = []
+        for row, data in enumerate(self.rows, start=1):
+            if not isinstance(data, dict):
+                self._fail(row, None, {'non_field_errors': ["Ligne attendue sous forme d'objet."]})
+                continue
+            serializer = OnboardingRowSerializer(data=data, context=context)
+            if serializer.is_valid():
+                candidates.append((row, dict(serializer.validated_data)))
+            else:
+                self._fail(row, data.get('email'), serializer.errors)
+
+        # Unicité vérifiée en une requête par bloc plutôt qu'une par ligne
+        emails = [data['email'] for _, data in candidates]
+        licenses = [data['medical_license'] for _, data in candidates if data['user_type'] == 'doctor']
+        taken_emails = {email.lower() for email in self._existing(User, 'email', emails)}
+        taken_licenses = set(self._existing(Doctor, 'medical_license', licenses))
+
+        valid, seen_emails, seen_licenses = [], {}, {}
+        for row, data in candidates:
+            email, license = data['email'].lower(), data.get('medical_license')
+            errors = {}
+            if email in taken_emails:
+                errors['email'] = ["Un utilisateur avec cet email existe déjà."]
+            elif email in seen_emails:
+                errors['email'] = [f"Email déjà présent à la ligne {seen_emails[email]}."]
+            if data['user_type'] == 'doctor':
+                if license in taken_licenses:
+                    errors['medical_license'] = ["Ce numéro de licence existe déjà."]
+                elif license in seen_licenses:
+                    errors['medical_license'] = [f"Licence déjà présente à la ligne {seen_licenses[license]}."]
+            if errors:
+                self._fail(row, data['email'], errors)
+                continue
+            seen_emails[email] = row
+            if data['user_type'] == 'doctor':
+                seen_licenses[license] = row
+            valid.append((row, data))
+            if self.dry_run:
+                self.results.append({'row': row, 'email': data['email'], 'status': 'valid'})
+        return valid
+
+    @staticmethod
+    def _existing(model, field, values):
+        found = []
+        chunk_size = settings.ONBOARDING_CHUNK_SIZE
+        for start in range(0, len(values), chunk_size):
+            chunk = values[start:start + chunk_size]
+            if field == 'email':
+                # Comparaison insensible à la casse, comme l'authentification par email
+                queryset = (model.objects.annotate(email_lower=Lower('email'))
+                            .filter(email_lower__in={value.lower() for value in chunk}))
+            else:
+                queryset = model.objects.filter(**{f'{field}__in': chunk})
+            found.extend(queryset.values_list(field, flat=True))
+        return found
+
+    def _build_user(self, data):
+        user = User(**{name: data[name] for name in OnboardingRowSerializer.USER_FIELDS if name in data})
+        if self.password_mode == 'hash':
+            user.password = data['password']
+        else:
+            user.set_unusable_password()
+        return user
+
+    @staticmethod
+    def _build_profile(user, data):
+        if data['user_type'] == 'doctor':
+            fields = OnboardingRowSerializer.DOCTOR_FIELDS
+            model = Doctor
+        else:
+            fields = OnboardingRowSerializer.PATIENT_FIELDS
+            model = Patient
+        return model(user=user, **{name: data[name] for name in fields if name in data})
+
+    def _create_chunk(self, chunk):
+        try:
+            with transaction.atomic():
+                users = User.objects.bulk_create([self._build_user(data) for _, data in chunk])
+                if any(user.pk is None for user in users):
+                    # Bases sans RETURNING : récupérer les identifiants par email
+                    ids = dict(User.objects.filter(email__in=[user.email for user in users])
+                               .values_list('email', 'id'))
+                    for user in users:
+                        user.pk = ids[user.email]
+                profiles = [self._build_profile(user, data) for user, (_, data) in zip(users, chunk)]
+                Doctor.objects.bulk_create([profile for profile in profiles if isinstance(profile, Doctor)])
+                Patient.objects.bulk_create([profile for profile in profiles if isinstance(profile, Patient)])
+        except IntegrityError:
+            self._create_one_by_one(chunk)
+            return
+        for user, (row, _) in zip(users, chunk):
+            self._created(row, user)
+
+    def _create_one_by_one(self, chunk):
+        with transaction.atomic():
+            for row, data in chunk:
+                try:
+                    with transaction.atomic():
+                        user = self._build_user(data)
+                        user.save()
+                        self._build_profile(user, data).save()
+                except IntegrityError as exc:
+                    self._fail(row, data['email'], {'non_field_errors': [str(exc)]})
+                else:
+                    self._created(row, user)
+
+    def _created(self, row, user):
+        result = {'row': row, 'email': user.email, 'status': 'created', 'id': user.pk, 'user_type': user.user_type}
+        if self.password_mode == 'activation':
+            result['activation_url'] = activation_url(user)
+        self.results.append(result)
@@ -1,3 +1,39 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from core.models import User
+from .onboarding import BulkOnboarding
+
+
+@override_settings(AUDIT_ENABLED=False, THROTTLE_ENABLED=False)
+class BulkOnboardingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Casse mixte dans la partie locale : normalize_email ne la modifie pas
+        User.objects.create_user(email='John.Doe@example.com', password='motdepasse')
+        cls.admin = User.objects.create_superuser(email='admin@tohpitoh.local', password='motdepasse')
+
+    def test_existing_email_detected_whatever_the_case(self):
+        rows = [
+            {'email': 'john.doe@example.com'},
+            {'email': 'JOHN.DOE@EXAMPLE.COM'},
+            {'email': 'jane.doe@example.com'},
+        ]
+        results = BulkOnboarding(rows, dry_run=True).run()
+
+        self.assertEqual([result['status'] for result in results], ['error', 'error', 'valid'])
+        for result in results[:2]:
+            self.assertEqual(result['errors']['email'], ["Un utilisateur avec cet email existe déjà."])
+
+    def test_import_skips_existing_mixed_case_email(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.post('/api/auth/onboarding/', {'rows': [
+            {'email': 'john.doe@example.com', 'first_name': 'John'},
+            {'email': 'awa.diallo@example.com', 'first_name': 'Awa'},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['summary']['error'], 1)
+        self.assertEqual(response.json()['summary']['created'], 1)
+        self.assertEqual(User.objects.filter(email__iexact='john.doe@example.com').count(), 1)
@@ -1,5 +1,7 @@
 from django.urls import path
-from .views import RegisterView, LoginView, LogoutView, ProfileView
+from .views import (
+    RegisterView, LoginView, LogoutView, ProfileView, BulkOnboardingView, ActivateAccountView,
+)
 
 app_name = 'authentication'
 
@@ -8,4 +10,6 @@ urlpatterns = [
     path('login/', LoginView.as_view(), name='login'),
     path('logout/', LogoutView.as_view(), name='logout'),
     path('profile/', ProfileView.as_view(), name='profile'),
+    path('onboarding/', BulkOnboardingView.as_view(), name='onboarding'),
+    path('activate/', ActivateAccountView.as_view(), name='activate'),
 ]
\ No newline at end of file
@@ -1,11 +1,18 @@
 from rest_framework import generics, status, permissions
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import login, logout
 
-from core.serializers import RegisterSerializer, LoginSerializer, UserSerializer
+from django.conf import settings
+
+from core.serializers import RegisterSerializer, LoginSerializer, UserSerializer, AccountActivationSerializer
 from core.models import User
+from core.db_router import ReplicaReadMixin
+from core.permissions import IsAdmin
+from .onboarding import BulkOnboarding, CSVRowsParser, NDJSONRowsParser, PASSWORD_MODES, rows_from_upload
 
 class RegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
@@ -55,9 +62,58 @@ class LogoutView(APIView):
         except Exception:
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
-class ProfileView(generics.RetrieveUpdateAPIView):
+class ProfileView(ReplicaReadMixin, generics.RetrieveUpdateAPIView):
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
     
     def get_object(self):
-        return self.request.user
\ No newline at end of file
+        return self.request.user
+
+class BulkOnboardingView(APIView):
+    """Import en masse de comptes (CSV, NDJSON, liste JSON ou fichier multipart)"""
+    permission_classes = [IsAdmin]
+    parser_classes = [CSVRowsParser, NDJSONRowsParser, JSONParser, MultiPartParser]
+
+    def get_rows(self, request):
+        if 'file' in request.FILES:
+            return rows_from_upload(request.FILES['file'])
+        data = request.data
+        if isinstance(data, dict):
+            data = data.get('rows')
+        if not isinstance(data, list):
+            raise ValidationError({"rows": "Liste de lignes attendue."})
+        return data
+
+    def post(self, request):
+        password_mode = request.query_params.get('password_mode', 'activation')
+        if password_mode not in PASSWORD_MODES:
+            raise ValidationError({"password_mode": f"Valeurs possibles : {', '.join(PASSWORD_MODES)}."})
+        dry_run = request.query_params.get('dry_run', '').lower() in ('1', 'true', 'yes')
+
+        rows = self.get_rows(request)
+        if len(rows) > settings.ONBOARDING_MAX_ROWS:
+            raise ValidationError({"rows": f"Au plus {settings.ONBOARDING_MAX_ROWS} lignes par import."})
+
+        onboarding = BulkOnboarding(rows, password_mode=password_mode, dry_run=dry_run)
+        results = onboarding.run()
+        created = any(result['status'] == 'created' for result in results)
+        return Response({
+            'summary': onboarding.summary(),
+            'results': results,
+        }, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+class ActivateAccountView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def post(self, request):
+        serializer = AccountActivationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = serializer.save()
+
+        refresh = RefreshToken.for_user(user)
+
+        return Response({
+            'user': UserSerializer(user).data,
+            'refresh': str(refresh),
+            'access': str(refresh.access_token),
+        })
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User, Doctor, Patient
+from .models import CareTeamMembership, User, Doctor, Patient
 
 class CustomUserAdmin(UserAdmin):
     list_display = ('email', 'first_name', 'last_name', 'user_type', 'is_staff')
@@ -29,11 +29,39 @@ class DoctorAdmin(admin.ModelAdmin):
     list_display = ('medical_license', 'specialization', 'hospital', 'is_verified')
     list_filter = ('specialization', 'is_verified')
     search_fields = ('user__email', 'user__first_name', 'user__last_name', 'medical_license')
+    raw_id_fields = ('user',)
+    ordering = ('user__last_name', 'user__first_name', 'id')
+
+    def get_queryset(self, request):
+        # __str__ passe par user : aussi utilisé par l'autocomplétion des dossiers
+        return super().get_queryset(request).select_related('user')
 
 @admin.register(Patient)
 class PatientAdmin(admin.ModelAdmin):
     list_display = ('user', 'blood_type', 'emergency_contact')
     list_filter = ('blood_type',)
     search_fields = ('user__email', 'user__first_name', 'user__last_name', 'insurance_number')
+    raw_id_fields = ('user',)
+    ordering = ('user__last_name', 'user__first_name', 'id')
+
+    def get_queryset(self, request):
+        # __str__ passe par user : aussi utilisé par l'autocomplétion des dossiers
+        return super().get_queryset(request).select_related('user')
+
+@admin.register(CareTeamMembership)
+class CareTeamMembershipAdmin(admin.ModelAdmin):
+    list_display = ('doctor', 'patient', 'granted_by', 'created_at')
+    search_fields = ('doctor__user__email', 'doctor__user__last_name', 'patient__user__email', 'patient__user__last_name')
+    raw_id_fields = ('doctor', 'patient')
+    readonly_fields = ('granted_by', 'created_at')
+    ordering = ('-created_at',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('doctor__user', 'patient__user', 'granted_by')
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            obj.granted_by = request.user
+        super().save_model(request, obj, form, change)
 
 admin.site.register(User, CustomUserAdmin)
\ No newline at end of file
@@ -0,0 +1,192 @@
+"""
+Statistiques de population calculées en base (agrégats et regroupements SQL).
+
+L'IMC, les catégories d'IMC et les tranches d'âge sont des expressions SQL :
+aucun patient n'est chargé en mémoire. Les résultats sont mis en cache sous
+une version globale incrémentée à chaque écriture d'un patient (ou de la date
+de naissance d'un utilisateur) ; COHORT_STATS_CACHE_SECONDS borne leur âge.
+"""
+import hashlib
+import json
+import math
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Case, Count, F, FloatField, Max, Min, Q, Value, When
+from django.db.models.functions import Floor
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Patient, User
+
+VERSION_KEY = 'cohort-stats:version'
+
+# Catégories OMS : (nom, borne basse incluse, borne haute exclue)
+BMI_CATEGORIES = (
+    ('underweight', None, 18.5),
+    ('normal', 18.5, 25),
+    ('overweight', 25, 30),
+    ('obese', 30, None),
+)
+
+
+def bmi_expression():
+    """IMC en base, même formule que Patient.calculate_bmi() (NULL si taille ou poids manquant)"""
+    height_in_m = F('height') / Value(100.0)
+    return Case(
+        When(height__gt=0, weight__gt=0, then=F('weight') / (height_in_m * height_in_m)),
+        default=None,
+        output_field=FloatField(),
+    )
+
+
+def _years_ago(today, years):
+    try:
+        return today.replace(year=today.year - years)
+    except ValueError:  # 29 février
+        return today.replace(year=today.year - years, day=28)
+
+
+def age_bands(today=None):
+    """Tranches d'âge de COHORT_AGE_BANDS -> (libellé, Q sur user__date_of_birth)"""
+    today = today or date.today()
+    limits = list(settings.COHORT_AGE_BANDS)
+    bands = []
+    for index, low in enumerate(limits):
+        high = limits[index + 1] if index + 1 < len(limits) else None
+        # Âge >= low : né au plus tard il y a low ans ; âge < high : né après il y a high ans
+        condition = Q(user__date_of_birth__lte=_years_ago(today, low))
+        if high is None:
+            label = f'{low}+'
+        else:
+            label = f'{low}-{high - 1}'
+            condition &= Q(user__date_of_birth__gt=_years_ago(today, high))
+        bands.append((label, condition))
+    return bands
+
+
+def cohort_queryset(blood_type=None, min_age=None, max_age=None, chronic_disease=None, using=None):
+    queryset = Patient.objects.using(using)
+    today = date.today()
+    if blood_type:
+        queryset = queryset.filter(blood_type=blood_type)
+    if min_age is not None:
+        queryset = queryset.filter(user__date_of_birth__lte=_years_ago(today, min_age))
+    if max_age is not None:
+        queryset = queryset.filter(user__date_of_birth__gt=_years_ago(today, max_age + 1))
+    if chronic_disease:
+        queryset = queryset.filter(chronic_diseases__icontains=chronic_disease)
+    return queryset.annotate(bmi=bmi_expression())
+
+
+def _round(value):
+    return None if value is None else round(value, 2)
+
+
+def compute_cohort_stats(using=None, **filters):
+    """Effectifs, IMC, tranches d'âge, groupes sanguins et prévalences : trois requêtes agrégées"""
+    queryset = cohort_queryset(using=using, **filters)
+
+    # Une seule lecture de la cohorte pour tous les compteurs conditionnels
+    aggregates = {
+        'patients': Count('id'),
+        'with_bmi': Count('id', filter=Q(bmi__isnull=False)),
+        'bmi_avg': Avg('bmi'),
+        # Écart type déduit de la moyenne des carrés : StdDev n'ignore pas NULL sous SQLite
+        'bmi_squares_avg': Avg(F('bmi') * F('bmi')),
+        'bmi_min': Min('bmi'),
+        'bmi_max': Max('bmi'),
+        'age_unknown': Count('id', filter=Q(user__date_of_birth__isnull=True)),
+    }
+    for name, low, high in BMI_CATEGORIES:
+        condition = Q(bmi__isnull=False)
+        if low is not None:
+            condition &= Q(bmi__gte=low)
+        if high is not None:
+            condition &= Q(bmi__lt=high)
+        aggregates[f'bmi:{name}'] = Count('id', filter=condition)
+    for label, condition in age_bands():
+        aggregates[f'age:{label}'] = Count('id', filter=condition)
+    for disease in settings.COHORT_CHRONIC_DISEASES:
+        aggregates[f'disease:{disease}'] = Count('id', filter=Q(chronic_diseases__icontains=disease))
+    totals = queryset.aggregate(**aggregates)
+
+    patients = totals['patients']
+    stddev = None
+    if totals['bmi_avg'] is not None:
+        stddev = math.sqrt(max(0.0, totals['bmi_squares_avg'] - totals['bmi_avg'] ** 2))
+    width = settings.COHORT_BMI_BUCKET_WIDTH
+    histogram = (
+        queryset.filter(bmi__isnull=False)
+        .annotate(bucket=Floor(F('bmi') / Value(width)))
+        .values('bucket').annotate(count=Count('id')).order_by('bucket')
+    )
+    blood_types = queryset.values('blood_type').annotate(count=Count('id')).order_by('-count', 'blood_type')
+
+    return {
+        'patients': patients,
+        'bmi': {
+            'known': totals['with_bmi'],
+            'average': _round(totals['bmi_avg']),
+            'stddev': _round(stddev),
+            'min': _round(totals['bmi_min']),
+            'max': _round(totals['bmi_max']),
+            'categories': {name: totals[f'bmi:{name}'] for name, _, _ in BMI_CATEGORIES},
+            'histogram': [
+                {'from': row['bucket'] * width, 'to': (row['bucket'] + 1) * width, 'count': row['count']}
+                for row in histogram
+            ],
+        },
+        'age_bands': {
+            **{label: totals[f'age:{label}'] for label, _ in age_bands()},
+            'unknown': totals['age_unknown'],
+        },
+        'blood_types': {row['blood_type'] or 'unknown': row['count'] for row in blood_types},
+        'chronic_diseases': {
+            disease: {
+                'count': totals[f'disease:{disease}'],
+                'prevalence': round(totals[f'disease:{disease}'] / patients, 4) if patients else None,
+            }
+            for disease in settings.COHORT_CHRONIC_DISEASES
+        },
+    }
+
+
+def _cache_key(filters):
+    version = cache.get_or_set(VERSION_KEY, 1, None)
+    digest = hashlib.sha1(json.dumps(filters, sort_keys=True, default=str).encode()).hexdigest()[:16]
+    return f'cohort-stats:{version}:{digest}'
+
+
+def cohort_stats(using=None, **filters):
+    """Statistiques en cache ; renvoie (données, servi depuis le cache)"""
+    key = _cache_key({**filters, 'using': using} if using else filters)
+    data = cache.get(key)
+    if data is not None:
+        return data, True
+    data = compute_cohort_stats(using=using, **filters)
+    cache.set(key, data, settings.COHORT_STATS_CACHE_SECONDS)
+    return data, False
+
+
+def invalidate_cohort_stats():
+    """Rendre obsolètes toutes les statistiques en cache (écritures hors signaux : bulk_create...)"""
+    cache.add(VERSION_KEY, 1, None)
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        pass
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+def _patient_changed(sender, **kwargs):
+    invalidate_cohort_stats()
+
+
+@receiver(post_save, sender=User)
+def _user_changed(sender, update_fields=None, created=False, **kwargs):
+    # Les connexions (last_login) ne changent pas la cohorte
+    if created or update_fields is None or 'date_of_birth' in update_fields:
+        invalidate_cohort_stats()
@@ -0,0 +1,50 @@
+"""
+Équipes de soins : l'accès d'un docteur limité aux patients qu'il suit.
+
+Les listes et recherches sont filtrées en base par une sous-requête Exists sur
+CareTeamMembership (index unique doctor, patient) : une seule requête, quel que
+soit le nombre de patients suivis. Les contrôles portant sur un patient précis
+(paramètre patient_id, création, permission d'objet) font une requête exists()
+sur le même index.
+
+Rien n'est gardé en cache : le cache par défaut est propre à chaque worker
+sans Redis, et un retrait de l'équipe doit s'appliquer immédiatement partout.
+
+Tant que CARE_TEAM_ENFORCEMENT est faux, tout docteur garde accès à tous les
+dossiers (comportement historique, le temps de constituer les équipes).
+"""
+from django.conf import settings
+from django.db.models import Count, Exists, Max, OuterRef
+
+from .models import CareTeamMembership
+
+
+def enforced(user):
+    return settings.CARE_TEAM_ENFORCEMENT and user.user_type == 'doctor'
+
+
+def _memberships(user):
+    return CareTeamMembership.objects.filter(doctor__user_id=user.pk)
+
+
+def filter_for_care_team(queryset, user, patient_field='patient'):
+    """Restreindre un queryset (dossiers, patients...) aux patients de l'équipe du docteur"""
+    if not enforced(user):
+        return queryset
+    return queryset.filter(Exists(_memberships(user).filter(patient_id=OuterRef(patient_field))))
+
+
+def can_access_patient(user, patient_id):
+    """Contrôle pour un patient donné : une requête exists() indexée"""
+    if not enforced(user):
+        return True
+    return _memberships(user).filter(patient_id=patient_id).exists()
+
+
+def care_team_scope(user):
+    """Portée des résultats partagés entre docteurs : commune sans équipes, propre à l'équipe sinon"""
+    if not enforced(user):
+        return 'doctor'
+    # Identifiants croissants : tout ajout ou retrait de membre change le nombre ou le maximum
+    team = _memberships(user).aggregate(members=Count('id'), last=Max('id'))
+    return f"doctor:{user.pk}:{team['members']}:{team['last'] or 0}"
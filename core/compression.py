@@ -0,0 +1,168 @@
+"""
+Encodeurs de compression des réponses HTTP (gzip, et brotli/zstd si installés).
+
+Chaque encodeur compresse un corps complet ou un flux. En flux, le
+compresseur est vidé (sync flush) tous les COMPRESSION_STREAM_FLUSH_SIZE
+octets reçus : le client reçoit les données au fil de l'eau sans qu'un vidage
+par ligne d'export ne dégrade le taux de compression.
+"""
+import zlib
+
+from django.conf import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class Encoder:
+    """Compression d'un corps complet (compress) ou d'un flux de blocs (stream)"""
+    name = None
+
+    def __init__(self, level):
+        self.level = level
+
+    def compress(self, data):
+        raise NotImplementedError
+
+    def stream(self, chunks, flush_size=None):
+        """Vider le compresseur dès que flush_size octets sont entrés depuis le dernier vidage"""
+        flush_size = settings.COMPRESSION_STREAM_FLUSH_SIZE if flush_size is None else flush_size
+        compressor = self.compressor()
+        pending = 0
+        for chunk in chunks:
+            data = self.process(compressor, chunk)
+            pending += len(chunk)
+            if pending >= flush_size:
+                data += self.flush(compressor)
+                pending = 0
+            if data:
+                yield data
+        yield self.finish(compressor)
+
+
+class GzipEncoder(Encoder):
+    name = 'gzip'
+
+    def compressor(self):
+        return zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        compressor = self.compressor()
+        return compressor.compress(data) + compressor.flush()
+
+    def process(self, compressor, chunk):
+        return compressor.compress(chunk)
+
+    def flush(self, compressor):
+        return compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, compressor):
+        return compressor.flush()
+
+
+class BrotliEncoder(Encoder):
+    name = 'br'
+
+    def compressor(self):
+        return brotli.Compressor(quality=self.level)
+
+    def compress(self, data):
+        return brotli.compress(data, quality=self.level)
+
+    def process(self, compressor, chunk):
+        return compressor.process(chunk)
+
+    def flush(self, compressor):
+        return compressor.flush()
+
+    def finish(self, compressor):
+        return compressor.finish()
+
+
+class ZstdEncoder(Encoder):
+    name = 'zstd'
+
+    def compressor(self):
+        return zstandard.ZstdCompressor(level=self.level).compressobj()
+
+    def compress(self, data):
+        return zstandard.ZstdCompressor(level=self.level).compress(data)
+
+    def process(self, compressor, chunk):
+        return compressor.compress(chunk)
+
+    def flush(self, compressor):
+        return compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self, compressor):
+        return compressor.flush()
+
+
+ENCODERS = {
+    'gzip': GzipEncoder,
+    'br': BrotliEncoder if brotli is not None else None,
+    'zstd': ZstdEncoder if zstandard is not None else None,
+}
+
+
+def available_encodings():
+    """Encodages activés dans COMPRESSION_ENCODINGS dont la bibliothèque est installée"""
+    return [name for name in settings.COMPRESSION_ENCODINGS if ENCODERS.get(name) is not None]
+
+
+def get_encoder(name, level=None):
+    if level is None:
+        level = settings.COMPRESSION_LEVELS[name]
+    return ENCODERS[name](level)
+
+
+def parse_accept_encoding(header):
+    """Accept-Encoding -> {encodage: q}"""
+    accepted = {}
+    for item in header.split(','):
+        name, _, params = item.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name] = quality
+    return accepted
+
+
+def negotiate(header):
+    """Encodage retenu : meilleur q du client, puis ordre de COMPRESSION_ENCODINGS"""
+    accepted = parse_accept_encoding(header or '')
+    wildcard = accepted.get('*', 0.0)
+    best, best_quality = None, 0.0
+    for name in available_encodings():
+        quality = accepted.get(name, wildcard)
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+
+def is_compressible(content_type):
+    """Types textuels de COMPRESSION_CONTENT_TYPES (PDF, images, archives sont déjà compressés)"""
+    media_type = content_type.split(';')[0].strip().lower()
+    if not media_type:
+        return False
+    if media_type.endswith(('+json', '+xml')):
+        return True
+    return any(
+        media_type.startswith(allowed) if allowed.endswith('/') else media_type == allowed
+        for allowed in settings.COMPRESSION_CONTENT_TYPES
+    )
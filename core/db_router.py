@@ -0,0 +1,79 @@
+"""
+Routage des lectures vers les réplicas (DATABASE_REPLICA_URLS).
+
+Les écritures vont toujours sur 'default'. Les lectures n'utilisent un réplica
+que dans une requête sûre (GET, HEAD, OPTIONS) d'une vue ReplicaReadMixin, et
+pas si l'utilisateur a écrit depuis moins de DATABASE_READ_YOUR_WRITES_SECONDS :
+il relit alors ses propres écritures sur la base principale.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+
+_use_replica = ContextVar('use_replica', default=False)
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith('replica_')]
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _use_replica.get():
+            replicas = replica_aliases()
+            if replicas:
+                return random.choice(replicas)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Les réplicas contiennent les mêmes données que la base principale
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+def _pin_key(user):
+    return f'db:primary-pin:{user.pk}'
+
+
+def pin_primary(user):
+    """Garder les lectures de l'utilisateur sur la base principale après une écriture"""
+    cache.set(_pin_key(user), 1, settings.DATABASE_READ_YOUR_WRITES_SECONDS)
+
+
+def is_pinned(user):
+    return user.is_authenticated and cache.get(_pin_key(user)) is not None
+
+
+class ReplicaReadMixin:
+    """Mixin de vue DRF : lectures sur réplica pour les méthodes sûres, épinglage après écriture"""
+    # Actions devant lire un état cohérent, toujours servies par la base principale
+    primary_read_actions = ()
+
+    def uses_replica(self, request):
+        return (replica_aliases() and request.method in SAFE_METHODS
+                and getattr(self, 'action', None) not in self.primary_read_actions
+                and not is_pinned(request.user))
+
+    def initial(self, request, *args, **kwargs):
+        if self.uses_replica(request):
+            self._replica_token = _use_replica.set(True)
+        super().initial(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_replica_token', None)
+        if token is not None:
+            # Les réponses en flux sont lues après ce point, sur la base principale
+            _use_replica.reset(token)
+            self._replica_token = None
+        if (request.method not in SAFE_METHODS and response.status_code < 400
+                and request.user.is_authenticated):
+            pin_primary(request.user)
+        return super().finalize_response(request, response, *args, **kwargs)
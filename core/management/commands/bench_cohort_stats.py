@@ -0,0 +1,157 @@
+import os
+import random
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.test.utils import CaptureQueriesContext
+
+from core.analytics import BMI_CATEGORIES, age_bands, cohort_stats, compute_cohort_stats, invalidate_cohort_stats
+from core.models import Patient, User
+
+BLOOD_TYPES = ('O+', 'O-', 'A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', '')
+
+
+class _Rollback(Exception):
+    pass
+
+
+def is_disposable(connection):
+    """Base SQLite ou base de test : les patients générés n'y risquent rien"""
+    name = str(connection.settings_dict['NAME'])
+    return (connection.vendor == 'sqlite' or os.path.basename(name).startswith('test_')
+            or name == connection.settings_dict['TEST'].get('NAME'))
+
+
+def python_stats(today, using=None):
+    """Calcul objet par objet (Patient.calculate_bmi()), référence de parité et de temps"""
+    bands = age_bands(today)
+    limits = list(settings.COHORT_AGE_BANDS)
+    stats = {
+        'patients': 0,
+        'categories': {name: 0 for name, _, _ in BMI_CATEGORIES},
+        'age_bands': {label: 0 for label, _ in bands},
+        'blood_types': {},
+        'diseases': {disease: 0 for disease in settings.COHORT_CHRONIC_DISEASES},
+    }
+    for patient in Patient.objects.using(using).select_related('user').iterator(chunk_size=2000):
+        stats['patients'] += 1
+        if patient.calculate_bmi() is not None:
+            # Catégorie sur la valeur non arrondie, comme en base
+            bmi = patient.weight / (patient.height / 100) ** 2
+            for name, low, high in BMI_CATEGORIES:
+                if (low is None or bmi >= low) and (high is None or bmi < high):
+                    stats['categories'][name] += 1
+        born = patient.user.date_of_birth
+        if born is not None:
+            age = today.year - born.year - ((today.month, today.day) < (born.month, born.day))
+            for index, (label, _) in enumerate(bands):
+                high = limits[index + 1] if index + 1 < len(limits) else None
+                if age >= limits[index] and (high is None or age < high):
+                    stats['age_bands'][label] += 1
+        key = patient.blood_type or 'unknown'
+        stats['blood_types'][key] = stats['blood_types'].get(key, 0) + 1
+        text = patient.chronic_diseases.lower()
+        for disease in stats['diseases']:
+            if disease.lower() in text:
+                stats['diseases'][disease] += 1
+    return stats
+
+
+class Command(BaseCommand):
+    help = ("Statistiques de cohorte : calcul par objet en Python contre agrégats en base et cache, "
+            "sur des patients synthétiques générés puis annulés")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=1_000_000)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--skip-python', action='store_true', help="Ne pas mesurer le calcul par objet.")
+        parser.add_argument('--database',
+                            help="Alias de la base visée ; obligatoire si la base par défaut n'est ni SQLite ni une "
+                                 "base de test.")
+
+    def handle(self, *args, **options):
+        using = options['database'] or DEFAULT_DB_ALIAS
+        if using not in connections:
+            raise CommandError(f"Base inconnue : {using}")
+        if options['database'] is None and not is_disposable(connections[using]):
+            raise CommandError(
+                f"La base par défaut ({connections[using].vendor}) n'est ni SQLite ni une base de test : "
+                f"préciser --database pour y générer {options['patients']} patients (annulés ensuite).")
+        try:
+            with transaction.atomic(using=using):
+                start = time.perf_counter()
+                self._seed(options['patients'], options['batch_size'], options['seed'], using)
+                self.stdout.write(f"{options['patients']} patients générés en {time.perf_counter() - start:.1f} s")
+                self._run(options['skip_python'], using)
+                raise _Rollback
+        except _Rollback:
+            pass
+        invalidate_cohort_stats()
+
+    def _seed(self, count, batch_size, seed, using):
+        rng = random.Random(seed)
+        diseases = list(settings.COHORT_CHRONIC_DISEASES)
+        today = date.today()
+        for offset in range(0, count, batch_size):
+            size = min(batch_size, count - offset)
+            users = User.objects.using(using).bulk_create([
+                User(email=f'bench-cohort-{offset + i}@tohpitoh.local', password='!',
+                     date_of_birth=None if rng.random() < 0.05 else today - timedelta(days=rng.randint(0, 95 * 365)))
+                for i in range(size)
+            ])
+            if users[0].pk is None:
+                ids = dict(User.objects.using(using).filter(email__in=[user.email for user in users])
+                           .values_list('email', 'id'))
+                for user in users:
+                    user.pk = ids[user.email]
+            Patient.objects.using(using).bulk_create([
+                Patient(
+                    user=user,
+                    blood_type=rng.choice(BLOOD_TYPES),
+                    height=None if rng.random() < 0.1 else round(rng.gauss(168, 10), 1),
+                    weight=None if rng.random() < 0.1 else round(rng.gauss(72, 15), 1),
+                    chronic_diseases=', '.join(rng.sample(diseases, rng.choice((0, 0, 0, 1, 1, 2)))),
+                )
+                for user in users
+            ])
+
+    def _run(self, skip_python, using):
+        invalidate_cohort_stats()
+        today = date.today()
+
+        with CaptureQueriesContext(connections[using]) as queries:
+            start = time.perf_counter()
+            stats = compute_cohort_stats(using=using)
+            database_time = time.perf_counter() - start
+        self.stdout.write(f"Agrégats en base     {database_time * 1000:>10.1f} ms  ({len(queries)} requêtes)")
+
+        cohort_stats(using=using)
+        start = time.perf_counter()
+        _, cached = cohort_stats(using=using)
+        cached_time = time.perf_counter() - start
+        if not cached:
+            raise CommandError("La seconde lecture aurait dû venir du cache.")
+        self.stdout.write(f"Lecture en cache     {cached_time * 1000:>10.3f} ms")
+
+        if skip_python:
+            return
+        start = time.perf_counter()
+        reference = python_stats(today, using)
+        python_time = time.perf_counter() - start
+        self.stdout.write(f"Calcul par objet     {python_time * 1000:>10.1f} ms  "
+                          f"(x{python_time / database_time:.1f} par rapport à la base)")
+
+        expected = {
+            'patients': stats['patients'],
+            'categories': stats['bmi']['categories'],
+            'age_bands': {label: stats['age_bands'][label] for label, _ in age_bands(today)},
+            'blood_types': stats['blood_types'],
+            'diseases': {disease: value['count'] for disease, value in stats['chronic_diseases'].items()},
+        }
+        if reference != expected:
+            raise CommandError(f"Résultats différents :\nPython {reference}\nbase   {expected}")
+        self.stdout.write(self.style.SUCCESS("Parité vérifiée entre calcul par objet et agrégats en base."))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tohpitoh_backend.docs.generator import SchemaArtifact, available_validators, build_schema, validate_schema
+
+
+class Command(BaseCommand):
+    help = "Générer, valider et enregistrer le schéma OpenAPI servi par /swagger.json"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help="Ne rien écrire ; échouer si l'artefact existant est absent ou périmé.")
+
+    def handle(self, *args, **options):
+        artifact = SchemaArtifact(build_schema())
+
+        errors = validate_schema(artifact.content)
+        if errors:
+            raise CommandError("Schéma invalide :\n" + "\n".join(errors))
+        if not available_validators():
+            self.stdout.write("swagger_spec_validator absent : seuls les contrôles internes ont été appliqués.")
+
+        if options['check']:
+            current = SchemaArtifact.read()
+            if current is None or current.etag != artifact.etag:
+                raise CommandError(f"Artefact absent ou périmé : {SchemaArtifact.path()}")
+            self.stdout.write(self.style.SUCCESS(f"Schéma à jour ({artifact.etag})."))
+            return
+
+        path = artifact.write()
+        self.stdout.write(self.style.SUCCESS(
+            f"Schéma {artifact.version} écrit dans {path} "
+            f"({len(artifact.content)} octets, {len(artifact.gzipped)} compressés, ETag {artifact.etag})."
+        ))
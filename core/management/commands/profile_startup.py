@@ -0,0 +1,102 @@
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Ce que fait un worker gunicorn avant sa première réponse : application WSGI et URLconf
+STARTUP_SCRIPT = (
+    "from django.core.wsgi import get_wsgi_application\n"
+    "get_wsgi_application()\n"
+    "from django.urls import get_resolver\n"
+    "get_resolver().url_patterns\n"
+)
+
+
+def parse_importtime(output):
+    """Lire la sortie de -X importtime : liste de (module, propre µs, cumulé µs, profondeur)"""
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        if not self_us.strip().isdigit():
+            continue  # ligne d'en-tête
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return entries
+
+
+def profile_imports():
+    """Lancer un processus neuf et renvoyer ses imports mesurés"""
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'tohpitoh_backend.settings'))
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT],
+        cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise CommandError(f"Le démarrage a échoué :\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def total_import_ms(entries):
+    """Temps d'import cumulé des modules de premier niveau (ms)"""
+    return sum(cumulative for _, _, cumulative, depth in entries if depth == 0) / 1000
+
+
+def measure_startup(repeat=3):
+    """Médiane de repeat démarrages : (temps d'import en ms, imports de ce démarrage)"""
+    runs = [profile_imports() for _ in range(max(repeat, 1))]
+    totals = [total_import_ms(entries) for entries in runs]
+    total_ms = statistics.median_low(totals)
+    return total_ms, runs[totals.index(total_ms)]
+
+
+def loaded_lazy_modules(entries, lazy_modules):
+    names = {name for name, *_ in entries}
+    return sorted(module for module in lazy_modules if module in names)
+
+
+class Command(BaseCommand):
+    help = "Mesurer le temps d'import au démarrage à froid, module par module (-X importtime)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=3,
+                            help="Nombre de démarrages mesurés (la médiane est retenue).")
+        parser.add_argument('--top', type=int, default=20, help="Nombre de modules affichés.")
+        parser.add_argument('--budget-ms', type=int, default=settings.STARTUP_IMPORT_BUDGET_MS)
+        parser.add_argument('--check', action='store_true',
+                            help="Échouer si le budget est dépassé ou si un module paresseux est chargé.")
+
+    def handle(self, *args, **options):
+        repeat = max(options['repeat'], 1)
+        total_ms, entries = measure_startup(repeat)
+
+        self.stdout.write(f"{'module':<50} {'propre ms':>10} {'cumulé ms':>10}")
+        for name, self_us, cumulative_us, depth in sorted(entries, key=lambda e: e[2], reverse=True)[:options['top']]:
+            self.stdout.write(f"{'  ' * depth + name:<50} {self_us / 1000:>10.1f} {cumulative_us / 1000:>10.1f}")
+
+        packages = {}
+        for name, self_us, _, _ in entries:
+            package = name.split('.')[0]
+            packages[package] = packages.get(package, 0) + self_us
+        self.stdout.write("\nPar paquet (temps propre cumulé) :")
+        for package, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:10]:
+            self.stdout.write(f"  {package:<30} {self_us / 1000:>8.1f} ms")
+
+        budget = options['budget_ms']
+        self.stdout.write(f"\nImports au démarrage : {total_ms:.0f} ms "
+                          f"(médiane sur {repeat}, budget {budget} ms), {len(entries)} modules")
+
+        lazy = loaded_lazy_modules(entries, settings.STARTUP_LAZY_MODULES)
+        if lazy:
+            self.stdout.write(self.style.WARNING(f"Modules chargés au démarrage au lieu de la première utilisation : {', '.join(lazy)}"))
+
+        if options['check']:
+            if total_ms > budget:
+                raise CommandError(f"Budget de démarrage dépassé : {total_ms:.0f} ms > {budget} ms")
+            if lazy:
+                raise CommandError(f"Modules paresseux chargés au démarrage : {', '.join(lazy)}")
+            self.stdout.write(self.style.SUCCESS("Démarrage dans le budget."))
@@ -0,0 +1,99 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+CHILD_ENV = 'REPLICA_HARNESS_DIR'
+
+
+def replicate(directory):
+    """Copier la base principale sur le réplica : simule l'application du retard de réplication"""
+    from django.db import connections
+
+    connections['replica_0'].close()
+    with sqlite3.connect(directory / 'primary.sqlite3') as source, \
+            sqlite3.connect(directory / 'replica.sqlite3') as target:
+        source.backup(target)
+
+
+class Command(BaseCommand):
+    help = ("Banc local du routage vers les réplicas : deux bases SQLite, réplication "
+            "manuelle pour simuler le retard, vérification de la lecture de ses écritures")
+
+    def handle(self, *args, **options):
+        directory = os.environ.get(CHILD_ENV)
+        if directory:
+            self._scenario(Path(directory))
+            return
+
+        # Relancer la commande dans un processus configuré sur deux bases temporaires
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(
+                os.environ,
+                DATABASE_URL=f'sqlite:///{tmp}/primary.sqlite3',
+                DATABASE_REPLICA_URLS=f'sqlite:///{tmp}/replica.sqlite3',
+                DATABASE_READ_YOUR_WRITES_SECONDS='2',
+                REDIS_URL='',
+                AUDIT_ASYNC='False',
+                THROTTLE_ENABLED='False',
+                **{CHILD_ENV: tmp},
+            )
+            result = subprocess.run([sys.executable, 'manage.py', 'replica_harness'], cwd=settings.BASE_DIR, env=env)
+        if result.returncode != 0:
+            raise CommandError("Le routage vers les réplicas ne se comporte pas comme attendu.")
+
+    def _scenario(self, directory):
+        from rest_framework.test import APIClient
+        from core.models import User, Doctor, Patient
+
+        call_command('migrate', database='default', verbosity=0)
+        doctor_user = User.objects.create_user(email='harness-doctor@tohpitoh.local', user_type='doctor')
+        Doctor.objects.create(user=doctor_user, medical_license='HARNESS-1', specialization='Généraliste')
+        patient_user = User.objects.create_user(email='harness-patient@tohpitoh.local', first_name='Patient', last_name='Banc')
+        patient = Patient.objects.create(user=patient_user)
+        replicate(directory)
+
+        doctor = APIClient(HTTP_HOST='localhost')
+        doctor.force_authenticate(doctor_user)
+        other_doctor_user = User.objects.create_user(email='harness-doctor2@tohpitoh.local', user_type='doctor')
+        other = APIClient(HTTP_HOST='localhost')
+        other.force_authenticate(other_doctor_user)
+        replicate(directory)
+
+        def visible(client):
+            response = client.get('/api/medical-records/', {'fields': 'id'})
+            return response.json()['count']
+
+        failures = []
+
+        def expect(label, actual, expected):
+            ok = actual == expected
+            self.stdout.write(f"{'OK  ' if ok else 'ÉCHEC'} {label} : {actual} (attendu {expected})")
+            if not ok:
+                failures.append(label)
+
+        response = doctor.post('/api/medical-records/', {
+            'patient_id': patient.id, 'record_type': 'consultation',
+            'title': 'Écriture', 'description': 'Créé sur la base principale',
+        }, format='json')
+        expect("création", response.status_code, 201)
+        expect("l'auteur relit son écriture (épinglé sur la principale)", visible(doctor), 1)
+        expect("un autre lecteur lit le réplica en retard", visible(other), 0)
+
+        time.sleep(settings.DATABASE_READ_YOUR_WRITES_SECONDS + 0.5)
+        expect("fenêtre écoulée : l'auteur lit aussi le réplica", visible(doctor), 0)
+
+        replicate(directory)
+        expect("après réplication : visible pour l'auteur", visible(doctor), 1)
+        expect("après réplication : visible pour les autres", visible(other), 1)
+
+        if failures:
+            sys.exit(1)
+        self.stdout.write(self.style.SUCCESS("Routage vers les réplicas conforme."))
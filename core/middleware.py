@@ -0,0 +1,116 @@
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.urls import reverse
+from django.utils.cache import patch_vary_headers
+
+from . import profiling
+from .compression import get_encoder, is_compressible, negotiate
+
+
+class CompressionMiddleware:
+    """
+    Compression négociée (Accept-Encoding) des réponses JSON et texte,
+    complètes ou en flux (StreamingHttpResponse).
+
+    Les corps plus petits que COMPRESSION_MIN_SIZE et les types hors
+    COMPRESSION_CONTENT_TYPES (PDF, images, ZIP) sont renvoyés tels quels.
+    """
+
+    def __init__(self, get_response):
+        if not settings.COMPRESSION_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        return self.process_response(request, response)
+
+    def process_response(self, request, response):
+        if (response.has_header('Content-Encoding') or request.method == 'HEAD'
+                or response.status_code < 200 or response.status_code in (204, 304)
+                or not is_compressible(response.get('Content-Type', ''))):
+            return response
+        if not response.streaming and len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING'))
+        if encoding is None:
+            return response
+        encoder = get_encoder(encoding)
+
+        if response.streaming:
+            if response.is_async:
+                # Pas de compression bloquante dans la boucle d'événements
+                return response
+            response.streaming_content = encoder.stream(response.streaming_content)
+            del response['Content-Length']
+        else:
+            compressed = encoder.compress(response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        # Le corps diffère de la représentation d'origine (comme GZipMiddleware)
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Profilage d'une requête sur présentation d'un jeton signé (core.profiling).
+
+    Sans jeton, seule la recherche de l'en-tête X-Profile est faite ;
+    désactivé (PROFILING_ENABLED), le middleware est retiré de la chaîne.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = request.META.get(profiling.HEADER)
+        if not token:
+            return self.get_response(request)
+
+        profile, status = self._start(request, token)
+        if profile is None:
+            response = self.get_response(request)
+            response['X-Profile-Status'] = status
+            return response
+
+        profile.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profile.disable()
+        if response.streaming and not response.is_async:
+            # Le corps est produit pendant la lecture du flux : artefact écrit à sa fermeture
+            response.streaming_content = profile.wrap_stream(response.streaming_content, response.status_code)
+        else:
+            profile.finish(response.status_code)
+        response['X-Profile-Status'] = 'recorded'
+        response['X-Profile-Id'] = profile.artifact_id
+        response['X-Profile-Artifact'] = reverse('ops-profile-artifact', args=[profile.artifact_id])
+        return response
+
+    @staticmethod
+    def _start(request, token):
+        from .models import User
+
+        claims = profiling.read_token(token)
+        if claims is None:
+            return None, 'invalid'
+        user_id, mode = claims
+        # Droit revérifié à chaque usage : un jeton ne survit pas à la perte du rôle
+        if not User.objects.filter(pk=user_id, is_active=True, user_type='admin').exists():
+            return None, 'forbidden'
+        profile = profiling.RequestProfile(request, user_id, mode)
+        if not profile.start():
+            return None, 'busy'
+        return profile, 'recorded'
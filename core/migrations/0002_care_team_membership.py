@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-19 18:46
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CareTeamMembership',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='care_team_memberships', to='core.doctor')),
+                ('granted_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='care_team_memberships', to='core.patient')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['patient', 'doctor'], name='care_team_patient_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='careteammembership',
+            constraint=models.UniqueConstraint(fields=('doctor', 'patient'), name='care_team_doctor_patient_uniq'),
+        ),
+    ]
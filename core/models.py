@@ -57,6 +57,12 @@ class User(AbstractUser):
 
     objects = UserManager()
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Dernière modification d'un compte : version des recherches partagées (single-flight)
+            models.Index(fields=['updated_at'], name='user_updated_idx'),
+        ]
+
     def __str__(self):
         return f"{self.get_full_name()} ({self.get_user_type_display()})"
 
@@ -89,4 +95,27 @@ class Patient(models.Model):
         return None
     
     def __str__(self):
-        return f"Patient: {self.user.get_full_name()}"
\ No newline at end of file
+        return f"Patient: {self.user.get_full_name()}"
+
+class CareTeamMembership(models.Model):
+    """
+    Accès d'un docteur aux dossiers d'un patient (équipe de soins).
+
+    Appliqué dans les requêtes par core.care_team quand CARE_TEAM_ENFORCEMENT
+    est actif ; l'index unique (doctor, patient) sert la sous-requête d'accès.
+    """
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='care_team_memberships')
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='care_team_memberships')
+    granted_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['doctor', 'patient'], name='care_team_doctor_patient_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['patient', 'doctor'], name='care_team_patient_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.doctor} -> {self.patient}"
@@ -0,0 +1,45 @@
+"""
+Pagination de l'admin sur les grandes tables : nombre de lignes estimé.
+
+Sous PostgreSQL, le COUNT(*) d'une liste de plusieurs millions de lignes
+parcourt toute la table. Le paginateur demande d'abord au planificateur son
+estimation (EXPLAIN, statistiques de ANALYZE) : au-delà de
+ADMIN_ESTIMATED_COUNT_THRESHOLD lignes, l'estimation est utilisée telle
+quelle ; en dessous, le COUNT(*) exact reste rapide et est exécuté.
+"""
+import json
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+def estimated_count(queryset):
+    """Lignes estimées par le planificateur PostgreSQL, None si indisponible"""
+    if connections[queryset.db].vendor != 'postgresql':
+        return None
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator dont count bascule sur l'estimation du planificateur pour les grandes tables"""
+
+    @cached_property
+    def count(self):
+        threshold = settings.ADMIN_ESTIMATED_COUNT_THRESHOLD
+        if threshold and hasattr(self.object_list, 'explain'):
+            estimate = estimated_count(self.object_list)
+            if estimate is not None and estimate >= threshold:
+                return estimate
+        return super().count
+
+
+class LargeTableAdminMixin:
+    """
+    ModelAdmin pour les tables volumineuses : nombre estimé, pas de second
+    COUNT(*) de la table entière quand un filtre est actif.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
@@ -0,0 +1,252 @@
+"""
+Partitionnement par plage de dates des tables PostgreSQL (RANGE sur une colonne horodatée).
+
+Django ne gère pas les tables partitionnées : les migrations créent la table
+normalement, puis convert_to_partitioned() la recrée en table partitionnée.
+Sur les autres bases (SQLite en développement), ces fonctions ne font rien.
+"""
+from datetime import datetime, timezone as dt_timezone
+
+
+def supports_partitioning(connection):
+    return connection.vendor == 'postgresql'
+
+
+def period_start(moment, interval):
+    """Début (UTC) du mois ou de l'année contenant moment (datetime ou date)"""
+    if not isinstance(moment, datetime):
+        moment = datetime(moment.year, moment.month, moment.day)
+    moment = moment.astimezone(dt_timezone.utc) if moment.tzinfo else moment.replace(tzinfo=dt_timezone.utc)
+    if interval == 'year':
+        return datetime(moment.year, 1, 1, tzinfo=dt_timezone.utc)
+    return datetime(moment.year, moment.month, 1, tzinfo=dt_timezone.utc)
+
+
+def next_period(start, interval):
+    if interval == 'year':
+        return start.replace(year=start.year + 1)
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+
+def partition_name(table, start, interval):
+    if interval == 'year':
+        return f'{table}_p{start.year}'
+    return f'{table}_p{start.year}_{start.month:02d}'
+
+
+def convert_to_partitioned(schema_editor, table, column, primary_key='id'):
+    """
+    Recréer une table vide en table partitionnée par plage sur column.
+
+    La clé primaire devient (primary_key, column), comme l'impose PostgreSQL ;
+    une partition par défaut reçoit les lignes hors des partitions créées.
+    """
+    if not supports_partitioning(schema_editor.connection):
+        return
+    quote = schema_editor.quote_name
+    old = f'{table}_unpartitioned'
+    schema_editor.execute(f'ALTER TABLE {quote(table)} RENAME TO {quote(old)}')
+    schema_editor.execute(
+        f'CREATE TABLE {quote(table)} (LIKE {quote(old)} INCLUDING DEFAULTS INCLUDING IDENTITY) '
+        f'PARTITION BY RANGE ({quote(column)})'
+    )
+    # La contrainte de l'ancienne table garde le nom <table>_pkey : la supprimer d'abord
+    schema_editor.execute(f'DROP TABLE {quote(old)}')
+    schema_editor.execute(f'ALTER TABLE {quote(table)} ADD PRIMARY KEY ({quote(primary_key)}, {quote(column)})')
+    schema_editor.execute(f'CREATE TABLE {quote(table + "_default")} PARTITION OF {quote(table)} DEFAULT')
+
+
+def _column_type(connection, table, column):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT format_type(atttypid, atttypmod) FROM pg_attribute "
+            "WHERE attrelid = %s::regclass AND attname = %s",
+            [table, column],
+        )
+        return cursor.fetchone()[0]
+
+
+def _partition_column(connection, table):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT a.attname FROM pg_partitioned_table p "
+            "JOIN pg_attribute a ON a.attrelid = p.partrelid AND a.attnum = p.partattrs[0] "
+            "WHERE p.partrelid = %s::regclass",
+            [table],
+        )
+        return cursor.fetchone()[0]
+
+
+def _bound(moment, column_type):
+    """Borne de partition au type de la colonne (date ou horodatage)"""
+    return moment.date() if column_type == 'date' else moment
+
+
+def list_partitions(connection, table):
+    """Noms des partitions existantes d'une table"""
+    if not supports_partitioning(connection):
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = %s ORDER BY child.relname",
+            [table],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def ensure_partitions(connection, table, start, end, interval='month'):
+    """
+    Créer les partitions manquantes couvrant [start, end[ ; renvoie les noms créés.
+
+    Les partitions doivent être créées à l'avance : PostgreSQL refuse d'en
+    ajouter une si la partition par défaut contient déjà des lignes de la plage.
+    """
+    if not supports_partitioning(connection):
+        return []
+    existing = set(list_partitions(connection, table))
+    column_type = _column_type(connection, table, _partition_column(connection, table))
+    quote = connection.ops.quote_name
+    created = []
+    current = period_start(start, interval)
+    with connection.cursor() as cursor:
+        while current < end:
+            following = next_period(current, interval)
+            name = partition_name(table, current, interval)
+            if name not in existing:
+                cursor.execute(
+                    f'CREATE TABLE IF NOT EXISTS {quote(name)} PARTITION OF {quote(table)} '
+                    f'FOR VALUES FROM (%s) TO (%s)',
+                    [_bound(current, column_type), _bound(following, column_type)],
+                )
+                created.append(name)
+            current = following
+    return created
+
+
+def is_partitioned(connection, table):
+    if not supports_partitioning(connection):
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table JOIN pg_class ON pg_class.oid = partrelid WHERE relname = %s",
+            [table],
+        )
+        return cursor.fetchone() is not None
+
+
+def incoming_foreign_keys(connection, table):
+    """Contraintes de clé étrangère d'autres tables pointant vers table"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT conname, conrelid::regclass::text FROM pg_constraint "
+            "WHERE contype = 'f' AND confrelid = %s::regclass",
+            [table],
+        )
+        return cursor.fetchall()
+
+
+def partition_existing_table(connection, table, column, interval='year', periods_ahead=1,
+                             primary_key='id', drop_incoming=False, dry_run=False):
+    """
+    Convertir une table existante (avec ses données) en table partitionnée.
+
+    Recopie les lignes dans une nouvelle table partitionnée sur column, crée les
+    partitions couvrant les données et periods_ahead périodes à venir, puis
+    recrée index non uniques, déclencheurs et clés étrangères sortantes. La clé
+    primaire devient (primary_key, column) : aucune clé étrangère ne peut plus
+    pointer vers la table. Celles qui existent sont supprimées dans la même
+    transaction si drop_incoming, sinon ValueError. Renvoie les instructions
+    SQL, exécutées dans une transaction sauf si dry_run.
+    """
+    from django.db import transaction
+    from django.utils import timezone
+
+    quote = connection.ops.quote_name
+    old = f'{table}_unpartitioned'
+
+    incoming = incoming_foreign_keys(connection, table)
+    if incoming and not drop_incoming:
+        names = ', '.join(f'{name} ({source})' for name, source in incoming)
+        raise ValueError(f"Clés étrangères vers {table} à supprimer d'abord : {names}")
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT MIN({quote(column)}) FROM {quote(table)}')
+        oldest = cursor.fetchone()[0]
+        cursor.execute("SELECT pg_get_serial_sequence(%s, %s)", [table, primary_key])
+        sequence = cursor.fetchone()[0]
+        cursor.execute(
+            "SELECT attidentity <> '' FROM pg_attribute WHERE attrelid = %s::regclass AND attname = %s",
+            [table, primary_key],
+        )
+        identity = cursor.fetchone()[0]
+        cursor.execute(
+            "SELECT pg_get_indexdef(indexrelid) FROM pg_index "
+            "WHERE indrelid = %s::regclass AND NOT indisunique AND NOT indisprimary",
+            [table],
+        )
+        indexes = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT pg_get_triggerdef(oid) FROM pg_trigger WHERE tgrelid = %s::regclass AND NOT tgisinternal",
+            [table],
+        )
+        triggers = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype = 'f'",
+            [table],
+        )
+        foreign_keys = cursor.fetchall()
+
+    column_type = _column_type(connection, table, column)
+    now = timezone.now()
+    start = period_start(oldest if oldest is not None else now, interval)
+    end = period_start(now, interval)
+    for _ in range(periods_ahead + 1):
+        end = next_period(end, interval)
+
+    statements = [f'LOCK TABLE {quote(table)} IN ACCESS EXCLUSIVE MODE']
+    # regclass::text : nom de la table source déjà qualifié et cité si besoin
+    statements.extend(f'ALTER TABLE {source} DROP CONSTRAINT {quote(name)}' for name, source in incoming)
+    statements += [
+        f'ALTER TABLE {quote(table)} RENAME TO {quote(old)}',
+        f'CREATE TABLE {quote(table)} (LIKE {quote(old)} INCLUDING DEFAULTS INCLUDING IDENTITY) '
+        f'PARTITION BY RANGE ({quote(column)})',
+        f'CREATE TABLE {quote(table + "_default")} PARTITION OF {quote(table)} DEFAULT',
+    ]
+    current = start
+    while current < end:
+        following = next_period(current, interval)
+        statements.append(
+            f'CREATE TABLE {quote(partition_name(table, current, interval))} PARTITION OF {quote(table)} '
+            f"FOR VALUES FROM ('{_bound(current, column_type).isoformat()}') "
+            f"TO ('{_bound(following, column_type).isoformat()}')"
+        )
+        current = following
+    overriding = ' OVERRIDING SYSTEM VALUE' if identity else ''
+    statements.append(f'INSERT INTO {quote(table)}{overriding} SELECT * FROM {quote(old)}')
+    if sequence and not identity:
+        # Colonne serial : la séquence existante suit la nouvelle table
+        statements.append(f'ALTER SEQUENCE {sequence} OWNED BY {quote(table)}.{quote(primary_key)}')
+    statements.append(f'DROP TABLE {quote(old)}')
+    statements.append(f'ALTER TABLE {quote(table)} ADD PRIMARY KEY ({quote(primary_key)}, {quote(column)})')
+    if identity:
+        statements.append(
+            f"SELECT setval(pg_get_serial_sequence('{table}', '{primary_key}'), "
+            f"COALESCE((SELECT MAX({quote(primary_key)}) FROM {quote(table)}), 0) + 1, false)"
+        )
+    # Définitions lues avant le renommage : elles visent déjà la nouvelle table
+    statements.extend(indexes)
+    statements.extend(triggers)
+    for name, definition in foreign_keys:
+        statements.append(f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} {definition}')
+
+    if not dry_run:
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+    return statements
@@ -1,5 +1,8 @@
 from rest_framework import permissions
 
+from .care_team import can_access_patient
+from .models import Patient
+
 class IsDoctor(permissions.BasePermission):
     def has_permission(self, request, view):
         return request.user.is_authenticated and request.user.user_type == 'doctor'
@@ -14,9 +17,10 @@ class IsAdmin(permissions.BasePermission):
 
 class IsOwnerOrDoctor(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        # Les docteurs peuvent voir les dossiers de leurs patients
+        # Les docteurs peuvent voir les dossiers de leurs patients (équipe de soins si appliquée)
         if request.user.user_type == 'doctor':
-            return True
+            patient_id = obj.pk if isinstance(obj, Patient) else getattr(obj, 'patient_id', None)
+            return can_access_patient(request.user, patient_id)
         # Les patients ne peuvent voir que leurs propres dossiers
         if hasattr(obj, 'patient'):
             return obj.patient.user == request.user
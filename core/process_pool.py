@@ -0,0 +1,71 @@
+"""
+Pool de processus pour les traitements lourds en CPU (rendu PDF, hachage...)
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _init_worker(memory_limit_mb):
+    """Préparer Django et plafonner la mémoire du processus de travail"""
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+    if memory_limit_mb and resource is not None:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def get_max_workers(max_workers=None):
+    return max_workers or settings.PROCESS_POOL_MAX_WORKERS or multiprocessing.cpu_count()
+
+
+def process_pool(max_workers=None, memory_limit_mb=None):
+    """
+    Créer un ProcessPoolExecutor prêt à exécuter du code Django.
+
+    Chaque processus exécute une tâche à la fois : memory_limit_mb plafonne
+    donc la mémoire d'une tâche (MemoryError au-delà).
+    """
+    start_method = settings.PROCESS_POOL_START_METHOD
+    if start_method not in multiprocessing.get_all_start_methods():
+        start_method = 'spawn'
+
+    return ProcessPoolExecutor(
+        max_workers=get_max_workers(max_workers),
+        mp_context=multiprocessing.get_context(start_method),
+        initializer=_init_worker,
+        initargs=(memory_limit_mb,),
+    )
+
+
+_shared_pools = {}
+_shared_pools_lock = threading.Lock()
+
+
+def shared_process_pool(name, max_workers=None, memory_limit_mb=None):
+    """
+    Pool de processus du worker, commun à toutes ses requêtes (un par nom).
+
+    Les rendus de requêtes simultanées attendent une place dans ce pool au lieu
+    d'en créer chacune un : le nombre de processus reste borné. Les paramètres
+    du premier appel s'appliquent. Le pool est recréé après un fork ou si un
+    processus de travail est mort (pool cassé).
+    """
+    with _shared_pools_lock:
+        pid, pool = _shared_pools.get(name, (None, None))
+        if pool is None or pid != os.getpid() or getattr(pool, '_broken', False):
+            pool = process_pool(max_workers=max_workers, memory_limit_mb=memory_limit_mb)
+            _shared_pools[name] = (os.getpid(), pool)
+        return pool
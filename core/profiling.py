@@ -0,0 +1,294 @@
+"""
+Profilage à la demande d'une requête, déclenché par un administrateur.
+
+Un jeton signé (ProfilingTokenView) porte l'identifiant de l'administrateur et
+le mode ; il est envoyé dans l'en-tête X-Profile, jamais dans l'URL (les
+journaux d'accès le conserveraient). L'authentification JWT n'a lieu que dans
+les vues DRF : c'est la signature du jeton, et non request.user, qui prouve le
+droit de profiler.
+
+Modes :
+- 'cprofile' : profil déterministe, artefact profile.pstats (pstats, snakeviz) ;
+- 'sampling' : échantillonnage de la pile du thread de la requête toutes les
+  PROFILING_SAMPLE_INTERVAL_MS, artefact profile.speedscope.json ;
+- 'memory'   : tracemalloc, allocations restantes en fin de requête et pic,
+  artefact memory.json (une seule requête à la fois).
+
+L'artefact est une archive ZIP gardée en cache PROFILING_ARTIFACT_SECONDS, avec
+queries.json (SQL sans les paramètres, qui peuvent contenir des données de
+santé) et request.json. Pour les réponses en flux, la mesure couvre aussi la
+production du corps et l'artefact n'est disponible qu'une fois le flux terminé.
+"""
+import cProfile
+import io
+import json
+import marshal
+import secrets
+import sys
+import threading
+import time
+import tracemalloc
+import zipfile
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db import connections
+
+MODES = ('cprofile', 'sampling', 'memory')
+HEADER = 'HTTP_X_PROFILE'
+TOKEN_SALT = 'core.profiling'
+
+# tracemalloc est global au processus
+_memory_lock = threading.Lock()
+
+
+def make_token(user, mode):
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(f'{user.pk}:{mode}')
+
+
+def read_token(token):
+    """(identifiant de l'utilisateur, mode) portés par un jeton valide, sinon None"""
+    try:
+        value = signing.TimestampSigner(salt=TOKEN_SALT).unsign(token, max_age=settings.PROFILING_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    user_id, _, mode = value.partition(':')
+    if mode not in MODES:
+        return None
+    return int(user_id), mode
+
+
+def artifact_cache_key(artifact_id):
+    return f'profile-artifact:{artifact_id}'
+
+
+def get_artifact(artifact_id):
+    return cache.get(artifact_cache_key(artifact_id))
+
+
+class QueryRecorder:
+    """Requêtes SQL de toutes les connexions (execute_wrapper), sans leurs paramètres"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': context['connection'].alias,
+                'sql': sql,
+                'many': many,
+                'duration_ms': round((time.perf_counter() - start) * 1000, 3),
+            })
+
+    def install(self, stack):
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self))
+
+
+class Sampler:
+    """Pile du thread de la requête relevée à intervalle fixe par un thread d'arrière-plan"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.samples = []
+        self.active = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiling-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if not self.active:
+                continue
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            stack.reverse()
+            self.samples.append(tuple(stack))
+
+    def enable(self):
+        if not self._thread.is_alive() and not self._stop.is_set():
+            self._thread.start()
+        self.active = True
+
+    def disable(self):
+        self.active = False
+
+    def close(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def speedscope(self, name):
+        """Profil échantillonné au format speedscope (https://www.speedscope.app/file-format-schema.json)"""
+        frames, index = [], {}
+        samples = []
+        for stack in self.samples:
+            sample = []
+            for frame in stack:
+                if frame not in index:
+                    index[frame] = len(frames)
+                    frames.append({'name': frame[0], 'file': frame[1], 'line': frame[2]})
+                sample.append(index[frame])
+            samples.append(sample)
+        interval_ms = self.interval * 1000
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': name,
+            'exporter': 'tohpitoh',
+            'shared': {'frames': frames},
+            'profiles': [{
+                'type': 'sampled',
+                'name': name,
+                'unit': 'milliseconds',
+                'startValue': 0,
+                'endValue': len(samples) * interval_ms,
+                'samples': samples,
+                'weights': [interval_ms] * len(samples),
+            }],
+        }
+
+
+class RequestProfile:
+    """Mesure d'une requête ; enable()/disable() encadrent chaque portion de travail (vue, morceaux de flux)"""
+
+    def __init__(self, request, user_id, mode):
+        self.artifact_id = secrets.token_urlsafe(16)
+        self.mode = mode
+        self.user_id = user_id
+        self.request_info = {'method': request.method, 'path': request.path, 'mode': mode, 'user_id': user_id}
+        self.elapsed = 0.0
+        self.recorder = QueryRecorder()
+        self._stack = ExitStack()
+        self._started = None
+        self._profiler = None
+        self._sampler = None
+        self._memory_peak = 0
+
+    def start(self):
+        """False si le mode n'est pas disponible (profil mémoire déjà en cours)"""
+        if self.mode == 'memory':
+            if not _memory_lock.acquire(blocking=False):
+                return False
+            tracemalloc.start(settings.PROFILING_MEMORY_FRAMES)
+        elif self.mode == 'cprofile':
+            self._profiler = cProfile.Profile()
+        else:
+            self._sampler = Sampler(settings.PROFILING_SAMPLE_INTERVAL_MS / 1000)
+        self.recorder.install(self._stack)
+        return True
+
+    def enable(self):
+        self._started = time.perf_counter()
+        if self._profiler is not None:
+            self._profiler.enable()
+        elif self._sampler is not None:
+            self._sampler.enable()
+
+    def disable(self):
+        if self._profiler is not None:
+            self._profiler.disable()
+        elif self._sampler is not None:
+            self._sampler.disable()
+        self.elapsed += time.perf_counter() - self._started
+
+    def finish(self, status_code):
+        """Arrêter la mesure et mettre l'artefact en cache"""
+        self._stack.close()
+        files = {}
+        if self.mode == 'memory':
+            snapshot = tracemalloc.take_snapshot()
+            _, self._memory_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            _memory_lock.release()
+            files['memory.json'] = json.dumps(self._memory_report(snapshot), indent=1)
+        elif self.mode == 'cprofile':
+            self._profiler.create_stats()
+            # Format de Profile.dump_stats(), lisible par pstats.Stats
+            files['profile.pstats'] = marshal.dumps(self._profiler.stats)
+        else:
+            self._sampler.close()
+            name = f"{self.request_info['method']} {self.request_info['path']}"
+            files['profile.speedscope.json'] = json.dumps(self._sampler.speedscope(name))
+
+        queries = self.recorder.queries
+        files['queries.json'] = json.dumps(queries, indent=1)
+        files['request.json'] = json.dumps({
+            **self.request_info,
+            'status': status_code,
+            'duration_ms': round(self.elapsed * 1000, 3),
+            'queries': len(queries),
+            'queries_ms': round(sum(query['duration_ms'] for query in queries), 3),
+        }, indent=1)
+
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for name, content in files.items():
+                archive.writestr(name, content)
+        cache.set(artifact_cache_key(self.artifact_id), {'user_id': self.user_id, 'content': buffer.getvalue()},
+                  settings.PROFILING_ARTIFACT_SECONDS)
+
+    def _memory_report(self, snapshot):
+        snapshot = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ))
+        statistics = snapshot.statistics('traceback')
+        return {
+            'peak_bytes': self._memory_peak,
+            'retained_bytes': sum(stat.size for stat in statistics),
+            'top': [
+                {
+                    'size_bytes': stat.size,
+                    'count': stat.count,
+                    'traceback': [f'{frame.filename}:{frame.lineno}' for frame in stat.traceback],
+                }
+                for stat in statistics[:settings.PROFILING_MEMORY_TOP]
+            ],
+        }
+
+    def wrap_stream(self, content, status_code):
+        return ProfiledStream(self, content, status_code)
+
+
+class ProfiledStream:
+    """
+    Corps en flux dont la production de chaque morceau est mesurée. Le profil
+    est terminé par close(), appelé par le serveur même si le flux n'a pas été lu.
+    """
+
+    def __init__(self, profile, content, status_code):
+        self.profile = profile
+        self.status_code = status_code
+        self._iterator = iter(content)
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        self.profile.enable()
+        try:
+            return next(self._iterator)
+        finally:
+            self.profile.disable()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            close = getattr(self._iterator, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            self.profile.finish(self.status_code)
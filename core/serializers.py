@@ -1,6 +1,11 @@
 from rest_framework import serializers
 from django.contrib.auth import authenticate
+from django.contrib.auth.tokens import default_token_generator
+from django.db import transaction
+from django.utils.encoding import force_str
+from django.utils.http import urlsafe_base64_decode
 from .models import User, Doctor, Patient
+from .profiling import MODES
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -24,6 +29,7 @@ class RegisterSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError({"password": "Les mots de passe ne correspondent pas."})
         return data
 
+    @transaction.atomic
     def create(self, validated_data):
         validated_data.pop('password_confirm')
         user = User.objects.create_user(
@@ -70,4 +76,87 @@ class PatientProfileSerializer(serializers.ModelSerializer):
         fields = '__all__'
     
     def get_bmi(self, obj):
-        return obj.calculate_bmi()
\ No newline at end of file
+        return obj.calculate_bmi()
+
+class OnboardingRowSerializer(serializers.Serializer):
+    """Une ligne d'import en masse : utilisateur et profil patient ou docteur"""
+    PATIENT_FIELDS = ('blood_type', 'height', 'weight', 'allergies', 'chronic_diseases',
+                      'emergency_contact', 'emergency_phone', 'insurance_number')
+    DOCTOR_FIELDS = ('medical_license', 'specialization', 'hospital', 'years_of_experience')
+    USER_FIELDS = ('email', 'first_name', 'last_name', 'user_type', 'phone_number', 'date_of_birth')
+
+    email = serializers.EmailField()
+    first_name = serializers.CharField(required=False, allow_blank=True, max_length=150)
+    last_name = serializers.CharField(required=False, allow_blank=True, max_length=150)
+    user_type = serializers.ChoiceField(choices=('patient', 'doctor'), default='patient')
+    phone_number = serializers.CharField(required=False, allow_blank=True, max_length=15)
+    date_of_birth = serializers.DateField(required=False, allow_null=True)
+    password = serializers.CharField(required=False, min_length=6, write_only=True)
+
+    blood_type = serializers.CharField(required=False, allow_blank=True, max_length=5)
+    height = serializers.FloatField(required=False, allow_null=True)
+    weight = serializers.FloatField(required=False, allow_null=True)
+    allergies = serializers.CharField(required=False, allow_blank=True)
+    chronic_diseases = serializers.CharField(required=False, allow_blank=True)
+    emergency_contact = serializers.CharField(required=False, allow_blank=True, max_length=100)
+    emergency_phone = serializers.CharField(required=False, allow_blank=True, max_length=15)
+    insurance_number = serializers.CharField(required=False, allow_blank=True, max_length=50)
+
+    medical_license = serializers.CharField(required=False, max_length=50)
+    specialization = serializers.CharField(required=False, max_length=100)
+    hospital = serializers.CharField(required=False, allow_blank=True, max_length=200)
+    years_of_experience = serializers.IntegerField(required=False, min_value=0)
+
+    def validate_email(self, value):
+        return User.objects.normalize_email(value)
+
+    def validate(self, data):
+        if data['user_type'] == 'doctor':
+            missing = {name: "Ce champ est requis pour un docteur." for name in ('medical_license', 'specialization')
+                       if not data.get(name)}
+            if missing:
+                raise serializers.ValidationError(missing)
+        if self.context.get('password_mode') == 'hash' and not data.get('password'):
+            raise serializers.ValidationError({"password": "Ce champ est requis en mode hash."})
+        return data
+
+class AccountActivationSerializer(serializers.Serializer):
+    """Choix du mot de passe d'un compte importé, à partir du lien d'activation"""
+    uid = serializers.CharField()
+    token = serializers.CharField()
+    password = serializers.CharField(write_only=True, min_length=6)
+    password_confirm = serializers.CharField(write_only=True, min_length=6)
+
+    def validate(self, data):
+        if data['password'] != data['password_confirm']:
+            raise serializers.ValidationError({"password": "Les mots de passe ne correspondent pas."})
+        try:
+            user = User.objects.get(pk=force_str(urlsafe_base64_decode(data['uid'])))
+        except (TypeError, ValueError, OverflowError, User.DoesNotExist):
+            user = None
+        if user is None or not default_token_generator.check_token(user, data['token']):
+            raise serializers.ValidationError("Lien d'activation invalide ou expiré.")
+        data['user'] = user
+        return data
+
+    def save(self):
+        user = self.validated_data['user']
+        user.set_password(self.validated_data['password'])
+        user.save(update_fields=['password'])
+        return user
+
+class CohortStatsParamsSerializer(serializers.Serializer):
+    """Filtres optionnels de la cohorte analysée"""
+    blood_type = serializers.CharField(required=False, max_length=5)
+    min_age = serializers.IntegerField(required=False, min_value=0, max_value=150)
+    max_age = serializers.IntegerField(required=False, min_value=0, max_value=150)
+    chronic_disease = serializers.CharField(required=False, max_length=100)
+
+    def validate(self, data):
+        if data.get('min_age') is not None and data.get('max_age') is not None and data['min_age'] > data['max_age']:
+            raise serializers.ValidationError({"min_age": "min_age doit être inférieur ou égal à max_age."})
+        return data
+
+class ProfilingTokenSerializer(serializers.Serializer):
+    """Mode du profil déclenché par le jeton"""
+    mode = serializers.ChoiceField(choices=MODES, default='cprofile')
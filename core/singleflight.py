@@ -0,0 +1,142 @@
+"""
+Regroupement des requêtes identiques simultanées (single-flight).
+
+Un double appui sur « télécharger » ou plusieurs écrans ouvrant le même carnet
+lancent le même calcul en parallèle. coalesce() ne l'exécute qu'une fois :
+
+- dans le processus, les threads qui demandent une clé déjà en cours attendent
+  le premier (meneur) et reçoivent son résultat ou son exception ;
+- entre workers, le meneur prend un verrou dans le cache par défaut (Redis en
+  production) et y publie le résultat SINGLEFLIGHT_RESULT_SECONDS ; les autres
+  workers interrogent le cache en attendant.
+
+La clé (request_key) réunit l'endpoint, la portée de l'utilisateur, les
+paramètres et une version des données : une écriture change la clé au lieu
+d'invalider quoi que ce soit. L'autorisation est vérifiée avant coalesce().
+
+Une attente plus longue que SINGLEFLIGHT_WAIT_SECONDS, ou un meneur disparu
+sans publier, fait calculer le demandeur lui-même plutôt qu'échouer. Une
+exception du meneur est transmise aux demandeurs en attente, mais n'est gardée
+que SINGLEFLIGHT_ERROR_SECONDS pour ne pas être servie aux requêtes suivantes.
+"""
+import hashlib
+import json
+import pickle
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+class _Flight:
+    """Calcul en cours dans le processus"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+def request_key(endpoint, scope, params, version):
+    """Clé d'une requête : endpoint, portée (utilisateur, patient...), paramètres et version des données"""
+    if hasattr(params, 'lists'):
+        params = {name: sorted(values) for name, values in params.lists()}
+    digest = hashlib.sha1(json.dumps([scope, params, version], sort_keys=True, default=str).encode()).hexdigest()
+    return f'{endpoint}:{digest}'
+
+
+def _result_key(key):
+    return f'singleflight:result:{key}'
+
+
+def _lock_key(key):
+    return f'singleflight:lock:{key}'
+
+
+def _unwrap(outcome):
+    status, payload = outcome
+    if status == 'error':
+        raise payload
+    return payload
+
+
+def _publish(key, outcome, timeout):
+    try:
+        cache.set(_result_key(key), outcome, timeout)
+    except (pickle.PicklingError, TypeError, AttributeError):
+        if outcome[0] == 'error':
+            # Exception non sérialisable : transmise sous une forme générique
+            cache.set(_result_key(key), ('error', RuntimeError(str(outcome[1]))), timeout)
+
+
+def _shared(key, compute):
+    """Calcul partagé entre workers ; renvoie (valeur, partagée)"""
+    outcome = cache.get(_result_key(key))
+    if outcome is not None:
+        return _unwrap(outcome), True
+
+    owner = uuid.uuid4().hex
+    if cache.add(_lock_key(key), owner, settings.SINGLEFLIGHT_LOCK_SECONDS):
+        try:
+            value = compute()
+        except Exception as exc:
+            _publish(key, ('error', exc), settings.SINGLEFLIGHT_ERROR_SECONDS)
+            raise
+        else:
+            _publish(key, ('ok', value), settings.SINGLEFLIGHT_RESULT_SECONDS)
+            return value, False
+        finally:
+            if cache.get(_lock_key(key)) == owner:
+                cache.delete(_lock_key(key))
+
+    deadline = time.monotonic() + settings.SINGLEFLIGHT_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(settings.SINGLEFLIGHT_POLL_INTERVAL)
+        outcome = cache.get(_result_key(key))
+        if outcome is not None:
+            return _unwrap(outcome), True
+        if cache.get(_lock_key(key)) is None:
+            # Meneur terminé sans publier (résultat trop gros, worker arrêté)
+            break
+    return compute(), False
+
+
+def coalesce(key, compute):
+    """
+    Exécuter compute() une seule fois pour des appels simultanés de même clé.
+
+    Renvoie (valeur, partagée) ; partagée vaut True si la valeur vient du
+    calcul d'une autre requête. Les exceptions du calcul sont propagées.
+    """
+    if not settings.SINGLEFLIGHT_ENABLED:
+        return compute(), False
+
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+
+    if not leader:
+        if not flight.done.wait(settings.SINGLEFLIGHT_WAIT_SECONDS):
+            return compute(), False
+        if flight.error is not None:
+            raise flight.error
+        return flight.value, True
+
+    try:
+        value, shared = _shared(key, compute)
+        flight.value = value
+        return value, shared
+    except Exception as exc:
+        flight.error = exc
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
@@ -1,3 +1,596 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import zipfile
+import zlib
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from medical_records.models import MedicalRecord, MedicalTest
+from .analytics import cohort_stats, compute_cohort_stats
+from .compression import brotli, negotiate
+from .db_router import _pin_key
+from .management.commands.bench_cohort_stats import python_stats
+from .management.commands.profile_startup import loaded_lazy_modules, measure_startup
+from .middleware import CompressionMiddleware
+from .models import Doctor, Patient, User
+from .paginators import EstimatedCountPaginator
+from .partitioning import ensure_partitions, next_period, partition_name, period_start, supports_partitioning
+from .process_pool import shared_process_pool
+from .profiling import make_token
+from .singleflight import _lock_key, coalesce
+from .throttling import ConcurrencySlots
+
+# Réplica en retard : seconde base SQLite en mémoire, sans TEST['MIRROR'], dont le contenu
+# n'avance que par replicate(). Déclarée à l'import pour que le lanceur de tests crée sa base.
+LAGGING_REPLICA = 'lagging_replica'
+if LAGGING_REPLICA not in connections.settings:
+    # connections.settings est settings.DATABASES, complété des valeurs par défaut
+    connections.settings[LAGGING_REPLICA] = connections.configure_settings({
+        DEFAULT_DB_ALIAS: connections.settings[DEFAULT_DB_ALIAS],
+        LAGGING_REPLICA: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:', 'TEST': {'MIGRATE': False}},
+    })[LAGGING_REPLICA]
+
+# Tables lues par la liste des dossiers
+REPLICATED_MODELS = (User, Patient, Doctor, MedicalRecord, MedicalTest)
+
+
+class ConcurrencySlotsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.slots = ConcurrencySlots('throttle:test:slots', limit=2)
+
+    def test_limit_enforced(self):
+        self.assertTrue(self.slots.acquire())
+        self.assertTrue(self.slots.acquire())
+        self.assertFalse(self.slots.acquire())
+        self.slots.release()
+        self.assertTrue(self.slots.acquire())
+
+    def test_release_after_expiry_does_not_go_negative(self):
+        self.assertTrue(self.slots.acquire())
+        self.assertTrue(self.slots.acquire())
+        # Expiration du compteur pendant les deux requêtes, puis une nouvelle admission
+        cache.delete(self.slots.key)
+        self.assertTrue(self.slots.acquire())
+        self.slots.release()
+        self.slots.release()
+        self.assertEqual(cache.get(self.slots.key), 0)
+
+        # La limite reste respectée ensuite
+        self.assertTrue(self.slots.acquire())
+        self.assertTrue(self.slots.acquire())
+        self.assertFalse(self.slots.acquire())
+
+
+class SharedProcessPoolTests(SimpleTestCase):
+    def test_one_pool_per_worker_process(self):
+        pool = shared_process_pool('test-partage', max_workers=1)
+        self.addCleanup(pool.shutdown)
+        self.assertIs(shared_process_pool('test-partage', max_workers=4), pool)
+
+        # Après un fork, le pool du parent n'a aucun processus dans l'enfant
+        with mock.patch('core.process_pool.os.getpid', return_value=-1):
+            forked = shared_process_pool('test-partage', max_workers=1)
+        self.addCleanup(forked.shutdown)
+        self.assertIsNot(forked, pool)
+
+
+class PartitioningTests(TestCase):
+    def test_periods(self):
+        moment = datetime(2024, 12, 31, 23, 30, tzinfo=dt_timezone(timedelta(hours=-2)))
+        # Début de période calculé en UTC : 1er janvier 2025 01:30 UTC
+        self.assertEqual(period_start(moment, 'month'), datetime(2025, 1, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(period_start(date(2024, 5, 17), 'year'), datetime(2024, 1, 1, tzinfo=dt_timezone.utc))
+        december = datetime(2024, 12, 1, tzinfo=dt_timezone.utc)
+        self.assertEqual(next_period(december, 'month'), datetime(2025, 1, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(next_period(december, 'year'), datetime(2025, 12, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(partition_name('dossiers', december, 'month'), 'dossiers_p2024_12')
+        self.assertEqual(partition_name('dossiers', december, 'year'), 'dossiers_p2024')
+
+    def test_no_op_without_postgresql(self):
+        connection = connections[DEFAULT_DB_ALIAS]
+        self.assertFalse(supports_partitioning(connection))
+        self.assertEqual(ensure_partitions(connection, 'medical_records_medicalrecord',
+                                           date(2024, 1, 1), datetime(2026, 1, 1, tzinfo=dt_timezone.utc)), [])
+        out = io.StringIO()
+        call_command('partition_medical_records', stdout=out)
+        self.assertIn('rien à faire', out.getvalue())
+
+
+@override_settings(SINGLEFLIGHT_ENABLED=True, SINGLEFLIGHT_WAIT_SECONDS=5, SINGLEFLIGHT_POLL_INTERVAL=0.01)
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.release = threading.Event()
+        self.calls = []
+
+    def compute(self, value='résultat', error=None):
+        self.calls.append(threading.current_thread().name)
+        self.release.wait(5)
+        if error is not None:
+            raise error
+        return value
+
+    def run_callers(self, count, compute):
+        """Un meneur bloqué dans compute puis count - 1 appels simultanés ; [(valeur ou exception, partagée)]"""
+        outcomes = [None] * count
+
+        def call(index):
+            try:
+                outcomes[index] = coalesce('test-cle', compute)
+            except Exception as exc:
+                outcomes[index] = (exc, None)
+
+        threads = [threading.Thread(target=call, args=(index,), name=f'appel-{index}') for index in range(count)]
+        threads[0].start()
+        while not self.calls:
+            time.sleep(0.01)
+        for thread in threads[1:]:
+            thread.start()
+        time.sleep(0.05)
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+        return outcomes
+
+    def test_concurrent_callers_share_one_computation(self):
+        outcomes = self.run_callers(4, self.compute)
+        self.assertEqual(self.calls, ['appel-0'])
+        self.assertEqual(outcomes, [('résultat', False)] + [('résultat', True)] * 3)
+
+    @override_settings(SINGLEFLIGHT_ERROR_SECONDS=0.2)
+    def test_leader_error_reaches_waiters_then_expires(self):
+        error = ValueError('base indisponible')
+        outcomes = self.run_callers(3, lambda: self.compute(error=error))
+        self.assertEqual(len(self.calls), 1)
+        self.assertTrue(all(outcome[0] is error or isinstance(outcome[0], ValueError) for outcome in outcomes))
+
+        # Gardée SINGLEFLIGHT_ERROR_SECONDS seulement : la requête suivante recalcule
+        time.sleep(0.3)
+        self.assertEqual(coalesce('test-cle', lambda: 'réparé'), ('réparé', False))
+
+    @override_settings(SINGLEFLIGHT_WAIT_SECONDS=0.1)
+    def test_waiter_computes_for_itself_after_timeout(self):
+        leader = threading.Thread(target=coalesce, args=('test-cle', self.compute))
+        leader.start()
+        while not self.calls:
+            time.sleep(0.01)
+        try:
+            # Meneur du même processus trop lent
+            self.assertEqual(coalesce('test-cle', lambda: 'seul'), ('seul', False))
+        finally:
+            self.release.set()
+            leader.join(5)
+
+        # Verrou d'un autre worker qui ne publie rien
+        cache.add(_lock_key('autre-cle'), 'autre-worker', 60)
+        started = time.monotonic()
+        self.assertEqual(coalesce('autre-cle', lambda: 'seul'), ('seul', False))
+        self.assertGreaterEqual(time.monotonic() - started, 0.1)
+
+
+@override_settings(COMPRESSION_ENABLED=True, COMPRESSION_ENCODINGS=['zstd', 'br', 'gzip'], COMPRESSION_MIN_SIZE=1024,
+                   COMPRESSION_STREAM_FLUSH_SIZE=4096)
+class CompressionMiddlewareTests(SimpleTestCase):
+    BODY = json.dumps([{'id': index, 'title': 'Consultation de suivi'} for index in range(200)]).encode()
+
+    def process(self, response, accept='gzip', method='get'):
+        request = getattr(RequestFactory(), method)('/api/medical-records/', HTTP_ACCEPT_ENCODING=accept)
+        return CompressionMiddleware(lambda request: response).process_response(request, response)
+
+    def json_response(self, body=BODY, **headers):
+        response = HttpResponse(body, content_type='application/json')
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    def test_negotiation(self):
+        with override_settings(COMPRESSION_ENCODINGS=['gzip']):
+            self.assertEqual(negotiate('gzip, deflate'), 'gzip')
+            self.assertEqual(negotiate('GZIP;q=0.3'), 'gzip')
+            self.assertEqual(negotiate('*'), 'gzip')
+            for header in ('', None, 'identity', 'deflate', 'gzip;q=0', '*;q=0', 'gzip;q=abc'):
+                with self.subTest(header=header):
+                    self.assertIsNone(negotiate(header))
+
+    @skipUnless(brotli, 'brotli non installé')
+    def test_negotiation_prefers_client_quality_then_settings_order(self):
+        with override_settings(COMPRESSION_ENCODINGS=['br', 'gzip']):
+            self.assertEqual(negotiate('gzip, br'), 'br')
+            self.assertEqual(negotiate('gzip;q=1, br;q=0.5'), 'gzip')
+            self.assertEqual(negotiate('br;q=0, *'), 'gzip')
+        with override_settings(COMPRESSION_ENCODINGS=['gzip', 'br']):
+            self.assertEqual(negotiate('gzip, br'), 'gzip')
+
+    def test_body_compressed_with_vary(self):
+        response = self.process(self.json_response(ETag='"v1"', Vary='Cookie'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Cookie, Accept-Encoding')
+        self.assertEqual(response['ETag'], 'W/"v1"')
+        self.assertEqual(int(response['Content-Length']), len(response.content))
+        self.assertEqual(gzip.decompress(response.content), self.BODY)
+
+        # Encodage refusé : corps intact, mais la réponse dépend toujours d'Accept-Encoding
+        response = self.process(self.json_response(), accept='identity')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response.content, self.BODY)
+
+    def test_skipped_responses(self):
+        cases = {
+            'petit corps': (self.json_response(b'{"id": 1}'), 'get'),
+            'déjà encodé': (self.json_response(**{'Content-Encoding': 'br'}), 'get'),
+            'PDF': (HttpResponse(self.BODY, content_type='application/pdf'), 'get'),
+            'HEAD': (self.json_response(), 'head'),
+            # Incompressible : la version gzip serait plus grande
+            'aléatoire': (HttpResponse(os.urandom(4096), content_type='text/plain'), 'get'),
+        }
+        for name, (response, method) in cases.items():
+            with self.subTest(name):
+                content = response.content
+                encoding = response.get('Content-Encoding')
+                response = self.process(response, method=method)
+                self.assertEqual(response.get('Content-Encoding'), encoding)
+                self.assertEqual(response.content, content)
+
+    def test_streaming_response_flushed_as_it_goes(self):
+        lines = [json.dumps({'id': index, 'title': 'Bilan'}).encode() + b'\n' for index in range(1000)]
+        produced = []
+
+        def rows():
+            for line in lines:
+                produced.append(line)
+                yield line
+
+        response = StreamingHttpResponse(rows(), content_type='application/x-ndjson')
+        response['Content-Length'] = '1'
+        response = self.process(response)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertFalse(response.has_header('Content-Length'))
+
+        # Premières données après COMPRESSION_STREAM_FLUSH_SIZE octets, décodables sans la suite
+        chunks = iter(response.streaming_content)
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        first = b''
+        while not first:
+            first = decompressor.decompress(next(chunks))
+        self.assertGreaterEqual(len(first), 4096)
+        self.assertLess(len(produced), len(lines))
+        self.assertEqual(first, b''.join(produced))
+
+        rest = b''.join(decompressor.decompress(chunk) for chunk in chunks) + decompressor.flush()
+        self.assertEqual(first + rest, b''.join(lines))
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_TOKEN_MAX_AGE=900, AUDIT_ENABLED=False, THROTTLE_ENABLED=False)
+class ProfilingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(email='admin@tohpitoh.local', user_type='admin')
+        cls.patient_user = User.objects.create_user(email='patient@tohpitoh.local', user_type='patient')
+        Patient.objects.create(user=cls.patient_user)
+
+    def setUp(self):
+        cache.clear()
+        # Client créé sous override_settings : le middleware de profilage est chargé
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def profiled(self, token, **extra):
+        return self.client.get('/api/medical-records/', HTTP_X_PROFILE=token, **extra)
+
+    def test_artifact_recorded_and_retrievable(self):
+        response = self.client.post('/api/ops/profiles/token/', {'mode': 'cprofile'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('query_parameter', response.json())
+
+        response = self.profiled(response.json()['token'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Profile-Status'], 'recorded')
+        artifact = self.client.get(response['X-Profile-Artifact'])
+        self.assertEqual(artifact.status_code, 200)
+        with zipfile.ZipFile(io.BytesIO(artifact.content)) as archive:
+            self.assertEqual(set(archive.namelist()), {'profile.pstats', 'queries.json', 'request.json'})
+            summary = json.loads(archive.read('request.json'))
+        self.assertEqual((summary['path'], summary['status'], summary['user_id']),
+                         ('/api/medical-records/', 200, self.admin.pk))
+
+        # Réservé à l'administrateur qui l'a déclenché
+        other = User.objects.create_user(email='admin-2@tohpitoh.local', user_type='admin')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(response['X-Profile-Artifact']).status_code, 404)
+
+    def test_token_not_accepted_in_query_string(self):
+        token = make_token(self.admin, 'cprofile')
+        response = self.client.get('/api/medical-records/', {'_profile': token})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('X-Profile-Status'))
+
+    def test_non_admin_token_ignored(self):
+        self.client.force_authenticate(self.patient_user)
+        self.assertEqual(self.client.post('/api/ops/profiles/token/', {}, format='json').status_code, 403)
+
+        response = self.profiled(make_token(self.patient_user, 'cprofile'))
+        self.assertEqual(response['X-Profile-Status'], 'forbidden')
+        self.assertFalse(response.has_header('X-Profile-Artifact'))
+
+        # Jeton d'un administrateur qui a perdu son rôle
+        token = make_token(self.admin, 'cprofile')
+        User.objects.filter(pk=self.admin.pk).update(user_type='doctor')
+        self.assertEqual(self.profiled(token)['X-Profile-Status'], 'forbidden')
+
+    def test_expired_or_forged_token_ignored(self):
+        issued = time.time() - 901
+        with mock.patch.object(signing.time, 'time', return_value=issued):
+            expired = make_token(self.admin, 'cprofile')
+        response = self.profiled(expired)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Profile-Status'], 'invalid')
+        self.assertFalse(response.has_header('X-Profile-Artifact'))
+
+        self.assertEqual(self.profiled(make_token(self.admin, 'cprofile') + 'x')['X-Profile-Status'], 'invalid')
+
+
+class StartupImportTests(SimpleTestCase):
+    """Démarrage à froid d'un worker (processus neuf, -X importtime), comme manage.py profile_startup --check"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.total_ms, cls.entries = measure_startup(repeat=3)
+
+    def test_within_budget(self):
+        self.assertLessEqual(self.total_ms, settings.STARTUP_IMPORT_BUDGET_MS,
+                             f"Imports au démarrage : {self.total_ms:.0f} ms")
+
+    def test_heavy_modules_loaded_lazily(self):
+        self.assertEqual(loaded_lazy_modules(self.entries, settings.STARTUP_LAZY_MODULES), [])
+        names = {name for name, *_ in self.entries}
+        # Rendu PDF et génération du schéma OpenAPI : chargés à la première utilisation
+        for module in ('reportlab', 'drf_yasg.generators', 'drf_yasg.views'):
+            self.assertNotIn(module, names)
+
+
+class EstimatedCountPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for index in range(3):
+            User.objects.create_user(email=f'compte-{index}@tohpitoh.local')
+
+    def paginator(self):
+        return EstimatedCountPaginator(User.objects.order_by('pk'), 2)
+
+    def test_exact_count_without_planner_estimate(self):
+        # SQLite : pas d'estimation, COUNT(*) exact
+        self.assertEqual(self.paginator().count, 3)
+
+    @override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=100000)
+    def test_estimate_used_above_threshold(self):
+        with mock.patch('core.paginators.estimated_count', return_value=2500000):
+            paginator = self.paginator()
+            with self.assertNumQueries(0):
+                self.assertEqual(paginator.count, 2500000)
+            self.assertEqual(paginator.num_pages, 1250000)
+
+    @override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=100000)
+    def test_exact_count_below_threshold(self):
+        with mock.patch('core.paginators.estimated_count', return_value=40):
+            self.assertEqual(self.paginator().count, 3)
+
+    @override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=0)
+    def test_disabled_by_zero_threshold(self):
+        with mock.patch('core.paginators.estimated_count', return_value=2500000) as estimated_count:
+            self.assertEqual(self.paginator().count, 3)
+        estimated_count.assert_not_called()
+
+
+class CohortStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        today = date.today()
+        # (taille, poids, âge en jours, groupe sanguin, maladies) : IMC aux bornes et valeurs manquantes
+        profiles = [
+            (170, 53.4, 30 * 365, 'O+', 'Diabète, asthme'),
+            (170, 53.5, 17 * 365, 'O+', ''),
+            (180, 81, 45 * 365, 'A-', 'hypertension'),
+            (160, 90, 70 * 365, '', 'HYPERTENSION et diabète'),
+            (None, 70, None, 'B+', ''),
+            (175, None, 2 * 365, 'O+', 'drépanocytose'),
+        ]
+        for index, (height, weight, age_days, blood_type, diseases) in enumerate(profiles):
+            user = User.objects.create_user(
+                email=f'cohorte-{index}@tohpitoh.local',
+                date_of_birth=today - timedelta(days=age_days) if age_days is not None else None)
+            Patient.objects.create(user=user, height=height, weight=weight, blood_type=blood_type,
+                                   chronic_diseases=diseases)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_aggregates_match_per_object_computation(self):
+        stats = compute_cohort_stats()
+        reference = python_stats(date.today())
+        self.assertEqual(stats['patients'], reference['patients'])
+        self.assertEqual(stats['bmi']['categories'], reference['categories'])
+        self.assertEqual({label: stats['age_bands'][label] for label in reference['age_bands']},
+                         reference['age_bands'])
+        self.assertEqual(stats['blood_types'], reference['blood_types'])
+        self.assertEqual({disease: value['count'] for disease, value in stats['chronic_diseases'].items()},
+                         reference['diseases'])
+        self.assertEqual(stats['bmi']['known'], 4)
+        self.assertEqual(stats['age_bands']['unknown'], 1)
+
+    def test_filters(self):
+        self.assertEqual(compute_cohort_stats(blood_type='O+')['patients'], 3)
+        self.assertEqual(compute_cohort_stats(min_age=18, max_age=64)['patients'], 2)
+        self.assertEqual(compute_cohort_stats(chronic_disease='diabète')['patients'], 2)
+
+    def test_cached_until_a_patient_changes(self):
+        first, cached = cohort_stats()
+        self.assertFalse(cached)
+        self.assertEqual(cohort_stats(), (first, True))
+        # Autres filtres : autre entrée
+        self.assertFalse(cohort_stats(blood_type='O+')[1])
+
+        patient = Patient.objects.get(user__email='cohorte-4@tohpitoh.local')
+        patient.height = 180
+        patient.save()
+        data, cached = cohort_stats()
+        self.assertFalse(cached)
+        self.assertEqual(data['bmi']['known'], first['bmi']['known'] + 1)
+
+    def test_bench_runs_and_rolls_back_on_test_database(self):
+        output = io.StringIO()
+        call_command('bench_cohort_stats', patients=300, batch_size=100, stdout=output)
+        self.assertIn('Parité vérifiée', output.getvalue())
+        self.assertEqual(Patient.objects.count(), 6)
+
+    def test_bench_refuses_other_databases_without_explicit_alias(self):
+        connection = connections[DEFAULT_DB_ALIAS]
+        production = mock.patch.dict(connection.settings_dict, {'NAME': 'tohpitoh'})
+        with mock.patch.object(connection, 'vendor', 'postgresql'), production:
+            with self.assertRaisesMessage(CommandError, '--database'):
+                call_command('bench_cohort_stats', patients=10, stdout=io.StringIO())
+        self.assertEqual(Patient.objects.count(), 6)
+
+
+@override_settings(AUDIT_ENABLED=False, THROTTLE_ENABLED=False)
+class OpenApiSchemaViewTests(TestCase):
+    def setUp(self):
+        from tohpitoh_backend.docs.generator import SchemaArtifact
+
+        self.artifact = SchemaArtifact(json.dumps({'paths': {f'/api/{n}/': {} for n in range(200)}}).encode())
+        patcher = mock.patch('tohpitoh_backend.docs.generator.get_schema_artifact', return_value=self.artifact)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, accept_encoding, **headers):
+        return self.client.get('/swagger.json', HTTP_ACCEPT_ENCODING=accept_encoding, **headers)
+
+    def test_gzip_refused_with_zero_quality(self):
+        for header in ('gzip;q=0', 'gzip; q=0.0, identity', 'br;q=0, gzip;q=0'):
+            with self.subTest(header=header):
+                response = self.get(header)
+                self.assertFalse(response.has_header('Content-Encoding'))
+                self.assertEqual(response.content, self.artifact.content)
+                self.assertEqual(response['ETag'], self.artifact.etag)
+                self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_gzip_served_with_its_own_etag(self):
+        response = self.get('br;q=0.5, gzip;q=0.8')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response.content, self.artifact.gzipped)
+        self.assertEqual(response['ETag'], self.artifact.gzip_etag)
+        self.assertNotEqual(self.artifact.gzip_etag, self.artifact.etag)
+
+    def test_revalidation_per_encoding(self):
+        self.assertEqual(self.get('gzip', HTTP_IF_NONE_MATCH=self.artifact.gzip_etag).status_code, 304)
+        self.assertEqual(self.get('gzip;q=0', HTTP_IF_NONE_MATCH=self.artifact.etag).status_code, 304)
+        # L'ETag d'un encodage ne valide pas l'autre représentation
+        self.assertEqual(self.get('gzip;q=0', HTTP_IF_NONE_MATCH=self.artifact.gzip_etag).status_code, 200)
+        self.assertEqual(self.get('gzip', HTTP_IF_NONE_MATCH=self.artifact.etag).status_code, 200)
+
+    def test_read_reuses_the_precompressed_file(self):
+        from tohpitoh_backend.docs.generator import SchemaArtifact
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(OPENAPI_SCHEMA_DIR=Path(directory)):
+            path = self.artifact.write()
+            with mock.patch('tohpitoh_backend.docs.generator.gzip.compress') as compress:
+                self.assertEqual(SchemaArtifact.read().gzipped, self.artifact.gzipped)
+            compress.assert_not_called()
+
+            # .gz d'un autre schéma ou abîmé : recompressé depuis le JSON
+            for gzipped in (gzip.compress(b'{}'), b'abime'):
+                with self.subTest(gzipped=gzipped):
+                    SchemaArtifact.gzip_path(path).write_bytes(gzipped)
+                    self.assertEqual(gzip.decompress(SchemaArtifact.read().gzipped), self.artifact.content)
+
+
+def replicate():
+    """Appliquer le retard de réplication : copier sur le réplica les lignes qu'il n'a pas encore"""
+    for model in REPLICATED_MODELS:
+        present = set(model.objects.using(LAGGING_REPLICA).values_list('pk', flat=True))
+        model.objects.using(LAGGING_REPLICA).bulk_create(
+            [row for row in model.objects.using(DEFAULT_DB_ALIAS).order_by('pk') if row.pk not in present])
+
+
+@override_settings(AUDIT_ENABLED=False, THROTTLE_ENABLED=False, DATABASE_READ_YOUR_WRITES_SECONDS=1)
+@mock.patch('core.db_router.replica_aliases', return_value=[LAGGING_REPLICA])
+class ReplicaRoutingTests(TestCase):
+    """Routage des lectures vers un réplica en retard et lecture de ses propres écritures"""
+    databases = {DEFAULT_DB_ALIAS, LAGGING_REPLICA}
+
+    @classmethod
+    def setUpClass(cls):
+        # Le routeur ne migre que la base principale : tables créées à la main, hors transaction
+        replica = connections[LAGGING_REPLICA]
+        if 'medical_records_medicalrecord' not in replica.introspection.table_names():
+            with replica.schema_editor() as editor:
+                for model in REPLICATED_MODELS:
+                    editor.create_model(model)
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email='auteur@tohpitoh.local', user_type='doctor')
+        Doctor.objects.create(user=cls.author, medical_license='REPLICA-1', specialization='Généraliste')
+        cls.reader = User.objects.create_user(email='lecteur@tohpitoh.local', user_type='doctor')
+        Doctor.objects.create(user=cls.reader, medical_license='REPLICA-2', specialization='Généraliste')
+        cls.patient = Patient.objects.create(user=User.objects.create_user(email='patient@tohpitoh.local'))
+        replicate()
+
+    def setUp(self):
+        cache.clear()
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def visible(self, user):
+        response = self.client_for(user).get('/api/medical-records/', {'fields': 'id'})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['count']
+
+    def create_record(self):
+        response = self.client_for(self.author).post('/api/medical-records/', {
+            'patient_id': self.patient.pk, 'record_type': 'consultation',
+            'title': 'Écriture', 'description': 'Créé sur la base principale',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_get_routed_to_replica(self, replica_aliases):
+        MedicalRecord.objects.create(patient=self.patient, record_type='consultation', title='T', description='D')
+        self.assertEqual(self.visible(self.reader), 0)
+        replicate()
+        self.assertEqual(self.visible(self.reader), 1)
+
+    def test_author_pinned_to_primary_within_window(self, replica_aliases):
+        self.create_record()
+        self.assertIsNotNone(cache.get(_pin_key(self.author)))
+        self.assertEqual(self.visible(self.author), 1)
+        # Les autres lecteurs restent sur le réplica en retard
+        self.assertEqual(self.visible(self.reader), 0)
+
+    def test_back_to_replica_after_window(self, replica_aliases):
+        self.create_record()
+        time.sleep(settings.DATABASE_READ_YOUR_WRITES_SECONDS + 0.1)
+        self.assertEqual(self.visible(self.author), 0)
+        replicate()
+        self.assertEqual(self.visible(self.author), 1)
@@ -0,0 +1,224 @@
+"""
+Limitation de débit pondérée par le coût et contrôle d'admission des endpoints lourds.
+
+Chaque requête coûte un nombre d'unités estimé par la vue (dossiers rendus en
+PDF, étendue d'une recherche...). Elle doit trouver ces unités dans deux seaux
+à jetons, celui de l'utilisateur et le seau global de la portée, puis obtenir
+une place parmi les requêtes simultanées autorisées. Sinon : 429 avec
+Retry-After. L'état vit dans le cache par défaut (Redis en production) pour
+être partagé entre workers.
+
+Une réponse en flux (ZIP de cohorte) est produite après la vue : sa place
+n'est libérée qu'à la fermeture du flux, lu jusqu'au bout ou abandonné.
+"""
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import BaseThrottle
+
+METRICS = ('admitted', 'rejected_rate', 'rejected_concurrency')
+
+
+def _key(*parts):
+    return 'throttle:' + ':'.join(str(part) for part in parts)
+
+
+def get_scope_config(scope):
+    return settings.THROTTLE_SCOPES[scope]
+
+
+class TokenBucket:
+    """
+    Seau à jetons stocké dans le cache : (jetons, horodatage).
+
+    Comme les throttles DRF, la lecture-écriture n'est pas atomique : des
+    requêtes simultanées peuvent consommer un peu plus que le débit prévu.
+    """
+
+    def __init__(self, key, rate, capacity):
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity
+
+    def tokens(self, now):
+        state = cache.get(self.key)
+        if state is None:
+            return self.capacity
+        tokens, updated = state
+        return min(self.capacity, tokens + (now - updated) * self.rate)
+
+    def wait_for(self, cost, now):
+        """Secondes à attendre avant de disposer de cost jetons (0 si disponibles)"""
+        missing = cost - self.tokens(now)
+        return 0 if missing <= 0 else missing / self.rate
+
+    def take(self, cost, now):
+        timeout = math.ceil(self.capacity / self.rate) + 60
+        cache.set(self.key, (self.tokens(now) - cost, now), timeout)
+
+
+class ConcurrencySlots:
+    """Compteur de requêtes en cours (incr/decr atomiques dans le cache)"""
+
+    def __init__(self, key, limit):
+        self.key = key
+        self.limit = limit
+
+    def acquire(self):
+        # Expiration de secours si un worker meurt sans libérer sa place, comptée
+        # depuis la dernière admission : le compteur n'expire pas en pleine activité
+        timeout = settings.THROTTLE_SLOT_TIMEOUT
+        if not cache.add(self.key, 0, timeout):
+            cache.touch(self.key, timeout)
+        if cache.incr(self.key) > self.limit:
+            self.release()
+            return False
+        return True
+
+    def release(self):
+        try:
+            if cache.decr(self.key) < 0:
+                # Compteur expiré puis recréé à 0 pendant la requête : ne jamais passer sous zéro
+                cache.incr(self.key)
+        except ValueError:
+            pass  # compteur expiré entre-temps
+
+    def count(self):
+        return max(cache.get(self.key, 0), 0)
+
+
+class SlotReleasingStream:
+    """Corps en flux libérant les places à sa fermeture (appelée par le serveur même si le flux n'est pas lu)"""
+
+    def __init__(self, content, slots):
+        self._content = content
+        self._slots = slots
+
+    def __iter__(self):
+        yield from self._content
+
+    def close(self):
+        slots, self._slots = self._slots, []
+        for slot in slots:
+            slot.release()
+
+
+def _count(scope, metric):
+    key = _key('metric', scope, metric)
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+
+class CostThrottle(BaseThrottle):
+    """Throttle DRF : seaux utilisateur et global pondérés, puis places simultanées"""
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.config = get_scope_config(scope)
+        self.retry_after = None
+
+    def buckets(self, ident):
+        config = self.config
+        return (
+            TokenBucket(_key('bucket', self.scope, 'user', ident), config['user_rate'], config['user_burst']),
+            TokenBucket(_key('bucket', self.scope, 'global'), config['global_rate'], config['global_burst']),
+        )
+
+    def slots(self, ident):
+        config = self.config
+        return (
+            ConcurrencySlots(_key('slots', self.scope, 'user', ident), config['max_concurrent_per_user']),
+            ConcurrencySlots(_key('slots', self.scope, 'global'), config['max_concurrent']),
+        )
+
+    def allow_request(self, request, view):
+        ident = request.user.pk if request.user.is_authenticated else self.get_ident(request)
+        now = time.time()
+        buckets = self.buckets(ident)
+        # Une requête plus chère que la rafale attend simplement un seau plein
+        cost = min(view.get_throttle_cost(request), *(bucket.capacity for bucket in buckets))
+
+        wait = max(bucket.wait_for(cost, now) for bucket in buckets)
+        if wait > 0:
+            _count(self.scope, 'rejected_rate')
+            self.retry_after = wait
+            return False
+
+        acquired = []
+        for slot in self.slots(ident):
+            if not slot.acquire():
+                for held in acquired:
+                    held.release()
+                _count(self.scope, 'rejected_concurrency')
+                self.retry_after = settings.THROTTLE_RETRY_AFTER
+                return False
+            acquired.append(slot)
+
+        for bucket in buckets:
+            bucket.take(cost, now)
+        request._throttle_slots = getattr(request, '_throttle_slots', []) + acquired
+        _count(self.scope, 'admitted')
+        return True
+
+    def wait(self):
+        return self.retry_after
+
+
+class CostThrottleMixin:
+    """
+    Mixin de vue appliquant CostThrottle aux actions listées.
+
+    La vue déclare throttle_cost_scope (clé de THROTTLE_SCOPES), éventuellement
+    throttle_cost_actions, et surcharge get_throttle_cost(request).
+    """
+    throttle_cost_scope = None
+    throttle_cost_actions = None  # None : toutes les actions
+
+    def get_throttle_cost(self, request):
+        return 1
+
+    def uses_cost_throttle(self):
+        if not settings.THROTTLE_ENABLED or self.throttle_cost_scope is None:
+            return False
+        return self.throttle_cost_actions is None or getattr(self, 'action', None) in self.throttle_cost_actions
+
+    def get_throttles(self):
+        throttles = super().get_throttles()
+        if self.uses_cost_throttle():
+            throttles.append(CostThrottle(self.throttle_cost_scope))
+        return throttles
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        # Libérer les places prises à l'admission, que la vue ait réussi ou non
+        slots = getattr(request, '_throttle_slots', [])
+        request._throttle_slots = []
+        if slots and response.streaming and not response.is_async:
+            # Corps produit pendant la lecture : places gardées jusqu'à la fermeture du flux
+            response.streaming_content = SlotReleasingStream(response.streaming_content, slots)
+        else:
+            for slot in slots:
+                slot.release()
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+def throttling_metrics():
+    """Requêtes en cours, jetons globaux restants et compteurs par portée"""
+    now = time.time()
+    metrics = {}
+    for scope, config in settings.THROTTLE_SCOPES.items():
+        in_flight = ConcurrencySlots(_key('slots', scope, 'global'), config['max_concurrent'])
+        bucket = TokenBucket(_key('bucket', scope, 'global'), config['global_rate'], config['global_burst'])
+        metrics[scope] = {
+            'in_flight': in_flight.count(),
+            'max_concurrent': config['max_concurrent'],
+            'global_tokens': round(bucket.tokens(now), 2),
+            'global_burst': config['global_burst'],
+            **{metric: cache.get(_key('metric', scope, metric), 0) for metric in METRICS},
+        }
+    return metrics
+
@@ -0,0 +1,9 @@
+from django.urls import path
+from .views import ThrottlingMetricsView, CohortStatsView, ProfilingTokenView, ProfileArtifactView
+
+urlpatterns = [
+    path('throttling/', ThrottlingMetricsView.as_view(), name='ops-throttling'),
+    path('analytics/cohort/', CohortStatsView.as_view(), name='ops-cohort-stats'),
+    path('profiles/token/', ProfilingTokenView.as_view(), name='ops-profile-token'),
+    path('profiles/<str:artifact_id>/', ProfileArtifactView.as_view(), name='ops-profile-artifact'),
+]
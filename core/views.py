@@ -1,3 +1,60 @@
-from django.shortcuts import render
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-# Create your views here.
+from . import profiling
+from .analytics import cohort_stats
+from .permissions import IsAdmin
+from .serializers import CohortStatsParamsSerializer, ProfilingTokenSerializer
+from .throttling import throttling_metrics
+
+
+class ThrottlingMetricsView(APIView):
+    """Occupation des endpoints lourds : requêtes en cours, jetons restants, rejets"""
+    permission_classes = [IsAdmin]
+
+    def get(self, request):
+        return Response(throttling_metrics())
+
+
+class CohortStatsView(APIView):
+    """Statistiques de population (IMC, âges, groupes sanguins, maladies chroniques) calculées en base"""
+    permission_classes = [IsAdmin]
+
+    def get(self, request):
+        serializer = CohortStatsParamsSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        data, cached = cohort_stats(**serializer.validated_data)
+        return Response(data, headers={'X-Cache': 'hit' if cached else 'miss'})
+
+
+class ProfilingTokenView(APIView):
+    """Jeton à envoyer dans l'en-tête X-Profile pour profiler une requête"""
+    permission_classes = [IsAdmin]
+
+    def post(self, request):
+        if not settings.PROFILING_ENABLED:
+            return Response({"detail": "Le profilage est désactivé."}, status=404)
+        serializer = ProfilingTokenSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        mode = serializer.validated_data['mode']
+        return Response({
+            'token': profiling.make_token(request.user, mode),
+            'mode': mode,
+            'header': 'X-Profile',
+            'expires_in': settings.PROFILING_TOKEN_MAX_AGE,
+        })
+
+
+class ProfileArtifactView(APIView):
+    """Archive ZIP d'un profil (profil, requêtes SQL, résumé), réservée à l'administrateur qui l'a déclenché"""
+    permission_classes = [IsAdmin]
+
+    def get(self, request, artifact_id):
+        artifact = profiling.get_artifact(artifact_id)
+        if artifact is None or artifact['user_id'] != request.user.pk:
+            raise Http404
+        response = HttpResponse(artifact['content'], content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="profile_{artifact_id}.zip"'
+        return response
@@ -6,3 +6,8 @@ timeout = 120
 accesslog = '-'
 errorlog = '-'
 
+
+def worker_exit(server, worker):
+    # Écrire les événements d'audit encore en file avant l'arrêt du worker
+    from audit.buffer import flush
+    flush()
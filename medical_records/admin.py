@@ -1,21 +1,40 @@
 from django.contrib import admin
-from .models import MedicalRecord, MedicalTest
+from core.paginators import LargeTableAdminMixin
+from .models import MedicalRecord, MedicalTest, ArchivedMedicalRecord
 
 class MedicalTestInline(admin.TabularInline):
     model = MedicalTest
     extra = 1
+    raw_id_fields = ('record',)
 
 @admin.register(MedicalRecord)
-class MedicalRecordAdmin(admin.ModelAdmin):
+class MedicalRecordAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('title', 'patient', 'record_type', 'date', 'created_by')
     list_filter = ('record_type', 'date', 'is_emergency')
+    list_select_related = ('patient__user', 'created_by__user')
     search_fields = ('title', 'patient__user__email', 'patient__user__first_name', 
                     'patient__user__last_name', 'diagnosis')
-    date_hierarchy = 'date'
+    # Pas de date_hierarchy : ses requêtes années/mois parcourent toute la table,
+    # le filtre 'date' (plages fixes) n'en fait aucune
+    autocomplete_fields = ('patient', 'created_by')
     inlines = [MedicalTestInline]
 
 @admin.register(MedicalTest)
-class MedicalTestAdmin(admin.ModelAdmin):
+class MedicalTestAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('test_name', 'record', 'test_date', 'lab_name')
+    list_select_related = ('record__patient__user',)
+    raw_id_fields = ('record',)
     list_filter = ('test_date', 'lab_name')
-    search_fields = ('test_name', 'record__title', 'lab_name')
\ No newline at end of file
+    search_fields = ('test_name', 'record__title', 'lab_name')
+
+@admin.register(ArchivedMedicalRecord)
+class ArchivedMedicalRecordAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ('title', 'patient', 'record_type', 'date', 'archived_at')
+    list_select_related = ('patient__user',)
+    list_filter = ('record_type',)
+    search_fields = ('title', 'patient__user__email', 'patient__user__last_name')
+    exclude = ('payload',)
+    readonly_fields = ('id', 'patient', 'date', 'record_type', 'title', 'archived_at')
+    
+    def has_add_permission(self, request):
+        return False
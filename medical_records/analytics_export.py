@@ -0,0 +1,237 @@
+"""
+Export analytique en masse des dossiers et des tests (CSV ou NDJSON).
+
+Les lignes sont lues en tuples (values_list, aucune instance de modèle) par un
+curseur côté serveur (QuerySet.iterator : curseur nommé sous PostgreSQL) par
+blocs de ANALYTICS_EXPORT_CHUNK_SIZE, et chaque bloc est écrit dès qu'il est
+lu : la mémoire ne dépend pas du nombre de lignes. La lecture se fait sur un
+réplica quand il y en a un.
+
+Pseudonymisation : l'identifiant du patient est remplacé par un HMAC-SHA256
+(clé ANALYTICS_EXPORT_PSEUDONYM_SECRET, sinon SECRET_KEY), stable d'un export à
+l'autre pour permettre les jointures. Les champs texte libres sont exportés
+tels quels.
+
+L'export peut être découpé en tranches de dates exportées en parallèle
+(process_pool), chacune dans son propre fichier.
+"""
+import csv
+import io
+import logging
+import os
+import time
+from collections import namedtuple
+from datetime import date, datetime, time as time_of_day, timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.db.models import Max, Min
+from django.utils import timezone
+from django.utils.crypto import salted_hmac
+
+from core.db_router import replica_aliases
+from core.process_pool import process_pool
+from .exports import _dumps
+from .models import MedicalRecord, MedicalTest
+
+logger = logging.getLogger(__name__)
+
+# columns : (nom exporté, champ lu) ; date_field : champ de découpage par dates
+Table = namedtuple('Table', 'model columns date_field')
+
+TABLES = {
+    'records': Table(MedicalRecord, (
+        ('id', 'id'),
+        ('patient_id', 'patient_id'),
+        ('created_by_id', 'created_by_id'),
+        ('date', 'date'),
+        ('record_type', 'record_type'),
+        ('title', 'title'),
+        ('description', 'description'),
+        ('diagnosis', 'diagnosis'),
+        ('prescription', 'prescription'),
+        ('notes', 'notes'),
+        ('is_emergency', 'is_emergency'),
+        ('updated_at', 'updated_at'),
+    ), 'date'),
+    'tests': Table(MedicalTest, (
+        ('id', 'id'),
+        ('record_id', 'record_id'),
+        ('patient_id', 'record__patient_id'),
+        ('test_name', 'test_name'),
+        ('test_date', 'test_date'),
+        ('result', 'result'),
+        ('unit', 'unit'),
+        ('normal_range', 'normal_range'),
+        ('lab_name', 'lab_name'),
+    ), 'test_date'),
+}
+
+# format -> (content type, extension)
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+
+class ExportStats:
+    """Lignes et octets écrits, durée ; mis à jour au fil de l'export"""
+
+    def __init__(self, rows=0, size=0, seconds=0.0):
+        self.rows, self.size, self.seconds = rows, size, seconds
+
+    def add(self, other):
+        self.rows += other.rows
+        self.size += other.size
+        self.seconds = max(self.seconds, other.seconds)
+
+    def __str__(self):
+        seconds = self.seconds or 1e-9
+        return (f"{self.rows} lignes, {self.size / 1e6:.1f} Mo en {self.seconds:.2f} s "
+                f"({self.rows / seconds:.0f} lignes/s, {self.size / 1e6 / seconds:.1f} Mo/s)")
+
+
+# Cache borné : un patient a plusieurs lignes, la mémoire reste constante
+@lru_cache(maxsize=65536)
+def pseudonym(patient_id):
+    """Pseudonyme stable d'un patient (32 caractères hexadécimaux)"""
+    secret = settings.ANALYTICS_EXPORT_PSEUDONYM_SECRET or None
+    return salted_hmac('analytics-export.patient', str(patient_id), secret=secret, algorithm='sha256').hexdigest()[:32]
+
+
+def read_database(using=None):
+    """Base lue : celle demandée, sinon un réplica, sinon la base principale"""
+    if using:
+        return using
+    replicas = replica_aliases()
+    return replicas[0] if replicas else 'default'
+
+
+def _bound(table, value):
+    """Borne de date adaptée au champ de découpage (datetime pour les dossiers, date pour les tests)"""
+    if value is None:
+        return None
+    if table.date_field == 'date':
+        if isinstance(value, datetime):
+            return value
+        return timezone.make_aware(datetime.combine(value, time_of_day.min))
+    return value.date() if isinstance(value, datetime) else value
+
+
+def queryset(table_name, start=None, end=None, using=None):
+    """Lignes d'une table dans [start, end[, triées par identifiant"""
+    table = TABLES[table_name]
+    rows = table.model.objects.using(read_database(using)).order_by('pk')
+    if start is not None:
+        rows = rows.filter(**{f'{table.date_field}__gte': _bound(table, start)})
+    if end is not None:
+        rows = rows.filter(**{f'{table.date_field}__lt': _bound(table, end)})
+    return rows.values_list(*(field for _, field in table.columns))
+
+
+def _prepare(table_name, pseudonymize):
+    """Fonction de conversion d'une ligne (dates ISO 8601, pseudonyme)"""
+    columns = [name for name, _ in TABLES[table_name].columns]
+    patient_index = columns.index('patient_id')
+
+    def convert(row):
+        row = [value.isoformat() if isinstance(value, date) else value for value in row]
+        if pseudonymize:
+            row[patient_index] = pseudonym(row[patient_index])
+        return row
+    return columns, convert
+
+
+def export_stream(table_name, output, start=None, end=None, pseudonymize=True, chunk_size=None,
+                  using=None, stats=None):
+    """Générer l'export en morceaux d'octets, un par bloc lu ; stats est mis à jour au fil de l'eau"""
+    chunk_size = chunk_size or settings.ANALYTICS_EXPORT_CHUNK_SIZE
+    stats = stats if stats is not None else ExportStats()
+    columns, convert = _prepare(table_name, pseudonymize)
+    started = time.perf_counter()
+
+    buffer = io.StringIO()
+    if output == 'csv':
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerow(columns)
+
+        def write(row):
+            writer.writerow(convert(row))
+    else:
+        def write(row):
+            buffer.write(_dumps(dict(zip(columns, convert(row)))))
+            buffer.write('\n')
+
+    pending = 0
+    for row in queryset(table_name, start, end, using).iterator(chunk_size=chunk_size):
+        write(row)
+        pending += 1
+        if pending == chunk_size:
+            data = buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+            stats.rows += pending
+            stats.size += len(data)
+            stats.seconds = time.perf_counter() - started
+            pending = 0
+            yield data
+
+    data = buffer.getvalue().encode('utf-8')
+    stats.rows += pending
+    stats.size += len(data)
+    stats.seconds = time.perf_counter() - started
+    if data:
+        yield data
+    logger.info("Export analytique %s (%s) : %s", table_name, output, stats)
+
+
+def export_to_file(table_name, output, path, start=None, end=None, pseudonymize=True, chunk_size=None, using=None):
+    """Écrire l'export dans un fichier (exécutable dans un processus de travail) ; renvoie ses statistiques"""
+    stats = ExportStats()
+    with open(path, 'wb') as destination:
+        for data in export_stream(table_name, output, start, end, pseudonymize, chunk_size, using, stats):
+            destination.write(data)
+    return stats
+
+
+def date_ranges(table_name, parts, start=None, end=None, using=None):
+    """Découper [start, end[ (par défaut toute la table) en tranches de durées égales"""
+    table = TABLES[table_name]
+    if start is None or end is None:
+        bounds = queryset(table_name, start, end, using).aggregate(
+            low=Min(table.date_field), high=Max(table.date_field))
+        if bounds['low'] is None:
+            return []
+        start = start if start is not None else bounds['low']
+        # Borne haute exclue : un jour de plus que la dernière date
+        end = end if end is not None else bounds['high'] + timedelta(days=1)
+    start, end = _bound(table, start), _bound(table, end)
+    step = (end - start) / parts
+    if table.date_field == 'test_date':
+        # Champ date : tranches d'un nombre entier de jours
+        step = timedelta(days=max(1, -(-step // timedelta(days=1))))
+    ranges, low = [], start
+    while low < end:
+        high = min(low + step, end)
+        ranges.append((low, high))
+        low = high
+    return ranges
+
+
+def export_parallel(table_name, output, directory, parts, start=None, end=None, pseudonymize=True,
+                    chunk_size=None, using=None, max_workers=None):
+    """
+    Exporter une table en tranches de dates, une par fichier, dans des
+    processus parallèles. Renvoie [(chemin, statistiques)] dans l'ordre des dates.
+    """
+    extension = FORMATS[output][1]
+    ranges = date_ranges(table_name, parts, start, end, using)
+    if not ranges:
+        return []
+    jobs = []
+    with process_pool(max_workers=min(max_workers or parts, len(ranges))) as pool:
+        for index, (low, high) in enumerate(ranges, start=1):
+            path = os.path.join(directory, f'{table_name}.part-{index:03d}.{extension}')
+            jobs.append((path, pool.submit(export_to_file, table_name, output, path, low, high,
+                                           pseudonymize, chunk_size, using)))
+        return [(path, future.result()) for path, future in jobs]
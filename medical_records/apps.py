@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class MedicalRecordsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'medical_records'
+
+    def ready(self):
+        # Journal des modifications pour la synchronisation incrémentale
+        from . import changes  # noqa: F401
+        # Fiches d'urgence recalculées aux écritures des patients et des dossiers urgents
+        from . import emergency  # noqa: F401
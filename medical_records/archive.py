@@ -0,0 +1,113 @@
+"""
+Archivage à froid des dossiers anciens et relecture transparente.
+
+Un dossier archivé est reconstruit en instance MedicalRecord non enregistrée
+(tests préchargés, patient et médecin résolus) : sérialiseurs et générateur
+PDF le traitent comme un dossier courant. Les dossiers archivés étant tous
+antérieurs aux dossiers courants, l'historique complet trié par -date est la
+suite des dossiers courants puis des dossiers archivés.
+"""
+import datetime
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from core.models import Doctor
+from .changes import suppress_changes
+from .models import ArchivedMedicalRecord, MedicalRecord, MedicalTest
+
+COMPRESSION_LEVEL = 9
+
+
+class _ArchiveEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder tronque les horodatages à la milliseconde
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _field_values(instance):
+    return {field.attname: getattr(instance, field.attname) for field in instance._meta.concrete_fields}
+
+
+def _from_values(model, values):
+    fields = {field.attname: field for field in model._meta.concrete_fields}
+    return model(**{name: fields[name].to_python(value) for name, value in values.items() if name in fields})
+
+
+def pack_record(record, tests):
+    data = {
+        'record': _field_values(record),
+        'tests': [_field_values(test) for test in tests],
+    }
+    # Les FileField sont conservés sous leur nom : les fichiers restent dans le stockage
+    for values in [data['record'], *data['tests']]:
+        if 'file' in values:
+            values['file'] = values['file'].name or None
+    return zlib.compress(json.dumps(data, cls=_ArchiveEncoder).encode('utf-8'), COMPRESSION_LEVEL)
+
+
+def unpack_record(archived):
+    data = json.loads(zlib.decompress(bytes(archived.payload)))
+    record = _from_values(MedicalRecord, data['record'])
+    tests = [_from_values(MedicalTest, values) for values in data['tests']]
+    return record, tests
+
+
+@transaction.atomic
+def archive_batch(records):
+    """Archiver une liste de dossiers (tests préchargés) puis les supprimer"""
+    ArchivedMedicalRecord.objects.bulk_create([
+        ArchivedMedicalRecord(
+            id=record.id,
+            patient_id=record.patient_id,
+            date=record.date,
+            record_type=record.record_type,
+            title=record.title,
+            payload=pack_record(record, record.tests.all()),
+        )
+        for record in records
+    ])
+    # Le dossier change de stockage sans changer : pas de suppression à synchroniser
+    with suppress_changes():
+        MedicalRecord.objects.filter(id__in=[record.id for record in records]).delete()
+    return len(records)
+
+
+def load_archived(archived):
+    """Reconstruire des ArchivedMedicalRecord (patient.user chargé) en MedicalRecord"""
+    records = [(item, *unpack_record(item)) for item in archived]
+    doctor_ids = {record.created_by_id for _, record, _ in records if record.created_by_id}
+    doctors = Doctor.objects.select_related('user').in_bulk(doctor_ids) if doctor_ids else {}
+
+    result = []
+    for item, record, tests in records:
+        record.patient = item.patient
+        record.created_by = doctors.get(record.created_by_id)
+        for test in tests:
+            test.record = record
+        # Tests exposés comme un prefetch_related('tests')
+        prefetched = MedicalTest.objects.none()
+        prefetched._result_cache = tests
+        prefetched._prefetch_done = True
+        record._prefetched_objects_cache = {'tests': prefetched}
+        result.append(record)
+    return result
+
+
+def iter_archived_records(patient, chunk_size=500):
+    """Dossiers archivés d'un patient, plus récents d'abord, décompressés bloc par bloc"""
+    ids = list(ArchivedMedicalRecord.objects.filter(patient=patient).order_by('-date', '-id').values_list('id', flat=True))
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        archived = ArchivedMedicalRecord.objects.in_bulk(chunk)
+        for item in archived.values():
+            item.patient = patient
+        yield from load_archived(archived[pk] for pk in chunk)
+
+
+def archived_records_for(patient):
+    return list(iter_archived_records(patient))
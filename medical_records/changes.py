@@ -0,0 +1,159 @@
+"""
+Synchronisation incrémentale des clients hors ligne.
+
+Chaque écriture d'un dossier ou d'un test ajoute une entrée à RecordChange.
+Un jeton de synchronisation signé porte le patient et la position (id) de la
+dernière entrée transmise ; il expire après SYNC_RETENTION_DAYS, durée
+pendant laquelle le journal est conservé. Un jeton absent ou expiré donne
+lieu à une resynchronisation complète.
+
+La position ne dépasse jamais les entrées de moins de SYNC_SAFETY_SECONDS :
+une transaction plus ancienne encore ouverte au moment de la lecture ne
+peut donc pas être sautée. Les entrées récentes sont renvoyées de nouveau à
+l'appel suivant, ce qui est sans effet (dernier état de l'objet).
+"""
+import datetime
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Exists, OuterRef
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import MedicalRecord, MedicalTest, RecordChange
+
+TOKEN_SALT = 'medical_records.sync'
+
+_suppressed = ContextVar('record_changes_suppressed', default=False)
+
+
+class InvalidSyncToken(Exception):
+    pass
+
+
+@contextmanager
+def suppress_changes():
+    """Ne pas journaliser les écritures du bloc (archivage : les dossiers ne changent pas)"""
+    token = _suppressed.set(True)
+    try:
+        yield
+    finally:
+        _suppressed.reset(token)
+
+
+def _log(kind, object_id, patient_id, operation):
+    if _suppressed.get() or patient_id is None:
+        return
+    RecordChange.objects.create(kind=kind, object_id=object_id, patient_id=patient_id, operation=operation)
+
+
+@receiver(post_save, sender=MedicalRecord)
+def record_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _log('record', instance.pk, instance.patient_id, 'upsert')
+
+
+@receiver(post_delete, sender=MedicalRecord)
+def record_deleted(sender, instance, **kwargs):
+    _log('record', instance.pk, instance.patient_id, 'delete')
+
+
+def _test_patient_id(test):
+    record = test._state.fields_cache.get('record')
+    if record is not None:
+        return record.patient_id
+    return MedicalRecord.objects.filter(pk=test.record_id).values_list('patient_id', flat=True).first()
+
+
+@receiver(post_save, sender=MedicalTest)
+def test_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _log('test', instance.pk, _test_patient_id(instance), 'upsert')
+
+
+@receiver(post_delete, sender=MedicalTest)
+def test_deleted(sender, instance, **kwargs):
+    _log('test', instance.pk, _test_patient_id(instance), 'delete')
+
+
+def make_token(patient, position):
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(f'{patient.pk}:{position}')
+
+
+def read_token(token, patient):
+    """Position portée par le jeton ; None s'il a expiré (resynchronisation complète)"""
+    max_age = datetime.timedelta(days=settings.SYNC_RETENTION_DAYS)
+    try:
+        value = signing.TimestampSigner(salt=TOKEN_SALT).unsign(token, max_age=max_age)
+    except signing.SignatureExpired:
+        return None
+    except signing.BadSignature:
+        raise InvalidSyncToken("Jeton de synchronisation invalide.")
+    patient_id, position = value.split(':')
+    if int(patient_id) != patient.pk:
+        raise InvalidSyncToken("Jeton émis pour un autre patient.")
+    return int(position)
+
+
+def _safe_cutoff():
+    return timezone.now() - datetime.timedelta(seconds=settings.SYNC_SAFETY_SECONDS)
+
+
+def current_position():
+    """Position de départ d'une resynchronisation complète (à lire avant les données)"""
+    position = (RecordChange.objects.filter(changed_at__lte=_safe_cutoff())
+                .order_by('-id').values_list('id', flat=True).first())
+    return position or 0
+
+
+def latest_position(patient_id=None):
+    """Dernière entrée du journal, de tous les patients ou d'un seul : version des données pour les clés"""
+    queryset = RecordChange.objects.all()
+    if patient_id is not None:
+        queryset = queryset.filter(patient_id=patient_id)
+    return queryset.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+class ChangeSet:
+    """Dernière opération de chaque objet modifié depuis une position, page par page"""
+
+    def __init__(self, patient, since, limit):
+        cutoff = _safe_cutoff()
+        rows = list(
+            RecordChange.objects.filter(patient_id=patient.pk, id__gt=since)
+            .order_by('id').values_list('id', 'kind', 'object_id', 'operation', 'changed_at')[:limit + 1]
+        )
+        self.has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        # Page pleine ou non, la position s'arrête avant la première entrée trop récente
+        self.position = since
+        for change_id, _, _, _, changed_at in rows:
+            if changed_at > cutoff:
+                # Les entrées suivantes sont plus récentes encore : rien d'autre à lire avant l'appel suivant
+                self.has_more = False
+                break
+            self.position = change_id
+
+        latest = {}
+        for _, kind, object_id, operation, _ in rows:
+            latest[kind, object_id] = operation
+        self.upserted = {'record': [], 'test': []}
+        self.deleted = {'record': [], 'test': []}
+        for (kind, object_id), operation in latest.items():
+            (self.upserted if operation == 'upsert' else self.deleted)[kind].append(object_id)
+
+
+def compact(retention_days=None, dry_run=False):
+    """Supprimer les entrées remplacées par une plus récente et celles hors rétention"""
+    retention_days = settings.SYNC_RETENTION_DAYS if retention_days is None else retention_days
+    expired = RecordChange.objects.filter(changed_at__lt=timezone.now() - datetime.timedelta(days=retention_days))
+    superseded = RecordChange.objects.filter(Exists(RecordChange.objects.filter(
+        kind=OuterRef('kind'), object_id=OuterRef('object_id'), id__gt=OuterRef('id'),
+    )))
+    if dry_run:
+        return expired.count(), superseded.count()
+    return expired.delete()[0], superseded.delete()[0]
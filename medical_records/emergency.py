@@ -0,0 +1,196 @@
+"""
+Fiche d'urgence : groupe sanguin, allergies, maladies chroniques, contact
+d'urgence et derniers dossiers marqués urgents d'un patient.
+
+La fiche est recalculée à chaque écriture d'un patient (ou du nom et de la
+date de naissance de son utilisateur) et de chaque dossier urgent, puis
+enregistrée en JSON compact avec son ETag. Elle est servie sans
+authentification sur présentation d'un jeton (QR code) qui ne donne accès qu'à
+elle. Chaque requête lit une seule ligne (patient, ETag) sur l'index unique de
+l'empreinte du jeton : un jeton révoqué ou remplacé dans un autre worker est
+refusé aussitôt, quel que soit le cache. Le cache, indexé par cette empreinte,
+ne sert qu'à éviter de relire le JSON tant que l'ETag n'a pas changé.
+
+Les écritures sans signaux (bulk_create, update) ne recalculent rien :
+manage.py build_emergency_cards reconstruit les fiches.
+"""
+import hashlib
+import json
+import secrets
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.models import Patient, User
+from .models import EmergencyCard, MedicalRecord
+
+ServedCard = namedtuple('ServedCard', 'patient_id etag payload')
+
+USER_FIELDS = ('first_name', 'last_name', 'date_of_birth')
+
+
+def token_hash(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _cache_key(digest):
+    return f'emergency-card:{digest}'
+
+
+def card_content(patient):
+    """Contenu de la fiche (patient avec son utilisateur chargé)"""
+    records = (MedicalRecord.objects.filter(patient=patient, is_emergency=True)
+               .order_by('-date', '-id')
+               .values('id', 'date', 'record_type', 'title', 'diagnosis', 'prescription')
+               [:settings.EMERGENCY_CARD_MAX_RECORDS])
+    user = patient.user
+    return {
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'date_of_birth': user.date_of_birth,
+        'blood_type': patient.blood_type,
+        'allergies': patient.allergies,
+        'chronic_diseases': patient.chronic_diseases,
+        'emergency_contact': patient.emergency_contact,
+        'emergency_phone': patient.emergency_phone,
+        'emergency_records': list(records),
+    }
+
+
+def _cache_card(digest, patient_id, etag, payload):
+    cache.set(_cache_key(digest), ServedCard(patient_id, etag, payload), settings.EMERGENCY_CARD_CACHE_SECONDS)
+
+
+def build_card(patient, create=True):
+    """
+    Recalculer et enregistrer la fiche ; le cache du jeton actif est mis à jour
+    après validation. Avec create=False, une fiche absente n'est pas créée.
+    """
+    payload = json.dumps(card_content(patient), cls=DjangoJSONEncoder, ensure_ascii=False,
+                         separators=(',', ':')).encode()
+    etag = '"%s"' % hashlib.sha256(payload).hexdigest()[:32]
+    if create:
+        card, created = EmergencyCard.objects.get_or_create(patient=patient, defaults={'payload': payload, 'etag': etag})
+    else:
+        card, created = EmergencyCard.objects.filter(patient=patient).first(), False
+        if card is None:
+            return None
+    if not created:
+        if card.etag == etag:
+            return card
+        card.payload, card.etag = payload, etag
+        card.save(update_fields=['payload', 'etag', 'updated_at'])
+    if card.token_hash:
+        digest = card.token_hash
+        transaction.on_commit(lambda: _cache_card(digest, patient.pk, etag, payload))
+    return card
+
+
+def rebuild_card(patient_id):
+    """Mettre à jour une fiche existante (jamais créée ici : le patient peut être en cours de suppression)"""
+    patient = Patient.objects.select_related('user').filter(pk=patient_id).first()
+    if patient is not None:
+        build_card(patient, create=False)
+
+
+def issue_token(patient):
+    """Nouveau jeton d'accès (l'ancien est révoqué) ; seul moment où le jeton est connu"""
+    token = secrets.token_urlsafe(settings.EMERGENCY_CARD_TOKEN_BYTES)
+    with transaction.atomic():
+        card = build_card(patient)
+        card = EmergencyCard.objects.select_for_update().get(pk=card.pk)
+        previous = card.token_hash
+        card.token_hash = token_hash(token)
+        card.token_created_at = timezone.now()
+        card.save(update_fields=['token_hash', 'token_created_at', 'updated_at'])
+        digest, etag, payload = card.token_hash, card.etag, bytes(card.payload)
+
+        def publish():
+            if previous:
+                cache.delete(_cache_key(previous))
+            _cache_card(digest, patient.pk, etag, payload)
+        transaction.on_commit(publish)
+    return token, card
+
+
+def revoke_token(patient):
+    """Révoquer le jeton actif ; False s'il n'y en avait pas"""
+    with transaction.atomic():
+        card = EmergencyCard.objects.select_for_update().filter(patient=patient).first()
+        if card is None or not card.token_hash:
+            return False
+        previous = card.token_hash
+        card.token_hash = None
+        card.token_created_at = None
+        card.save(update_fields=['token_hash', 'token_created_at', 'updated_at'])
+        transaction.on_commit(lambda: cache.delete(_cache_key(previous)))
+    return True
+
+
+def card_for_token(token):
+    """Fiche servie pour un jeton (une ligne par l'index unique, JSON en cache), None si inconnu ou révoqué"""
+    digest = token_hash(token)
+    cards = EmergencyCard.objects.filter(token_hash=digest)
+    card = cache.get(_cache_key(digest))
+    if card is not None:
+        # Toujours vérifiée en base : le cache par défaut n'est pas partagé entre workers sans Redis
+        row = cards.values_list('patient_id', 'etag').first()
+        if row is None:
+            cache.delete(_cache_key(digest))
+            return None
+        if tuple(card[:2]) == row:
+            return card
+    row = cards.values_list('patient_id', 'etag', 'payload').first()
+    if row is None:
+        return None
+    card = ServedCard(row[0], row[1], bytes(row[2]))
+    _cache_card(digest, *card)
+    return card
+
+
+def _card_lists_record(patient_id, record_id):
+    payload = EmergencyCard.objects.filter(patient_id=patient_id).values_list('payload', flat=True).first()
+    if payload is None:
+        return False
+    return any(record['id'] == record_id for record in json.loads(bytes(payload))['emergency_records'])
+
+
+@receiver(post_save, sender=Patient)
+def _patient_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        build_card(instance)
+
+
+@receiver(post_delete, sender=EmergencyCard)
+def _card_deleted(sender, instance, **kwargs):
+    if instance.token_hash:
+        digest = instance.token_hash
+        transaction.on_commit(lambda: cache.delete(_cache_key(digest)))
+
+
+@receiver(post_save, sender=User)
+def _user_saved(sender, instance, raw=False, created=False, update_fields=None, **kwargs):
+    # Les connexions (last_login) ne changent pas la fiche ; un nouvel utilisateur n'a pas encore de profil
+    if raw or created or instance.user_type != 'patient':
+        return
+    if update_fields is not None and not set(update_fields) & set(USER_FIELDS):
+        return
+    patient_id = Patient.objects.filter(user_id=instance.pk).values_list('id', flat=True).first()
+    if patient_id is not None:
+        rebuild_card(patient_id)
+
+
+@receiver(post_save, sender=MedicalRecord)
+@receiver(post_delete, sender=MedicalRecord)
+def _record_changed(sender, instance, raw=False, **kwargs):
+    # Un dossier qui n'est pas (ou plus) urgent ne compte que s'il figurait sur la fiche
+    if raw:
+        return
+    if instance.is_emergency or _card_lists_record(instance.patient_id, instance.pk):
+        rebuild_card(instance.patient_id)
@@ -0,0 +1,33 @@
+"""
+Export en flux (NDJSON ou tableau JSON) de l'historique d'un patient
+"""
+import json
+
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def _dumps(item):
+    return json.dumps(item, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+
+
+def ndjson_stream(items):
+    """Un objet JSON par ligne"""
+    for item in items:
+        yield (_dumps(item) + '\n').encode('utf-8')
+
+
+def json_array_stream(items):
+    """Un tableau JSON émis élément par élément"""
+    yield b'['
+    separator = b''
+    for item in items:
+        yield separator + _dumps(item).encode('utf-8')
+        separator = b','
+    yield b']'
+
+
+# output -> (content type, extension, générateur)
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson', ndjson_stream),
+    'json': ('application/json', 'json', json_array_stream),
+}
@@ -0,0 +1,293 @@
+"""
+Sérialisation rapide en lecture des listes de dossiers médicaux.
+
+Les lignes sont lues avec .values_list() puis converties par des accesseurs
+précompilés à partir des champs de MedicalRecordSerializer : la sortie est
+identique, sans instancier de modèles ni de sérialiseurs DRF par ligne.
+"""
+from functools import lru_cache
+
+from django.conf import settings
+from rest_framework import serializers
+from rest_framework.response import Response
+
+from core.serializers import PatientProfileSerializer
+from .models import MedicalRecord, MedicalTest
+from .serializers import MedicalRecordSerializer
+
+
+def _compute_bmi(height, weight):
+    # Même calcul que Patient.calculate_bmi()
+    if height and weight:
+        height_in_m = height / 100
+        return round(weight / (height_in_m ** 2), 2)
+    return None
+
+
+# SerializerMethodField reproduits à partir des colonnes dont ils dépendent
+METHOD_FIELDS = {
+    (PatientProfileSerializer, 'bmi'): (('height', 'weight'), _compute_bmi),
+}
+
+# Champs dont la valeur lue en base est déjà celle renvoyée par DRF
+IDENTITY_FIELDS = (
+    serializers.CharField,
+    serializers.ChoiceField,
+    serializers.IntegerField,
+    serializers.FloatField,
+    serializers.BooleanField,
+)
+
+
+class UnsupportedField(Exception):
+    """Champ de sérialiseur que le chemin rapide ne sait pas reproduire"""
+
+
+class _Columns:
+    """Liste ordonnée et dédoublonnée des colonnes à lire avec values_list()"""
+
+    def __init__(self):
+        self.paths = []
+        self._index = {}
+
+    def add(self, path):
+        if path not in self._index:
+            self._index[path] = len(self.paths)
+            self.paths.append(path)
+        return self._index[path]
+
+
+def _file_accessor(model_field, index):
+    storage = model_field.storage
+
+    def build(row, context):
+        name = row[index]
+        if not name:
+            return None
+        url = storage.url(name)
+        request = context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+    return build
+
+
+def _value_accessor(field, index):
+    if isinstance(field, IDENTITY_FIELDS):
+        return lambda row, context: row[index]
+
+    to_representation = field.to_representation
+
+    def build(row, context):
+        value = row[index]
+        if value is None:
+            return None
+        return to_representation(value)
+    return build
+
+
+def _compile_object(serializer, model, prefix, columns):
+    """Compiler les accesseurs d'un sérialiseur de modèle (imbriqué ou non)"""
+    accessors = []
+    pk_index = columns.add(prefix + model._meta.pk.name)
+
+    for name, field in serializer.fields.items():
+        source = field.source
+
+        if isinstance(field, serializers.ListSerializer) or isinstance(field, serializers.ManyRelatedField):
+            # Relation inverse (tests) : lue par une requête séparée
+            if prefix:
+                raise UnsupportedField(name)
+            accessors.append((name, _children_accessor(name, pk_index)))
+
+        elif isinstance(field, serializers.ModelSerializer):
+            related_model = model._meta.get_field(source).related_model
+            nested_prefix = f'{prefix}{source}__'
+            nested = _compile_object(field, related_model, nested_prefix, columns)
+            nested_pk = columns.add(nested_prefix + related_model._meta.pk.name)
+            accessors.append((name, _nested_accessor(nested, nested_pk)))
+
+        elif isinstance(field, serializers.PrimaryKeyRelatedField):
+            # values_list() renvoie directement la clé étrangère
+            index = columns.add(prefix + source)
+            accessors.append((name, lambda row, context, index=index: row[index]))
+
+        elif isinstance(field, serializers.SerializerMethodField):
+            try:
+                sources, compute = METHOD_FIELDS[(type(serializer), name)]
+            except KeyError:
+                raise UnsupportedField(name)
+            indexes = [columns.add(prefix + path) for path in sources]
+            accessors.append((name, _method_accessor(compute, indexes)))
+
+        elif isinstance(field, serializers.FileField):
+            model_field = model._meta.get_field(source)
+            accessors.append((name, _file_accessor(model_field, columns.add(prefix + source))))
+
+        elif isinstance(field, serializers.Serializer):
+            raise UnsupportedField(name)
+
+        else:
+            accessors.append((name, _value_accessor(field, columns.add(prefix + source))))
+
+    def build(row, context):
+        return {name: accessor(row, context) for name, accessor in accessors}
+    return build
+
+
+def _nested_accessor(build_nested, pk_index):
+    def build(row, context):
+        if row[pk_index] is None:
+            return None
+        return build_nested(row, context)
+    return build
+
+
+def _method_accessor(compute, indexes):
+    return lambda row, context: compute(*[row[i] for i in indexes])
+
+
+def _children_accessor(name, pk_index):
+    return lambda row, context: context['children'][name].get(row[pk_index], [])
+
+
+class _Plan:
+    """Plan de sérialisation compilé pour une combinaison fields/expand"""
+
+    def __init__(self, fields, expand):
+        serializer = MedicalRecordSerializer(
+            fields=None if fields is None else list(fields),
+            expand=None if expand is None else list(expand),
+        )
+        self.columns = _Columns()
+        self.build = _compile_object(serializer, MedicalRecord, '', self.columns)
+        self.pk_index = self.columns.add('id')
+        self.children = [self._compile_child(name, field) for name, field in self._children(serializer)]
+
+    @staticmethod
+    def _children(serializer):
+        return [
+            (name, field) for name, field in serializer.fields.items()
+            if isinstance(field, (serializers.ListSerializer, serializers.ManyRelatedField))
+        ]
+
+    @staticmethod
+    def _compile_child(name, field):
+        columns = _Columns()
+        fk_index = columns.add('record')
+        if isinstance(field, serializers.ManyRelatedField):
+            pk_index = columns.add('pk')
+            build = lambda row, context: row[pk_index]
+        else:
+            build = _compile_object(field.child, MedicalTest, '', columns)
+        return name, columns.paths, fk_index, build
+
+
+@lru_cache(maxsize=64)
+def _get_plan(fields, expand):
+    return _Plan(fields, expand)
+
+
+class MedicalRecordRowSerializer:
+    """
+    Équivalent en lecture seule de MedicalRecordSerializer(many=True).
+
+    values() prépare la requête ; serialize() convertit les lignes lues
+    (éventuellement paginées) en dictionnaires.
+    """
+
+    def __init__(self, fields=None, expand=None, context=None):
+        self.plan = _get_plan(
+            None if fields is None else tuple(fields),
+            None if expand is None else tuple(expand),
+        )
+        self.context = context or {}
+
+    def values(self, queryset):
+        return queryset.prefetch_related(None).values_list(*self.plan.columns.paths)
+
+    def serialize(self, rows):
+        rows = list(rows)
+        context = dict(self.context, children=self._load_children(rows))
+        build = self.plan.build
+        return [build(row, context) for row in rows]
+
+    def iter_serialize(self, queryset, chunk_size):
+        """Sérialiser au fil de l'eau par blocs lus sur un curseur serveur"""
+        chunk = []
+        for row in self.values(queryset).iterator(chunk_size=chunk_size):
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield from self.serialize(chunk)
+                chunk = []
+        if chunk:
+            yield from self.serialize(chunk)
+
+    def _load_children(self, rows):
+        loaded = {}
+        if not self.plan.children:
+            return loaded
+        record_ids = [row[self.plan.pk_index] for row in rows]
+        for name, paths, fk_index, build in self.plan.children:
+            grouped = {}
+            if record_ids:
+                queryset = MedicalTest.objects.filter(record_id__in=record_ids).order_by('pk')
+                for row in queryset.values_list(*paths):
+                    grouped.setdefault(row[fk_index], []).append(build(row, self.context))
+            loaded[name] = grouped
+        return loaded
+
+
+def get_row_serializer(fields=None, expand=None, context=None):
+    """Renvoyer un sérialiseur rapide, ou None si les champs demandés ne sont pas pris en charge"""
+    try:
+        return MedicalRecordRowSerializer(fields=fields, expand=expand, context=context)
+    except UnsupportedField:
+        return None
+
+
+class RowSerializerListMixin:
+    """
+    Mixin de vue servant les listes de dossiers par MedicalRecordRowSerializer.
+
+    S'appuie sur SparseFieldsetMixin pour ?fields= et ?expand= ; revient au
+    sérialiseur DRF si le chemin rapide est désactivé ou non applicable.
+    """
+
+    def get_row_serializer(self):
+        if not getattr(settings, 'MEDICAL_RECORDS_FAST_SERIALIZER', True):
+            return None
+        if not issubclass(self.get_serializer_class(), MedicalRecordSerializer):
+            return None
+        return get_row_serializer(
+            fields=self.get_sparse_fields(),
+            expand=self.get_expanded_relations(),
+            context=self.get_serializer_context(),
+        )
+
+    def serialize_records(self, queryset):
+        """Sérialiser une requête non paginée de dossiers"""
+        row_serializer = self.get_row_serializer()
+        if row_serializer is None:
+            return self.get_serializer(self.optimize_queryset(queryset), many=True).data
+        return row_serializer.serialize(row_serializer.values(queryset))
+
+    def iter_records(self, queryset, chunk_size):
+        """Sérialiser une requête de dossiers bloc par bloc, sans tout charger en mémoire"""
+        row_serializer = self.get_row_serializer()
+        if row_serializer is not None:
+            yield from row_serializer.iter_serialize(queryset, chunk_size)
+            return
+        for record in self.optimize_queryset(queryset).iterator(chunk_size=chunk_size):
+            yield self.get_serializer(record).data
+
+    def list(self, request, *args, **kwargs):
+        row_serializer = self.get_row_serializer()
+        if row_serializer is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = row_serializer.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(row_serializer.serialize(page))
+        return Response(row_serializer.serialize(queryset))
@@ -0,0 +1,87 @@
+"""
+Sélection partielle des champs (?fields=, ?expand=) pour les dossiers médicaux
+"""
+from django.db.models import Prefetch
+
+from .models import MedicalTest
+from .serializers import MedicalRecordSerializer
+
+# Champs de MedicalRecordSerializer adossés à une colonne de la table
+RECORD_COLUMNS = (
+    'id', 'patient', 'created_by', 'date', 'record_type', 'title',
+    'description', 'diagnosis', 'prescription', 'notes', 'file', 'is_emergency',
+)
+
+
+def parse_list_param(request, name):
+    """Lire un paramètre de type liste séparée par des virgules (None si absent)"""
+    if request is None:
+        # Génération du schéma OpenAPI hors requête
+        return None
+    raw = request.query_params.get(name)
+    if raw is None:
+        return None
+    return [item.strip() for item in raw.split(',') if item.strip()]
+
+
+class SparseFieldsetMixin:
+    """
+    Mixin de vue ajoutant ?fields= et ?expand= aux endpoints de dossiers.
+
+    Sans paramètre, la réponse reste identique à MedicalRecordSerializer.
+    Avec ?fields=, seuls les champs demandés sont sérialisés et lus en base.
+    Avec ?expand=, les relations non listées sont réduites à leurs identifiants.
+    """
+
+    def uses_sparse_fieldsets(self):
+        return True
+
+    def get_sparse_fields(self):
+        if not self.uses_sparse_fieldsets():
+            return None
+        return parse_list_param(self.request, 'fields')
+
+    def get_expanded_relations(self):
+        if not self.uses_sparse_fieldsets():
+            return None
+        return parse_list_param(self.request, 'expand')
+
+    def get_serializer(self, *args, **kwargs):
+        serializer_class = self.get_serializer_class()
+        if issubclass(serializer_class, MedicalRecordSerializer):
+            kwargs.setdefault('fields', self.get_sparse_fields())
+            kwargs.setdefault('expand', self.get_expanded_relations())
+        return super().get_serializer(*args, **kwargs)
+
+    def optimize_queryset(self, queryset):
+        """Restreindre les colonnes et les jointures à ce qui sera sérialisé"""
+        if not self.uses_sparse_fieldsets():
+            return queryset
+        fields = self.get_sparse_fields()
+        expand = self.get_expanded_relations()
+
+        wanted = set(RECORD_COLUMNS) | {'tests'} if fields is None else set(fields)
+        expanded = set(MedicalRecordSerializer.EXPANDABLE_FIELDS) if expand is None else set(expand)
+
+        if fields is not None:
+            # patient reste chargé pour les contrôles de permission par objet
+            columns = {'id', 'patient'} | {name for name in wanted if name in RECORD_COLUMNS}
+            queryset = queryset.only(*columns)
+
+        related = []
+        if 'patient' in wanted and 'patient' in expanded:
+            related.append('patient__user')
+        if 'created_by' in wanted and 'created_by' in expanded:
+            related.append('created_by__user')
+        if related:
+            queryset = queryset.select_related(*related)
+
+        if 'tests' in wanted:
+            if 'tests' in expanded:
+                queryset = queryset.prefetch_related('tests')
+            else:
+                queryset = queryset.prefetch_related(
+                    Prefetch('tests', queryset=MedicalTest.objects.only('id', 'record'))
+                )
+
+        return queryset
@@ -0,0 +1,36 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from medical_records.archive import archive_batch
+from medical_records.models import MedicalRecord
+
+
+class Command(BaseCommand):
+    help = "Déplacer en stockage froid compressé les dossiers plus anciens que le seuil"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-years', type=int, default=settings.MEDICAL_RECORDS_ARCHIVE_AFTER_YEARS)
+        parser.add_argument('--batch-size', type=int, default=settings.MEDICAL_RECORDS_ARCHIVE_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help="Compter sans archiver.")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=365 * options['older_than_years'])
+        candidates = MedicalRecord.objects.filter(date__lt=cutoff)
+
+        if options['dry_run']:
+            self.stdout.write(f"{candidates.count()} dossiers antérieurs au {cutoff:%d/%m/%Y} à archiver.")
+            return
+
+        archived = 0
+        while True:
+            # Une transaction par lot : les verrous restent courts
+            batch = list(candidates.order_by('date').prefetch_related('tests')[:options['batch_size']])
+            if not batch:
+                break
+            archived += archive_batch(batch)
+            self.stdout.write(f"{archived} dossiers archivés...")
+
+        self.stdout.write(self.style.SUCCESS(f"{archived} dossiers antérieurs au {cutoff:%d/%m/%Y} archivés."))
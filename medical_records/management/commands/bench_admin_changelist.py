@@ -0,0 +1,108 @@
+import time
+from datetime import date
+
+from django.contrib import admin
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from core.models import User, Doctor, Patient
+from medical_records.admin import MedicalRecordAdmin, MedicalTestAdmin
+from medical_records.models import MedicalRecord, MedicalTest
+
+
+class _Rollback(Exception):
+    pass
+
+
+class BaselineMedicalRecordAdmin(admin.ModelAdmin):
+    """Configuration d'origine : sans jointures, avec date_hierarchy et COUNT(*) complet"""
+    list_display = MedicalRecordAdmin.list_display
+    list_filter = MedicalRecordAdmin.list_filter
+    search_fields = MedicalRecordAdmin.search_fields
+    date_hierarchy = 'date'
+
+
+class BaselineMedicalTestAdmin(admin.ModelAdmin):
+    list_display = MedicalTestAdmin.list_display
+    list_filter = MedicalTestAdmin.list_filter
+    search_fields = MedicalTestAdmin.search_fields
+
+
+class Command(BaseCommand):
+    help = ("Comparer les listes de l'admin (dossiers, tests) avant et après optimisation : "
+            "requêtes SQL et temps de rendu sur un jeu de données généré puis annulé")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--records', type=int, default=5000)
+        parser.add_argument('--patients', type=int, default=200)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                superuser = self._seed(options['records'], options['patients'])
+                self._run(superuser, options['repeat'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _seed(self, records, patients):
+        superuser = User.objects.create_superuser(email='bench-admin@tohpitoh.local', password='bench-admin')
+        doctors = []
+        for i in range(5):
+            user = User.objects.create_user(email=f'bench-doctor-{i}@tohpitoh.local', user_type='doctor',
+                                            first_name='Docteur', last_name=str(i))
+            doctors.append(Doctor.objects.create(user=user, medical_license=f'BENCH-ADMIN-{i}',
+                                                 specialization='Généraliste'))
+        users = User.objects.bulk_create([
+            User(email=f'bench-patient-{i}@tohpitoh.local', first_name='Patient', last_name=str(i))
+            for i in range(patients)
+        ])
+        users = User.objects.filter(email__in=[user.email for user in users])
+        Patient.objects.bulk_create([Patient(user=user) for user in users])
+        profiles = list(Patient.objects.filter(user__in=users))
+
+        created = MedicalRecord.objects.bulk_create([
+            MedicalRecord(patient=profiles[i % len(profiles)], created_by=doctors[i % len(doctors)],
+                          record_type='consultation', title=f'Consultation {i}', description='Bilan')
+            for i in range(records)
+        ])
+        if created and created[0].pk is None:
+            created = MedicalRecord.objects.filter(title__startswith='Consultation ')
+        MedicalTest.objects.bulk_create([
+            MedicalTest(record=record, test_name='NFS', test_date=date(2024, 1, 1), result='Normal',
+                        lab_name='Laboratoire central')
+            for record in created
+        ])
+        return superuser
+
+    def _run(self, superuser, repeat):
+        pages = (
+            (MedicalRecord, BaselineMedicalRecordAdmin, {}),
+            (MedicalRecord, BaselineMedicalRecordAdmin, {'record_type': 'consultation'}),
+            (MedicalTest, BaselineMedicalTestAdmin, {}),
+        )
+        for model, baseline, params in pages:
+            url = f'/admin/{model._meta.app_label}/{model._meta.model_name}/'
+            self.stdout.write(url + ''.join(f'?{key}={value}' for key, value in params.items()))
+            for label, model_admin in (('avant', baseline(model, admin.site)), ('après', admin.site._registry[model])):
+                queries, best = self._measure(superuser, model_admin, url, params, repeat)
+                self.stdout.write(f"  {label:<6} {queries:>4} requêtes  {best * 1000:>8.1f} ms")
+
+    def _measure(self, superuser, model_admin, url, params, repeat):
+        best, queries = None, None
+        for _ in range(repeat):
+            request = RequestFactory().get(url, params, HTTP_HOST='localhost')
+            request.user = superuser
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = model_admin.changelist_view(request)
+                response.render()
+                elapsed = time.perf_counter() - start
+            if response.status_code != 200:
+                raise CommandError(f"{url} : statut {response.status_code}")
+            best = elapsed if best is None else min(best, elapsed)
+            queries = len(captured)
+        return queries, best
@@ -0,0 +1,103 @@
+import random
+import time
+from contextlib import contextmanager
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import override_settings
+
+from core.care_team import filter_for_care_team
+from core.models import CareTeamMembership, Doctor, Patient, User
+from medical_records.models import MedicalRecord
+
+
+class _Rollback(Exception):
+    pass
+
+
+@contextmanager
+def count_queries():
+    """Compteur de requêtes sans limite (CaptureQueriesContext n'en garde que 9000)"""
+    counter = [0]
+
+    def wrapper(execute, sql, params, many, context):
+        counter[0] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(wrapper):
+        yield counter
+
+
+class Command(BaseCommand):
+    help = ("Liste des dossiers d'un docteur restreinte à son équipe de soins : sous-requête Exists en base "
+            "contre filtrage objet par objet, selon le nombre de patients suivis (données générées puis annulées)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=5000)
+        parser.add_argument('--records-per-patient', type=int, default=4)
+        parser.add_argument('--followed', default='10,100,1000,5000', help="Patients suivis, séparés par des virgules.")
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--skip-python', action='store_true', help="Ne pas mesurer le filtrage objet par objet.")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                doctor_user, patients = self._seed(options['patients'], options['records_per_patient'])
+                with override_settings(CARE_TEAM_ENFORCEMENT=True):
+                    self._run(doctor_user, patients, options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _seed(self, count, records_per_patient):
+        doctor_user = User.objects.create_user(email='bench-care-doctor@tohpitoh.local', user_type='doctor')
+        doctor = Doctor.objects.create(user=doctor_user, medical_license='BENCH-CARE', specialization='Généraliste')
+        User.objects.bulk_create([
+            User(email=f'bench-care-{i}@tohpitoh.local', password='!', user_type='patient') for i in range(count)
+        ])
+        users = User.objects.filter(email__startswith='bench-care-', user_type='patient')
+        Patient.objects.bulk_create([Patient(user=user) for user in users])
+        patients = list(Patient.objects.filter(user__email__startswith='bench-care-').values_list('id', flat=True))
+        MedicalRecord.objects.bulk_create([
+            MedicalRecord(patient_id=patient_id, created_by=doctor, record_type='consultation', title=f'Visite {j}',
+                          description='Contrôle de routine.')
+            for patient_id in patients
+            for j in range(records_per_patient)
+        ], batch_size=5000)
+        return doctor_user, patients
+
+    def _run(self, doctor_user, patients, options):
+        doctor = Doctor.objects.get(user=doctor_user)
+        page_size = options['page_size']
+        rng = random.Random(0)
+        self.stdout.write(f"{len(patients)} patients, {MedicalRecord.objects.count()} dossiers")
+        self.stdout.write(f"{'suivis':>7} | {'Exists ms':>9} {'requêtes':>8} | {'objet par objet ms':>18} {'requêtes':>8}")
+
+        for followed in (int(value) for value in options['followed'].split(',')):
+            CareTeamMembership.objects.filter(doctor=doctor).delete()
+            CareTeamMembership.objects.bulk_create([
+                CareTeamMembership(doctor=doctor, patient_id=patient_id)
+                for patient_id in rng.sample(patients, min(followed, len(patients)))
+            ])
+
+            queryset = filter_for_care_team(MedicalRecord.objects.all(), doctor_user).order_by('-date', '-id')
+            with count_queries() as queries:
+                start = time.perf_counter()
+                total = queryset.count()
+                page = list(queryset[:page_size])
+                exists_time = time.perf_counter() - start
+            line = f"{followed:>7} | {exists_time * 1000:>9.1f} {queries[0]:>8} |"
+
+            if not options['skip_python']:
+                # Contrôle par objet après lecture de tous les dossiers : une requête d'appartenance par dossier
+                with count_queries() as python_queries:
+                    start = time.perf_counter()
+                    allowed = [
+                        record for record in MedicalRecord.objects.order_by('-date', '-id').iterator(chunk_size=2000)
+                        if CareTeamMembership.objects.filter(doctor=doctor, patient_id=record.patient_id).exists()
+                    ]
+                    python_time = time.perf_counter() - start
+                assert len(allowed) == total and [record.pk for record in allowed[:page_size]] == [
+                    record.pk for record in page]
+                line += f" {python_time * 1000:>18.1f} {python_queries[0]:>8}"
+            self.stdout.write(line)
@@ -0,0 +1,83 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from core.compression import ENCODERS, get_encoder
+from medical_records.exports import ndjson_stream
+from medical_records.models import MedicalRecord
+from medical_records.serializers import MedicalRecordSerializer
+from .bench_record_serializers import Command as SerializerBenchmark
+
+LEVELS = {
+    'gzip': (1, 5, 6, 9),
+    'br': (1, 4, 6, 11),
+    'zstd': (1, 3, 9, 19),
+}
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Octets économisés et coût CPU de chaque encodage et niveau, sur une page de liste "
+            "(corps complet) et un export NDJSON (flux) de dossiers générés puis annulés")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2000)
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                SerializerBenchmark()._seed(options['rows'], tests_per_record=2)
+                page, chunks = self._payloads(options['page_size'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        self.stdout.write(f"Page de liste : {len(page)} octets ; export : {sum(map(len, chunks))} octets "
+                          f"en {len(chunks)} blocs")
+        self.stdout.write(f"{'encodage':<6} {'niv.':>4} | {'page':>8} {'taux':>6} {'ms':>7} | "
+                          f"{'export':>9} {'taux':>6} {'ms':>8} {'Mo/s':>7}")
+        for name, encoder_class in ENCODERS.items():
+            if encoder_class is None:
+                self.stdout.write(f"{name:<6} non installé")
+                continue
+            for level in LEVELS[name]:
+                encoder = get_encoder(name, level)
+                page_size, page_time = self._measure(lambda: encoder.compress(page), options['repeat'])
+                export_size, export_time = self._measure(lambda: b''.join(encoder.stream(chunks)), options['repeat'])
+                total = sum(map(len, chunks))
+                self.stdout.write(
+                    f"{name:<6} {level:>4} | {page_size:>8} {page_size / len(page):>6.1%} {page_time * 1000:>7.2f} | "
+                    f"{export_size:>9} {export_size / total:>6.1%} {export_time * 1000:>8.1f} "
+                    f"{total / export_time / 1e6:>7.1f}"
+                )
+
+    def _payloads(self, page_size):
+        request = Request(APIRequestFactory().get('/api/medical-records/', HTTP_HOST='localhost'))
+        context = {'request': request}
+        records = (MedicalRecord.objects.select_related('patient__user', 'created_by__user')
+                   .prefetch_related('tests'))
+        page = JSONRenderer().render({
+            'count': records.count(), 'next': None, 'previous': None,
+            'results': MedicalRecordSerializer(records[:page_size], many=True, context=context).data,
+        })
+        chunks = list(ndjson_stream(MedicalRecordSerializer(records, many=True, context=context).data))
+        return page, chunks
+
+    @staticmethod
+    def _measure(compress, repeat):
+        best, size = None, None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            size = len(compress())
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return size, best
@@ -0,0 +1,79 @@
+import io
+import time
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+
+from medical_records.models import MedicalRecord, MedicalTest
+from medical_records.pdf_export import records_for_pdf
+from medical_records.pdf_generator import (
+    fragment_cache_key, generate_medical_record_pdf, generate_medical_record_pdf_incremental,
+)
+from .bench_pdf_render import Command as RenderBenchmark
+
+
+class _Rollback(Exception):
+    pass
+
+
+def page_count(buffer):
+    from pypdf import PdfReader
+
+    return len(PdfReader(io.BytesIO(buffer.getvalue())).pages)
+
+
+class Command(BaseCommand):
+    help = ("Carnet PDF complet contre assemblage incrémental à partir de fragments en cache, "
+            "avant et après une nouvelle consultation (dossiers générés puis annulés)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--records', type=int, default=600)
+
+    def handle(self, *args, **options):
+        cache_settings = settings.CACHES
+        if cache_settings['pdf_fragments']['BACKEND'].endswith('LocMemCache'):
+            # Cache local borné : de quoi garder tout l'historique
+            cache_settings = {**cache_settings, 'pdf_fragments': {
+                **cache_settings['pdf_fragments'], 'OPTIONS': {'MAX_ENTRIES': 10 * options['records']}}}
+        try:
+            with override_settings(CACHES=cache_settings), transaction.atomic():
+                patient = RenderBenchmark()._seed(options['records'])
+                self._run(patient)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _timed(self, label, render, records, patient):
+        keys = [fragment_cache_key(record) for record in records]
+        cache = caches['pdf_fragments']
+        rendered = len(keys) - len(cache.get_many(keys)) if render is not generate_medical_record_pdf else len(keys)
+        start = time.perf_counter()
+        buffer = render(records, patient)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"{label:<34} {elapsed * 1000:>9.0f} ms  {rendered:>5} dossiers rendus  "
+                          f"{page_count(buffer):>4} pages  {len(buffer.getvalue()) / 1024:>8.0f} Ko")
+        return elapsed
+
+    def _run(self, patient):
+        records = list(records_for_pdf(patient))
+        caches['pdf_fragments'].delete_many([fragment_cache_key(record) for record in records])
+
+        full = self._timed("Rendu complet", generate_medical_record_pdf, records, patient)
+        self._timed("Incrémental, cache vide", generate_medical_record_pdf_incremental, records, patient)
+        self._timed("Incrémental, cache plein", generate_medical_record_pdf_incremental, records, patient)
+
+        # Nouvelle consultation : un seul fragment à rendre
+        record = MedicalRecord.objects.create(
+            patient=patient, created_by=records[0].created_by, record_type='consultation',
+            title='Nouvelle consultation', description='Contrôle.', diagnosis='RAS',
+        )
+        MedicalTest.objects.create(record=record, test_name='Glycémie', test_date=date.today(), result='0,9 g/L')
+        records = list(records_for_pdf(patient))
+        after = self._timed("Incrémental, une nouvelle visite", generate_medical_record_pdf_incremental,
+                            records, patient)
+        self.stdout.write(f"Gain après une visite : x{full / after:.1f}")
+        caches['pdf_fragments'].delete_many([fragment_cache_key(record) for record in records])
@@ -0,0 +1,83 @@
+import io
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from PIL import Image, ImageDraw, ImageFilter
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+from medical_records.pdf_export import records_for_pdf
+from medical_records.pdf_generator import generate_medical_record_pdf
+from medical_records.pdf_optimize import font_report, optimize_pdf
+from .bench_pdf_render import Command as RenderBenchmark
+
+
+class _Rollback(Exception):
+    pass
+
+
+def scanned_pages(count, seed=0):
+    """PDF de pages scannées en pleine page (A4 à 300 dpi, JPEG qualité 95), comme des pièces jointes"""
+    rng = random.Random(seed)
+    width, height = 2480, 3508
+    buffer = io.BytesIO()
+    document = canvas.Canvas(buffer, pagesize=A4)
+    for page in range(count):
+        scan = Image.new('RGB', (width, height), (250, 248, 240))
+        draw = ImageDraw.Draw(scan)
+        for line in range(120):
+            y = 200 + line * 26
+            draw.rectangle((180, y, 180 + rng.randint(600, 2100), y + 12), fill=(40, 40, 60))
+        scan = scan.filter(ImageFilter.GaussianBlur(1.2))
+        image = io.BytesIO()
+        scan.save(image, 'JPEG', quality=95)
+        image.seek(0)
+        document.drawImage(ImageReader(image), 0, 0, width=A4[0], height=A4[1])
+        document.showPage()
+    document.save()
+    return buffer.getvalue()
+
+
+class Command(BaseCommand):
+    help = ("Taille et temps de l'étape d'optimisation PDF sur des carnets petits et grands "
+            "(dossiers générés puis annulés) et sur des pages scannées")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='5,100,1000', help="Nombres de dossiers des carnets, séparés par des virgules.")
+        parser.add_argument('--scans', type=int, default=4, help="Pages scannées du dernier document.")
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        self.stdout.write(f"{'document':<22} {'rendu ms':>9} | {'avant Ko':>9} {'après Ko':>9} {'gain':>6} "
+                          f"{'optim. ms':>9} | polices")
+        try:
+            with transaction.atomic():
+                patient = RenderBenchmark()._seed(max(sizes))
+                records = list(records_for_pdf(patient))
+                for size in sizes:
+                    with override_settings(PDF_OPTIMIZE_ENABLED=False):
+                        start = time.perf_counter()
+                        data = generate_medical_record_pdf(records[:size], patient).getvalue()
+                        render_time = time.perf_counter() - start
+                    self._report(f"carnet, {size} dossiers", data, render_time)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        start = time.perf_counter()
+        data = scanned_pages(options['scans'])
+        self._report(f"{options['scans']} pages scannées", data, time.perf_counter() - start)
+
+    def _report(self, label, data, render_time):
+        start = time.perf_counter()
+        optimized = optimize_pdf(data)
+        optimize_time = time.perf_counter() - start
+        fonts = ', '.join(f"{name}{'' if subset else ' (complète)'}" for name, subset in font_report(optimized))
+        self.stdout.write(
+            f"{label:<22} {render_time * 1000:>9.0f} | {len(data) / 1024:>9.0f} {len(optimized) / 1024:>9.0f} "
+            f"{1 - len(optimized) / len(data):>6.1%} {optimize_time * 1000:>9.0f} | {fonts or '-'}"
+        )
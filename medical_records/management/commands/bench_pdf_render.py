@@ -0,0 +1,83 @@
+import multiprocessing
+import time
+from datetime import date
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+
+from core.models import User, Doctor, Patient
+from medical_records.models import MedicalRecord, MedicalTest
+from medical_records.pdf_export import records_for_pdf
+from medical_records.pdf_generator import (
+    fragment_cache_key, generate_medical_record_pdf, generate_medical_record_pdf_incremental,
+)
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Carnet PDF complet contre fragments rendus en série puis dans le pool de processus "
+            "(cache de fragments vide, dossiers générés puis annulés)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--records', type=int, default=600)
+        parser.add_argument('--chunk-size', type=int, default=50)
+        parser.add_argument('--max-workers', type=int, default=multiprocessing.cpu_count(),
+                            help="Taille du pool de rendu PDF.")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                patient = self._seed(options['records'])
+                self._run(patient, options['chunk_size'], options['max_workers'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _seed(self, count):
+        doctor_user = User.objects.create_user(email='bench-doctor@tohpitoh.local', user_type='doctor',
+                                               first_name='Bench', last_name='Docteur')
+        doctor = Doctor.objects.create(user=doctor_user, medical_license='BENCH-0001', specialization='Généraliste')
+        user = User.objects.create_user(email='bench-patient@tohpitoh.local', first_name='Patient', last_name='Bench')
+        patient = Patient.objects.create(user=user, blood_type='A+', height=170, weight=70)
+
+        records = MedicalRecord.objects.bulk_create([
+            MedicalRecord(
+                patient=patient, created_by=doctor, record_type='consultation',
+                title=f'Consultation {i}',
+                description='Douleurs abdominales depuis trois jours, sans fièvre. ' * 8,
+                diagnosis='Gastro-entérite', prescription='Réhydratation orale', notes='Revoir dans une semaine',
+            )
+            for i in range(count)
+        ])
+        MedicalTest.objects.bulk_create([
+            MedicalTest(record=record, test_name=f'NFS {j}', test_date=date(2024, 1, 1 + j),
+                        result='Normal', normal_range='4-10')
+            for record in records
+            for j in range(2)
+        ])
+        return Patient.objects.select_related('user').get(pk=patient.pk)
+
+    def _run(self, patient, chunk_size, max_workers):
+        records = list(records_for_pdf(patient))
+        keys = [fragment_cache_key(record) for record in records]
+
+        start = time.perf_counter()
+        generate_medical_record_pdf(records, patient)
+        baseline = time.perf_counter() - start
+        self.stdout.write(f"{len(records)} dossiers, rendu complet : {baseline:.2f} s")
+
+        # Pool partagé créé au premier rendu parallèle, à la taille demandée
+        with override_settings(PDF_PARALLEL_MIN_RECORDS=0, PDF_PARALLEL_CHUNK_SIZE=chunk_size,
+                               PDF_EXPORT_MAX_WORKERS=max_workers):
+            for label, workers in (("fragments en série", 1), (f"fragments, {max_workers} processus", None)):
+                caches['pdf_fragments'].delete_many(keys)
+                start = time.perf_counter()
+                generate_medical_record_pdf_incremental(records, patient, max_workers=workers)
+                elapsed = time.perf_counter() - start
+                self.stdout.write(f"{label:<24} : {elapsed:.2f} s (x{baseline / elapsed:.2f})")
+        caches['pdf_fragments'].delete_many(keys)
@@ -0,0 +1,93 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from core.models import User, Doctor, Patient
+from medical_records.models import MedicalRecord, MedicalTest
+from medical_records.serializers import MedicalRecordSerializer
+from medical_records.fast_serializers import MedicalRecordRowSerializer
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Comparer MedicalRecordSerializer et MedicalRecordRowSerializer (parité et lignes/s)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2000)
+        parser.add_argument('--tests-per-record', type=int, default=2)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._seed(options['rows'], options['tests_per_record'])
+                self._run(options['repeat'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _seed(self, rows, tests_per_record):
+        doctor_user = User.objects.create_user(email='bench-doctor@tohpitoh.local', user_type='doctor',
+                                               first_name='Bench', last_name='Docteur')
+        doctor = Doctor.objects.create(user=doctor_user, medical_license='BENCH-0001', specialization='Généraliste')
+        patients = []
+        for i in range(10):
+            user = User.objects.create_user(email=f'bench-patient-{i}@tohpitoh.local', first_name='Patient',
+                                            last_name=str(i), date_of_birth=date(1980, 1, 1 + i))
+            patients.append(Patient.objects.create(user=user, blood_type='A+', height=160 + i, weight=60 + i,
+                                                   allergies='Pénicilline'))
+
+        records = MedicalRecord.objects.bulk_create([
+            MedicalRecord(
+                patient=patients[i % len(patients)],
+                created_by=doctor if i % 3 else None,
+                record_type='consultation',
+                title=f'Consultation {i}',
+                description='Douleurs abdominales depuis trois jours. ' * 10,
+                diagnosis='Gastro-entérite',
+                prescription='Réhydratation orale',
+                notes='Revoir dans une semaine',
+                file=f'medical_files/bench/{i}.pdf' if i % 5 == 0 else None,
+            )
+            for i in range(rows)
+        ])
+        MedicalTest.objects.bulk_create([
+            MedicalTest(record=record, test_name=f'NFS {j}', test_date=date(2024, 1, 1 + j),
+                        result='Normal', unit='g/L', normal_range='4-10', lab_name='Laboratoire central')
+            for record in records
+            for j in range(tests_per_record)
+        ])
+
+    def _run(self, repeat):
+        request = Request(APIRequestFactory().get('/api/medical-records/', HTTP_HOST='localhost'))
+        context = {'request': request}
+        queryset = MedicalRecord.objects.all()
+        count = queryset.count()
+
+        def drf():
+            optimized = queryset.select_related('patient__user', 'created_by__user').prefetch_related('tests')
+            return MedicalRecordSerializer(optimized, many=True, context=context).data
+
+        def fast():
+            row_serializer = MedicalRecordRowSerializer(context=context)
+            return row_serializer.serialize(row_serializer.values(queryset))
+
+        if [dict(item) for item in drf()] != fast():
+            raise CommandError("Les sorties des deux sérialiseurs diffèrent.")
+        self.stdout.write(f"Parité vérifiée sur {count} dossiers.")
+
+        for label, serialize in (('MedicalRecordSerializer', drf), ('MedicalRecordRowSerializer', fast)):
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                serialize()
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            self.stdout.write(f"{label:<28} {count / best:>10.0f} lignes/s ({best * 1000:.1f} ms)")
@@ -0,0 +1,82 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+
+from core.singleflight import coalesce, request_key
+from medical_records.pdf_export import carnet_version, records_for_pdf
+from medical_records.pdf_generator import generate_medical_record_pdf
+from .bench_pdf_render import Command as RenderBenchmark
+
+
+class _Rollback(Exception):
+    pass
+
+
+def run_concurrently(count, call):
+    """Lancer count appels simultanés ; renvoie (durée, résultats, exceptions)"""
+    barrier = threading.Barrier(count)
+    results, errors = [], []
+
+    def worker():
+        barrier.wait()
+        try:
+            results.append(call())
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=worker) for _ in range(count)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, results, errors
+
+
+class Command(BaseCommand):
+    help = ("Téléchargements simultanés du même carnet PDF, avec et sans regroupement (single-flight), "
+            "sur des dossiers générés puis annulés")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--records', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=8)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                patient = RenderBenchmark()._seed(options['records'])
+                self._run(patient, list(records_for_pdf(patient)), options['concurrency'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, patient, records, concurrency):
+        key = request_key('bench-pdf-carnet', patient.pk, {}, carnet_version(patient))
+        renders = []
+
+        def render():
+            renders.append(1)
+            return generate_medical_record_pdf(records, patient).getvalue()
+
+        self.stdout.write(f"{len(records)} dossiers, {concurrency} téléchargements simultanés")
+        for label, enabled in (("sans regroupement", False), ("avec regroupement", True)):
+            renders.clear()
+            with override_settings(SINGLEFLIGHT_ENABLED=enabled, SINGLEFLIGHT_RESULT_SECONDS=0):
+                elapsed, results, errors = run_concurrently(concurrency, lambda: coalesce(key, render))
+            if errors:
+                raise CommandError(f"{label} : {errors[0]!r}")
+            shared = sum(1 for _, was_shared in results if was_shared)
+            self.stdout.write(f"{label:<18} {elapsed * 1000:>9.0f} ms  {len(renders)} rendus, {shared} partagés")
+
+        def failing():
+            time.sleep(0.2)
+            raise ValueError("échec du rendu")
+
+        with override_settings(SINGLEFLIGHT_ENABLED=True):
+            _, results, errors = run_concurrently(concurrency, lambda: coalesce(key + ':échec', failing))
+        if results or len(errors) != concurrency:
+            raise CommandError("L'échec du meneur aurait dû être transmis à toutes les requêtes.")
+        self.stdout.write(self.style.SUCCESS(f"Échec du meneur transmis aux {concurrency} requêtes."))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from core.models import Patient
+from medical_records.emergency import build_card
+
+
+class Command(BaseCommand):
+    help = ("Construire les fiches d'urgence manquantes (patients importés en masse, données antérieures) "
+            "ou, avec --all, recalculer toutes les fiches")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Recalculer aussi les fiches existantes.")
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        patients = Patient.objects.select_related('user').order_by('pk')
+        if not options['all']:
+            patients = patients.filter(emergency_card__isnull=True)
+        built = 0
+        for patient in patients.iterator(chunk_size=options['chunk_size']):
+            build_card(patient)
+            built += 1
+        self.stdout.write(self.style.SUCCESS(f"{built} fiches d'urgence construites."))
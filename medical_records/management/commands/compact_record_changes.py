@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from medical_records.changes import compact
+from medical_records.models import RecordChange
+
+
+class Command(BaseCommand):
+    help = ("Compacter le journal de synchronisation : une entrée par objet, "
+            "rien au-delà de la durée de validité des jetons")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, default=settings.SYNC_RETENTION_DAYS)
+        parser.add_argument('--dry-run', action='store_true', help="Compter sans supprimer.")
+
+    def handle(self, *args, **options):
+        expired, superseded = compact(options['retention_days'], dry_run=options['dry_run'])
+        verb = "à supprimer" if options['dry_run'] else "supprimées"
+        self.stdout.write(f"{expired} entrées hors rétention et {superseded} entrées remplacées {verb}.")
+        self.stdout.write(self.style.SUCCESS(f"{RecordChange.objects.count()} entrées dans le journal."))
@@ -0,0 +1,66 @@
+import argparse
+import os
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from medical_records.analytics_export import FORMATS, TABLES, ExportStats, export_parallel, export_to_file
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class Command(BaseCommand):
+    help = ("Exporter les dossiers et les tests en CSV ou NDJSON pour l'analyse (curseur côté serveur, "
+            "patients pseudonymisés par défaut), éventuellement par tranches de dates en parallèle")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--table', choices=[*TABLES, 'all'], default='all')
+        parser.add_argument('--format', choices=list(FORMATS), default='csv')
+        parser.add_argument('--output-dir', default='.')
+        parser.add_argument('--since', type=date.fromisoformat, help="Date de début incluse (AAAA-MM-JJ).")
+        parser.add_argument('--until', type=date.fromisoformat, help="Date de fin exclue (AAAA-MM-JJ).")
+        parser.add_argument('--pseudonymize', action=argparse.BooleanOptionalAction, default=True,
+                            help="Remplacer l'identifiant du patient par un pseudonyme HMAC.")
+        parser.add_argument('--parallel', type=int, default=0,
+                            help="Nombre de tranches de dates exportées en parallèle (0 = un seul fichier).")
+        parser.add_argument('--chunk-size', type=int, default=settings.ANALYTICS_EXPORT_CHUNK_SIZE)
+        parser.add_argument('--database', help="Alias de la base lue (par défaut un réplica s'il y en a un).")
+
+    def handle(self, *args, **options):
+        directory = options['output_dir']
+        if not os.path.isdir(directory):
+            raise CommandError(f"Répertoire introuvable : {directory}")
+        if options['parallel'] < 0:
+            raise CommandError("--parallel doit être positif.")
+
+        extension = FORMATS[options['format']][1]
+        tables = list(TABLES) if options['table'] == 'all' else [options['table']]
+        common = dict(start=options['since'], end=options['until'], pseudonymize=options['pseudonymize'],
+                      chunk_size=options['chunk_size'], using=options['database'])
+        total = ExportStats()
+
+        for table in tables:
+            if options['parallel']:
+                files = export_parallel(table, options['format'], directory, options['parallel'], **common)
+            else:
+                path = os.path.join(directory, f'{table}.{extension}')
+                files = [(path, export_to_file(table, options['format'], path, **common))]
+            table_stats = ExportStats()
+            for path, stats in files:
+                self.stdout.write(f"{path} : {stats}")
+                table_stats.add(stats)
+            self.stdout.write(f"{table} : {table_stats}")
+            # Les tables sont exportées l'une après l'autre : les durées s'additionnent
+            total.rows += table_stats.rows
+            total.size += table_stats.size
+            total.seconds += table_stats.seconds
+
+        message = f"Total : {total}"
+        if resource is not None:
+            # ru_maxrss : kilo-octets sous Linux ; processus principal uniquement
+            message += f" ; mémoire maximale {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} Mo"
+        self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from core.partitioning import ensure_partitions, is_partitioned, list_partitions, next_period, \
+    partition_existing_table, period_start, supports_partitioning
+from medical_records.models import MedicalRecord, MedicalTest
+
+# Table, colonne de partitionnement (partitions annuelles), clés étrangères entrantes à supprimer :
+# MedicalTest.record perd sa contrainte en base (la cascade reste assurée par l'ORM)
+PARTITIONED_TABLES = (
+    (MedicalRecord._meta.db_table, 'date', True),
+    (MedicalTest._meta.db_table, 'test_date', False),
+)
+
+
+class Command(BaseCommand):
+    help = ("Partitionner par année les dossiers et tests (PostgreSQL), puis créer les "
+            "partitions des années à venir ; sans risque à relancer")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--years-ahead', type=int, default=settings.MEDICAL_RECORDS_PARTITION_YEARS_AHEAD)
+        parser.add_argument('--dry-run', action='store_true', help="Afficher le SQL de conversion sans l'exécuter.")
+
+    def handle(self, *args, **options):
+        if not supports_partitioning(connection):
+            self.stdout.write("Base sans partitionnement (PostgreSQL requis) : rien à faire.")
+            return
+
+        for table, column, drop_incoming in PARTITIONED_TABLES:
+            if not is_partitioned(connection, table):
+                try:
+                    statements = partition_existing_table(
+                        connection, table, column, interval='year',
+                        periods_ahead=options['years_ahead'], drop_incoming=drop_incoming,
+                        dry_run=options['dry_run'],
+                    )
+                except ValueError as exc:
+                    raise CommandError(str(exc))
+                if options['dry_run']:
+                    self.stdout.write(';\n'.join(statements) + ';\n')
+                    continue
+                self.stdout.write(f"{table} partitionnée sur {column}.")
+            elif not options['dry_run']:
+                start = period_start(timezone.now(), 'year')
+                end = start
+                for _ in range(options['years_ahead'] + 1):
+                    end = next_period(end, 'year')
+                for name in ensure_partitions(connection, table, start, end, interval='year'):
+                    self.stdout.write(f"Partition créée : {name}")
+            self.stdout.write(f"{table} : {len(list_partitions(connection, table))} partitions.")
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.30 on 2026-10-19 18:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('medical_records', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedMedicalRecord',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('date', models.DateTimeField()),
+                ('record_type', models.CharField(choices=[('consultation', 'Consultation'), ('prescription', 'Ordonnance'), ('test', 'Test Médical'), ('vaccination', 'Vaccination'), ('surgery', 'Chirurgie'), ('hospitalization', 'Hospitalisation'), ('other', 'Autre')], max_length=20)),
+                ('title', models.CharField(max_length=200)),
+                ('payload', models.BinaryField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='medicaltest',
+            name='record',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='tests', to='medical_records.medicalrecord'),
+        ),
+        migrations.AddIndex(
+            model_name='medicalrecord',
+            index=models.Index(fields=['patient', '-date'], name='record_patient_date_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedmedicalrecord',
+            name='patient',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_records', to='core.patient'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedmedicalrecord',
+            index=models.Index(fields=['patient', '-date'], name='archived_patient_date_idx'),
+        ),
+    ]
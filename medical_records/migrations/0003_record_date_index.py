@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-19 18:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_records', '0002_partitioning_archive'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='medicalrecord',
+            index=models.Index(fields=['-date', '-id'], name='record_date_idx'),
+        ),
+    ]
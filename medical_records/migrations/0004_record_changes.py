@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-19 18:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_records', '0003_record_date_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.CreateModel(
+            name='RecordChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('record', 'Dossier'), ('test', 'Test')], max_length=10)),
+                ('object_id', models.BigIntegerField()),
+                ('patient_id', models.BigIntegerField()),
+                ('operation', models.CharField(choices=[('upsert', 'Création ou modification'), ('delete', 'Suppression')], max_length=10)),
+                ('changed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['patient_id', 'id'], name='record_change_patient_idx'), models.Index(fields=['kind', 'object_id'], name='record_change_object_idx'), models.Index(fields=['changed_at'], name='record_change_time_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+def install_search(apps, schema_editor):
+    # PostgreSQL : tsvector + GIN ; SQLite : table FTS5 (voir medical_records.search)
+    from medical_records.search import install
+    install(schema_editor)
+
+
+def uninstall_search(apps, schema_editor):
+    from medical_records.search import uninstall
+    uninstall(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_records', '0004_record_changes'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search, uninstall_search),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-19 18:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_care_team_membership'),
+        ('medical_records', '0005_clinical_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmergencyCard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payload', models.BinaryField()),
+                ('etag', models.CharField(max_length=66)),
+                ('token_hash', models.CharField(blank=True, max_length=64, null=True, unique=True)),
+                ('token_created_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('patient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='emergency_card', to='core.patient')),
+            ],
+        ),
+    ]
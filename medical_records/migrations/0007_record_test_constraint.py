@@ -0,0 +1,35 @@
+# Generated by Django 4.2.30 on 2026-10-19 19:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class AlterFieldUnlessPartitioned(migrations.AlterField):
+    """Contrainte rétablie sauf si les dossiers sont déjà partitionnés (clé (id, date), aucune référence possible)"""
+
+    def partitioned(self, schema_editor):
+        from core.partitioning import is_partitioned
+        return is_partitioned(schema_editor.connection, 'medical_records_medicalrecord')
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if not self.partitioned(schema_editor):
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if not self.partitioned(schema_editor):
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_records', '0006_emergency_card'),
+    ]
+
+    operations = [
+        AlterFieldUnlessPartitioned(
+            model_name='medicaltest',
+            name='record',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tests', to='medical_records.medicalrecord'),
+        ),
+    ]
@@ -23,14 +23,22 @@ class MedicalRecord(models.Model):
     notes = models.TextField(blank=True)
     file = models.FileField(upload_to='medical_files/%Y/%m/%d/', blank=True, null=True)
     is_emergency = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['patient', '-date'], name='record_patient_date_idx'),
+            # Tri par défaut des listes (admin : -date puis -pk)
+            models.Index(fields=['-date', '-id'], name='record_date_idx'),
+        ]
     
     def __str__(self):
         return f"{self.title} - {self.patient.user.get_full_name()}"
 
 class MedicalTest(models.Model):
+    # Contrainte en base supprimée seulement par manage.py partition_medical_records (la clé de
+    # MedicalRecord partitionnée devient (id, date)) ; la suppression en cascade reste assurée par l'ORM
     record = models.ForeignKey(MedicalRecord, on_delete=models.CASCADE, related_name='tests')
     test_name = models.CharField(max_length=200)
     test_date = models.DateField()
@@ -41,4 +49,81 @@ class MedicalTest(models.Model):
     file = models.FileField(upload_to='test_results/%Y/%m/%d/', blank=True, null=True)
     
     def __str__(self):
-        return f"{self.test_name} - {self.record.patient.user.get_full_name()}"
\ No newline at end of file
+        return f"{self.test_name} - {self.record.patient.user.get_full_name()}"
+
+class ArchivedMedicalRecord(models.Model):
+    """
+    Dossier ancien déplacé en stockage froid (manage.py archive_medical_records).
+
+    Le dossier et ses tests sont conservés en JSON compressé (zlib) sous leur
+    identifiant d'origine ; seules les colonnes utiles au tri et au filtrage
+    restent en clair.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='archived_records')
+    date = models.DateTimeField()
+    record_type = models.CharField(max_length=20, choices=MedicalRecord.RECORD_TYPE_CHOICES)
+    title = models.CharField(max_length=200)
+    payload = models.BinaryField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-date']
+        indexes = [
+            models.Index(fields=['patient', '-date'], name='archived_patient_date_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.title} (archivé)"
+
+class RecordChange(models.Model):
+    """
+    Journal des créations, modifications et suppressions de dossiers et de tests.
+
+    Alimenté par signaux (medical_records.changes) ; l'identifiant croissant
+    sert de position aux jetons de synchronisation. compact_record_changes ne
+    garde que la dernière entrée de chaque objet sur la fenêtre de rétention.
+    """
+    KIND_CHOICES = (
+        ('record', 'Dossier'),
+        ('test', 'Test'),
+    )
+    OPERATION_CHOICES = (
+        ('upsert', 'Création ou modification'),
+        ('delete', 'Suppression'),
+    )
+    
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    # Identifiant simple : l'entrée survit au patient et à l'objet supprimés
+    patient_id = models.BigIntegerField()
+    operation = models.CharField(max_length=10, choices=OPERATION_CHOICES)
+    changed_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient_id', 'id'], name='record_change_patient_idx'),
+            models.Index(fields=['kind', 'object_id'], name='record_change_object_idx'),
+            models.Index(fields=['changed_at'], name='record_change_time_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_operation_display()} {self.kind} #{self.object_id}"
+
+class EmergencyCard(models.Model):
+    """
+    Fiche d'urgence précalculée d'un patient (medical_records.emergency).
+
+    payload est le JSON compact servi tel quel, etag son empreinte. Le jeton
+    d'accès public (QR code) n'est pas conservé : seule son empreinte SHA-256
+    l'est, et la remplacer ou l'effacer révoque l'accès.
+    """
+    patient = models.OneToOneField(Patient, on_delete=models.CASCADE, related_name='emergency_card')
+    payload = models.BinaryField()
+    etag = models.CharField(max_length=66)
+    token_hash = models.CharField(max_length=64, unique=True, null=True, blank=True)
+    token_created_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Fiche d'urgence du patient #{self.patient_id}"
@@ -0,0 +1,128 @@
+"""
+Export PDF groupé de plusieurs patients, rendu en parallèle et servi en ZIP
+"""
+import hashlib
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from django.conf import settings
+from django.utils.text import slugify
+
+from core.models import Patient
+from core.process_pool import get_max_workers, shared_process_pool
+from .models import MedicalRecord
+from .archive import archived_records_for
+from .changes import latest_position
+
+
+def records_for_pdf(patient):
+    """Dossiers d'un patient avec tout ce que le générateur PDF va lire"""
+    return (MedicalRecord.objects.filter(patient=patient)
+            .select_related('created_by__user')
+            .prefetch_related('tests'))
+
+
+def full_history_for_pdf(patient):
+    """Historique complet : dossiers courants puis dossiers archivés"""
+    return list(records_for_pdf(patient)) + archived_records_for(patient)
+
+
+def carnet_version(patient):
+    """Version du carnet : dernière écriture journalisée des dossiers et champs de l'en-tête patient"""
+    user = patient.user
+    header = (user.first_name, user.last_name, user.email, user.phone_number, user.address, user.date_of_birth,
+              patient.blood_type, patient.allergies, patient.chronic_diseases, patient.height, patient.weight,
+              patient.emergency_contact)
+    digest = hashlib.sha1(repr(header).encode()).hexdigest()[:16]
+    return f'{latest_position(patient.pk)}:{digest}'
+
+
+def render_patient_pdf(patient_id):
+    """Tâche exécutée dans un processus du pool : PDF complet d'un patient"""
+    from .pdf_generator import generate_medical_record_pdf_incremental
+
+    patient = Patient.objects.select_related('user').get(pk=patient_id)
+    # Déjà dans un processus du pool : fragments manquants rendus sur place
+    return generate_medical_record_pdf_incremental(full_history_for_pdf(patient), patient, max_workers=1).getvalue()
+
+
+def cohort_filename(patient_id, last_name):
+    return f"carnet_medical_{slugify(last_name) or 'patient'}_{patient_id}.pdf"
+
+
+class _ZipStream:
+    """Flux d'écriture non positionnable dont on vide le contenu au fil de l'eau"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def pdf_pool():
+    """Pool des rendus PDF du worker, partagé par toutes les requêtes"""
+    return shared_process_pool('pdf', max_workers=get_max_workers(settings.PDF_EXPORT_MAX_WORKERS),
+                               memory_limit_mb=settings.PDF_EXPORT_JOB_MEMORY_LIMIT_MB)
+
+
+def stream_cohort_zip(patients, pool=None, max_workers=None):
+    """
+    Générer une archive ZIP des carnets de patients, morceau par morceau.
+
+    patients: itérable de (patient_id, nom de fichier). Les rendus passent par
+    le pool partagé du worker (pdf_pool) : des exports simultanés s'y mettent
+    en file au lieu de lancer chacun leurs processus. Au plus deux fois
+    max_workers rendus d'un export sont en attente, chaque PDF étant écrit dans
+    l'archive dès qu'il est prêt ; l'échec d'un patient est noté dans
+    erreurs.txt sans interrompre l'archive.
+    """
+    max_workers = get_max_workers(max_workers or settings.PDF_EXPORT_MAX_WORKERS)
+    pool = pool or pdf_pool()
+
+    stream = _ZipStream()
+    errors = []
+    remaining = iter(patients)
+    pending = {}
+
+    def submit_next():
+        for patient_id, filename in remaining:
+            try:
+                pending[pool.submit(render_patient_pdf, patient_id)] = filename
+            except Exception as exc:
+                errors.append(f"{filename}: {exc!r}")
+                continue
+            return
+
+    try:
+        with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_STORED) as archive:
+            for _ in range(max_workers * 2):
+                submit_next()
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    filename = pending.pop(future)
+                    try:
+                        archive.writestr(filename, future.result())
+                    except Exception as exc:
+                        errors.append(f"{filename}: {exc!r}")
+                    submit_next()
+                yield stream.pop()
+
+            if errors:
+                archive.writestr('erreurs.txt', '\n'.join(errors) + '\n')
+        yield stream.pop()
+    finally:
+        # Client parti ou erreur : rendus encore en file annulés, le pool reste aux autres requêtes
+        for future in pending:
+            future.cancel()
@@ -6,10 +6,36 @@ from reportlab.lib import colors
 from reportlab.lib.units import inch, cm
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from django.conf import settings
+from django.core.cache import caches
+from functools import lru_cache
+import bisect
+import hashlib
 import io
+import zlib
 from datetime import datetime
 import os
 
+# Marges de SimpleDocTemplate et marge intérieure de son cadre
+PAGE_MARGIN = 72
+FRAME_PADDING = 6
+STRIP_WIDTH = A4[0] - 2 * PAGE_MARGIN
+CONTENT_TOP = A4[1] - PAGE_MARGIN - FRAME_PADDING
+CONTENT_BOTTOM = PAGE_MARGIN + FRAME_PADDING
+
+# À incrémenter quand record_story change de mise en page : les fragments en cache deviennent obsolètes
+FRAGMENT_LAYOUT_VERSION = 2
+
+# Commentaire inséré dans le flux d'un fragment à chaque point de coupe, retiré après rendu
+CUT_MARKER = b'%tohpitoh-cut'
+
+# Caractères assignés d'avance au premier sous-ensemble de la police TrueType (ASCII + 128) :
+# les fragments qui s'en tiennent à ces caractères embarquent la même police, incluse une fois
+SHARED_CHARACTERS = (''.join(chr(code) for code in range(0xA1, 0x100))
+                     + '€‚ƒ„…†‡ˆ‰Š‹ŒŽ‘’“”•–—˜™š›œžŸ≤≥≠≈→−')
+
+@lru_cache(maxsize=None)
 def register_fonts():
     """Enregistrer les polices Unicode"""
     try:
@@ -19,7 +45,7 @@ def register_fonts():
             'C:/Windows/Fonts/arial.ttf',
             '/System/Library/Fonts/Arial.ttf'
         ]
-        
+
         for path in font_paths:
             if os.path.exists(path):
                 pdfmetrics.registerFont(TTFont('DejaVu', path))
@@ -28,57 +54,80 @@ def register_fonts():
         pass
     return 'Helvetica'
 
-def generate_medical_record_pdf(medical_records, patient):
-    """Générer un PDF du dossier médical"""
-    buffer = io.BytesIO()
-    
-    # Créer le document
-    doc = SimpleDocTemplate(buffer, pagesize=A4, 
-                          rightMargin=72, leftMargin=72,
-                          topMargin=72, bottomMargin=72)
-    
-    # Préparer les styles
+def draw_page_footer(pdf_canvas, page_number, page_count):
+    """Pied de page : mention de confidentialité et numéro de page"""
+    width = pdf_canvas._pagesize[0]
+    pdf_canvas.saveState()
+    pdf_canvas.setFont(register_fonts(), 8)
+    pdf_canvas.drawCentredString(width / 2, 40, "*** Ce document est confidentiel et protégé par le secret médical ***")
+    pdf_canvas.drawCentredString(width / 2, 28, f"Page {page_number}/{page_count}")
+    pdf_canvas.restoreState()
+
+class NumberedCanvas(canvas.Canvas):
+    """Canvas qui diffère le pied de page pour connaître le nombre total de pages"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._saved_page_states = []
+
+    def showPage(self):
+        self._saved_page_states.append(dict(self.__dict__))
+        self._startPage()
+
+    def save(self):
+        page_count = len(self._saved_page_states)
+        for state in self._saved_page_states:
+            self.__dict__.update(state)
+            draw_page_footer(self, self._pageNumber, page_count)
+            super().showPage()
+        super().save()
+
+def build_styles():
+    """Styles des paragraphes du carnet"""
     styles = getSampleStyleSheet()
     font_name = register_fonts()
-    
-    # Styles personnalisés
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Title'],
-        fontSize=16,
-        spaceAfter=30,
-        alignment=TA_CENTER,
-        fontName=font_name
-    )
-    
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=12,
-        spaceAfter=12,
-        spaceBefore=12,
-        fontName=font_name
-    )
-    
-    normal_style = ParagraphStyle(
-        'CustomNormal',
-        parent=styles['Normal'],
-        fontSize=10,
-        spaceAfter=6,
-        fontName=font_name
-    )
-    
-    # Contenu du PDF
+
+    return {
+        'font_name': font_name,
+        'title': ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Title'],
+            fontSize=16,
+            spaceAfter=30,
+            alignment=TA_CENTER,
+            fontName=font_name
+        ),
+        'heading': ParagraphStyle(
+            'CustomHeading',
+            parent=styles['Heading2'],
+            fontSize=12,
+            spaceAfter=12,
+            spaceBefore=12,
+            fontName=font_name
+        ),
+        'normal': ParagraphStyle(
+            'CustomNormal',
+            parent=styles['Normal'],
+            fontSize=10,
+            spaceAfter=6,
+            fontName=font_name
+        ),
+    }
+
+def patient_story(patient, styles):
+    """En-tête du carnet et informations patient"""
+    font_name = styles['font_name']
+    normal_style = styles['normal']
     story = []
-    
+
     # En-tête
-    story.append(Paragraph("TOHPITOH - Carnet Médical", title_style))
+    story.append(Paragraph("TOHPITOH - Carnet Médical", styles['title']))
     story.append(Paragraph(f"Généré le {datetime.now().strftime('%d/%m/%Y %H:%M')}", normal_style))
     story.append(Spacer(1, 20))
-    
+
     # Informations patient
-    story.append(Paragraph("INFORMATIONS PATIENT", heading_style))
-    
+    story.append(Paragraph("INFORMATIONS PATIENT", styles['heading']))
+
     patient_data = [
         ["Nom complet:", f"{patient.user.first_name} {patient.user.last_name}"],
         ["Date de naissance:", patient.user.date_of_birth.strftime('%d/%m/%Y') if patient.user.date_of_birth else "Non renseignée"],
@@ -90,11 +139,11 @@ def generate_medical_record_pdf(medical_records, patient):
         ["Maladies chroniques:", patient.chronic_diseases or "Aucune"],
         ["Contact d'urgence:", patient.emergency_contact or "Non renseigné"],
     ]
-    
+
     if patient.height and patient.weight:
         bmi = patient.calculate_bmi()
         patient_data.append(["IMC (BMI):", f"{bmi:.2f}"])
-    
+
     patient_table = Table(patient_data, colWidths=[3*cm, 10*cm])
     patient_table.setStyle(TableStyle([
         ('FONTNAME', (0, 0), (-1, -1), font_name),
@@ -105,95 +154,505 @@ def generate_medical_record_pdf(medical_records, patient):
         ('ALIGN', (0, 0), (0, -1), 'LEFT'),
         ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
     ]))
-    
+
     story.append(patient_table)
     story.append(Spacer(1, 30))
-    
+    return story
+
+def record_story(record, styles):
+    """Un dossier médical et ses tests"""
+    font_name = styles['font_name']
+    normal_style = styles['normal']
+    story = []
+
+    # Informations du dossier
+    record_info = [
+        ["Date:", record.date.strftime('%d/%m/%Y %H:%M')],
+        ["Type:", record.get_record_type_display()],
+        ["Titre:", record.title],
+    ]
+
+    if record.created_by:
+        record_info.append(["Créé par:", f"Dr. {record.created_by.user.get_full_name()}"])
+
+    record_table = Table(record_info, colWidths=[2*cm, 11*cm])
+    record_table.setStyle(TableStyle([
+        ('FONTNAME', (0, 0), (-1, -1), font_name),
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+        ('BACKGROUND', (0, 0), (-1, -1), colors.lightgrey),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+        ('TOPPADDING', (0, 0), (-1, -1), 4),
+    ]))
+
+    story.append(record_table)
+
+    # Description
+    if record.description:
+        story.append(Paragraph("<b>Description:</b>", normal_style))
+        story.append(Paragraph(record.description, normal_style))
+
+    # Diagnostic
+    if record.diagnosis:
+        story.append(Paragraph("<b>Diagnostic:</b>", normal_style))
+        story.append(Paragraph(record.diagnosis, normal_style))
+
+    # Prescription
+    if record.prescription:
+        story.append(Paragraph("<b>Prescription:</b>", normal_style))
+        story.append(Paragraph(record.prescription, normal_style))
+
+    # Notes
+    if record.notes:
+        story.append(Paragraph("<b>Notes:</b>", normal_style))
+        story.append(Paragraph(record.notes, normal_style))
+
+    # Tests médicaux associés
+    tests = list(record.tests.all())
+    if tests:
+        story.append(Paragraph("<b>Tests médicaux:</b>", normal_style))
+
+        test_data = [["Test", "Date", "Résultat", "Valeurs normales"]]
+        for test in tests:
+            test_data.append([
+                test.test_name,
+                test.test_date.strftime('%d/%m/%Y'),
+                test.result,
+                test.normal_range or "N/A"
+            ])
+
+        test_table = Table(test_data, colWidths=[3*cm, 2.5*cm, 4*cm, 3*cm])
+        test_table.setStyle(TableStyle([
+            ('FONTNAME', (0, 0), (-1, -1), font_name),
+            ('FONTSIZE', (0, 0), (-1, -1), 8),
+            ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ]))
+
+        story.append(test_table)
+
+    story.append(Spacer(1, 15))
+    return story
+
+def history_story(medical_records, styles, with_heading=True):
+    """Historique médical : une suite de dossiers"""
+    story = []
+    if with_heading:
+        story.append(Paragraph("HISTORIQUE MÉDICAL", styles['heading']))
+    for record in medical_records:
+        story.extend(record_story(record, styles))
+    return story
+
+def build_pdf(story, canvasmaker=canvas.Canvas):
+    """Mettre en page une suite d'éléments au format du carnet"""
+    buffer = io.BytesIO()
+
+    # Créer le document
+    doc = SimpleDocTemplate(buffer, pagesize=A4,
+                          rightMargin=PAGE_MARGIN, leftMargin=PAGE_MARGIN,
+                          topMargin=PAGE_MARGIN, bottomMargin=PAGE_MARGIN)
+
+    # Générer le PDF
+    doc.build(story, canvasmaker=canvasmaker)
+    buffer.seek(0)
+
+    return buffer
+
+def optimize_output(buffer):
+    """Passer un PDF produit par l'étape d'optimisation (pdf_optimize), si activée et pypdf disponible"""
+    if not settings.PDF_OPTIMIZE_ENABLED:
+        return buffer
+    try:
+        from .pdf_optimize import optimize_pdf
+    except ImportError:
+        return buffer
+    return io.BytesIO(optimize_pdf(buffer.getvalue()))
+
+def generate_medical_record_pdf(medical_records, patient):
+    """Générer un PDF du dossier médical"""
+    styles = build_styles()
+    medical_records = list(medical_records)
+
+    # Contenu du PDF
+    story = patient_story(patient, styles)
+
     # Historique médical
     if medical_records:
-        story.append(Paragraph("HISTORIQUE MÉDICAL", heading_style))
-        
-        for record in medical_records:
-            # Informations du dossier
-            record_info = [
-                ["Date:", record.date.strftime('%d/%m/%Y %H:%M')],
-                ["Type:", record.get_record_type_display()],
-                ["Titre:", record.title],
-            ]
-            
-            if record.created_by:
-                record_info.append(["Créé par:", f"Dr. {record.created_by.user.get_full_name()}"])
-            
-            record_table = Table(record_info, colWidths=[2*cm, 11*cm])
-            record_table.setStyle(TableStyle([
-                ('FONTNAME', (0, 0), (-1, -1), font_name),
-                ('FONTSIZE', (0, 0), (-1, -1), 9),
-                ('BACKGROUND', (0, 0), (-1, -1), colors.lightgrey),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
-                ('TOPPADDING', (0, 0), (-1, -1), 4),
-            ]))
-            
-            story.append(record_table)
-            
-            # Description
-            if record.description:
-                story.append(Paragraph("<b>Description:</b>", normal_style))
-                story.append(Paragraph(record.description, normal_style))
-            
-            # Diagnostic
-            if record.diagnosis:
-                story.append(Paragraph("<b>Diagnostic:</b>", normal_style))
-                story.append(Paragraph(record.diagnosis, normal_style))
-            
-            # Prescription
-            if record.prescription:
-                story.append(Paragraph("<b>Prescription:</b>", normal_style))
-                story.append(Paragraph(record.prescription, normal_style))
-            
-            # Notes
-            if record.notes:
-                story.append(Paragraph("<b>Notes:</b>", normal_style))
-                story.append(Paragraph(record.notes, normal_style))
-            
-            # Tests médicaux associés
-            if record.tests.exists():
-                story.append(Paragraph("<b>Tests médicaux:</b>", normal_style))
-                
-                test_data = [["Test", "Date", "Résultat", "Valeurs normales"]]
-                for test in record.tests.all():
-                    test_data.append([
-                        test.test_name,
-                        test.test_date.strftime('%d/%m/%Y'),
-                        test.result,
-                        test.normal_range or "N/A"
-                    ])
-                
-                test_table = Table(test_data, colWidths=[3*cm, 2.5*cm, 4*cm, 3*cm])
-                test_table.setStyle(TableStyle([
-                    ('FONTNAME', (0, 0), (-1, -1), font_name),
-                    ('FONTSIZE', (0, 0), (-1, -1), 8),
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
-                    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ]))
-                
-                story.append(test_table)
-            
-            story.append(Spacer(1, 15))
-    
+        story.extend(history_story(medical_records, styles))
     else:
-        story.append(Paragraph("Aucun dossier médical trouvé.", normal_style))
-    
-    # Pied de page
-    story.append(Spacer(1, 30))
-    story.append(Paragraph("*** Ce document est confidentiel et protégé par le secret médical ***", 
-                          ParagraphStyle('Footer', parent=normal_style, alignment=TA_CENTER)))
-    story.append(Paragraph(f"Page 1/1", 
-                          ParagraphStyle('PageNumber', parent=normal_style, alignment=TA_CENTER)))
-    
-    # Générer le PDF
-    doc.build(story)
+        story.append(Paragraph("Aucun dossier médical trouvé.", styles['normal']))
+
+    return optimize_output(build_pdf(story, canvasmaker=NumberedCanvas))
+
+def record_fingerprint(record):
+    """Empreinte de tout ce que record_story affiche (dossier, tests, médecin) et de la mise en page"""
+    doctor = record.created_by.user.get_full_name() if record.created_by else None
+    tests = [(test.id, test.test_name, test.test_date, test.result, test.normal_range) for test in record.tests.all()]
+    values = (
+        FRAGMENT_LAYOUT_VERSION, register_fonts(), record.date, record.record_type, record.title,
+        record.description, record.diagnosis, record.prescription, record.notes, doctor, tests,
+    )
+    return hashlib.sha1(repr(values).encode('utf-8')).hexdigest()[:20]
+
+def fragment_cache_key(record):
+    return f'pdf-fragment:{record.id}:{record_fingerprint(record)}'
+
+def _fonts_signature(doc):
+    """Polices d'un document reportlab et caractères de leurs sous-ensembles : même signature, mêmes ressources"""
+    signature = []
+    for font_name, internal_name in sorted(doc.fontMapping.items()):
+        state = getattr(pdfmetrics.getFont(font_name), 'state', {}).get(doc)
+        signature.append((font_name, internal_name, state.subsets if state is not None else None))
+    return hashlib.sha1(repr(signature).encode('utf-8')).hexdigest()[:20]
+
+def _page_content(page):
+    """Flux de contenu encodé d'une page lue par pypdf et ses filtres (sans la couche ASCII85 de reportlab)"""
+    from pypdf.filters import ASCII85Decode
+
+    stream = page.raw_get('/Contents').get_object()
+    content, filters = stream._data, stream.get('/Filter', [])
+    filters = [str(name) for name in ([filters] if isinstance(filters, str) else filters)]
+    if filters[:1] == ['/ASCII85Decode']:
+        content, filters = ASCII85Decode.decode(content), filters[1:]
+    return content, filters
+
+def _split_repeatedly(flowable, width, first_height, next_height):
+    """Découper un élément par son propre split() : une portion de first_height, puis de next_height"""
+    pieces, rest = [], flowable
+    while True:
+        height = next_height(rest) if pieces else first_height(rest)
+        parts = rest.split(width, height) if height else []
+        if len(parts) != 2:
+            return pieces + [rest]
+        pieces.append(parts[0])
+        rest = parts[1]
+        rest.wrap(width, A4[1])
+
+def _pieces(flowable, width):
+    """
+    Portions d'un élément entre lesquelles le carnet peut changer de page :
+    lignes d'un paragraphe (sans ligne orpheline en bas de page, comme
+    reportlab) et rangées d'un tableau.
+    """
+    if isinstance(flowable, Paragraph) and flowable.style.leading:
+        leading = flowable.style.leading
+        orphans = getattr(flowable, 'allowOrphans', getattr(flowable.style, 'allowOrphans', 0))
+
+        def first_lines(rest):
+            return leading if orphans else 2 * leading
+
+        def next_line(rest):
+            # La première ligne est déjà placée : plus d'orpheline possible
+            rest.allowOrphans = 1
+            return leading
+        return _split_repeatedly(flowable, width, first_lines, next_line)
+    if isinstance(flowable, Table):
+        def first_row(rest):
+            # Un peu plus que la rangée, pour les arrondis
+            return rest._rowHeights[0] + 0.01 if len(rest._rowHeights) > 1 else None
+        return _split_repeatedly(flowable, width, first_row, first_row)
+    return [flowable]
+
+def _layout(story):
+    """
+    Placer les éléments à la suite comme dans un cadre, par portions (_pieces) :
+    (portions placées, bas de chaque portion où couper, haut de la portion
+    suivante où reprendre sur la nouvelle page, hauteur). Comme dans un cadre,
+    les espaces entre éléments disparaissent au changement de page.
+    """
+    width = STRIP_WIDTH - 2 * FRAME_PADDING
+    placed, breaks, resumes, height = [], [], [], 0
+    for index, flowable in enumerate(story):
+        # Pas d'espace avant le premier élément
+        if index:
+            height += flowable.getSpaceBefore()
+        flowable.wrap(width, A4[1])
+        for piece in _pieces(flowable, width):
+            piece_width, piece_height = piece.wrap(width, A4[1])
+            if placed:
+                resumes.append(height)
+            placed.append((piece, height, width - piece_width, piece_height))
+            height += piece_height
+            breaks.append(height)
+        height += flowable.getSpaceAfter()
+    height = max(height, 1)
+    resumes.append(height)
+    return placed, breaks, resumes, height
+
+def _decoded(content, filters):
+    """Flux décodé (reportlab ne produit que des flux Flate ou non compressés)"""
+    return zlib.decompress(content) if filters == ['/FlateDecode'] else content
+
+def _cut_offsets(content, filters):
+    """
+    Retirer les marqueurs de coupe d'un flux de fragment : (flux, filtres,
+    position dans le flux décodé de chaque point de coupe).
+    """
+    data = _decoded(content, filters)
+    parts = data.split(b'\n' + CUT_MARKER + b'\n')
+    offsets, position = [], 0
+    for part in parts[:-1]:
+        position += len(part) + 1
+        offsets.append(position)
+    data = b'\n'.join(parts)
+    return zlib.compress(data), ['/FlateDecode'], offsets
+
+def render_strips(stories):
+    """
+    Fragments de plusieurs suites d'éléments, chacune dessinée sur une bande de
+    la largeur du cadre et aussi haute que son contenu.
+
+    Les bandes sont les pages d'un même document : les polices sont embarquées
+    une fois par lot. Renvoie la liste des fragments (flux de contenu encodé,
+    hauteur, hauteurs depuis le haut où couper entre deux pages et où reprendre,
+    position de chaque coupe dans le flux décodé, signature des polices) et le
+    PDF source de ces polices.
+    """
+    from pypdf import PdfReader, PdfWriter
+    from pypdf.generic import NameObject
+
+    from .pdf_optimize import compress_streams
+
+    buffer = io.BytesIO()
+    document = canvas.Canvas(buffer)
+    font = pdfmetrics.getFont(register_fonts())
+    if getattr(font, '_dynamicFont', False):
+        font.splitString(SHARED_CHARACTERS, document._doc)
+    layouts = []
+    for story in stories:
+        placed, breaks, resumes, height = _layout(story)
+        document.setPageSize((STRIP_WIDTH, height))
+        for flowable, top, free_width, flowable_height in placed:
+            flowable.drawOn(document, FRAME_PADDING, height - top - flowable_height, _sW=free_width)
+            document._code.append(CUT_MARKER.decode('ascii'))
+        document.showPage()
+        layouts.append((breaks, resumes, height))
+    document.save()
+
+    signature = _fonts_signature(document._doc)
+    pages = PdfReader(buffer).pages
+    fragments = []
+    for page, (breaks, resumes, height) in zip(pages, layouts):
+        content, filters, offsets = _cut_offsets(*_page_content(page))
+        fragments.append({'content': content, 'filters': filters, 'height': height, 'breaks': breaks,
+                          'resumes': resumes, 'offsets': offsets, 'fonts': signature})
+
+    # Source des polices : une page vide portant les ressources du lot, compressées une fois ici
+    writer = PdfWriter()
+    writer.add_blank_page(1, 1)[NameObject('/Resources')] = pages[0]['/Resources'].clone(writer)
+    compress_streams(writer)
+    fonts = io.BytesIO()
+    writer.write(fonts)
+    return fragments, fonts.getvalue()
+
+def _render_fragments(medical_records):
+    """Tâche du pool : fragments d'une portion de dossiers"""
+    styles = build_styles()
+    return render_strips([record_story(record, styles) for record in medical_records])
+
+def _fonts_cache_key(signature):
+    return f'pdf-fonts:{signature}'
+
+def record_fragments(medical_records, max_workers=None):
+    """
+    Fragments des dossiers dans l'ordre et PDF sources de leurs polices ({signature: pdf}).
+
+    Fragments et polices sont lus dans le cache dédié 'pdf_fragments' (données
+    de santé, durée PDF_FRAGMENT_CACHE_SECONDS) ; seuls les dossiers nouveaux ou
+    modifiés (ou dont les polices ont quitté le cache) sont rendus, en parallèle
+    s'ils sont nombreux. Les polices sont mises en cache une fois par signature,
+    partagées entre dossiers et patients.
+    """
+    from core.process_pool import get_max_workers
+    from .pdf_export import pdf_pool
+
+    cache = caches['pdf_fragments']
+    keys = [fragment_cache_key(record) for record in medical_records]
+    fragments = cache.get_many(keys)
+    signatures = {fragment['fonts'] for fragment in fragments.values()}
+    found = cache.get_many([_fonts_cache_key(signature) for signature in signatures])
+    fonts = {signature: found[_fonts_cache_key(signature)] for signature in signatures
+             if _fonts_cache_key(signature) in found}
+    missing = [(key, record) for key, record in zip(keys, medical_records)
+               if key not in fragments or fragments[key]['fonts'] not in fonts]
+
+    if missing:
+        records = [record for _, record in missing]
+        chunk_size = settings.PDF_PARALLEL_CHUNK_SIZE
+        max_workers = get_max_workers(max_workers or settings.PDF_EXPORT_MAX_WORKERS)
+        if max_workers < 2 or len(records) < max(settings.PDF_PARALLEL_MIN_RECORDS, 2 * chunk_size):
+            batches = [_render_fragments(records)]
+        else:
+            chunks = [records[i:i + chunk_size] for i in range(0, len(records), chunk_size)]
+            # Pool partagé du worker : des carnets demandés en même temps se partagent ses processus
+            batches = list(pdf_pool().map(_render_fragments, chunks))
+
+        rendered, new_fonts = [], {}
+        for batch, pdf in batches:
+            rendered.extend(batch)
+            if batch[0]['fonts'] not in fonts:
+                fonts[batch[0]['fonts']] = new_fonts[_fonts_cache_key(batch[0]['fonts'])] = pdf
+        new_fragments = {key: fragment for (key, _), fragment in zip(missing, rendered)}
+        cache.set_many(new_fonts)
+        cache.set_many(new_fragments)
+        fragments.update(new_fragments)
+
+    return [fragments[key] for key in keys], fonts
+
+def _form_xobject(writer, content, filters, width, height, resources):
+    """Flux de contenu encodé en Form XObject du document en cours d'écriture"""
+    from pypdf.generic import ArrayObject, FloatObject, NameObject, StreamObject
+
+    form = StreamObject()
+    form.set_data(content)
+    form.update({
+        NameObject('/Type'): NameObject('/XObject'),
+        NameObject('/Subtype'): NameObject('/Form'),
+        NameObject('/BBox'): ArrayObject([FloatObject(0), FloatObject(0), FloatObject(width), FloatObject(height)]),
+        NameObject('/Resources'): resources,
+    })
+    if filters:
+        form[NameObject('/Filter')] = ArrayObject([NameObject(name) for name in filters])
+    return writer._add_object(form)
+
+def _portion_content(fragment, data, offset, cut):
+    """
+    Flux décodé de la portion [offset, cut] d'un fragment : les portions
+    (lignes, rangées, éléments) qui la recouvrent, sans le reste du fragment.
+    """
+    breaks, offsets = fragment['breaks'], fragment['offsets']
+    first = bisect.bisect_right(breaks, offset + 1e-6) - 1
+    last = bisect.bisect_left(breaks, cut - 1e-6)
+    return data[offsets[first] if first >= 0 else 0:offsets[last] if last < len(offsets) else len(data)]
+
+def assemble_fragments(fragments, fonts):
+    """
+    Poser les fragments les uns sous les autres sur des pages A4, puis numéroter.
+
+    Chaque fragment est inclus une fois (Form XObject) à partir de son flux déjà
+    encodé, sans réinterpréter son contenu ; les polices sont incluses une fois
+    par signature, déjà compressées (render_strips). Seuls les objets propres à
+    l'assemblage (contenus des pages, pieds de page) sont compressés ici : aucune
+    passe d'optimisation sur le document entier.
+
+    Un fragment qui ne tient pas dans le reste de la page y est coupé au dernier
+    point de coupe possible (entre deux lignes d'un paragraphe, deux rangées
+    d'un tableau ou deux éléments) et se poursuit sur la page suivante. Chaque
+    page reçoit alors sa propre portion du flux : le texte n'est pas dupliqué
+    pour l'extraction ou les lecteurs d'écran. Seul un élément insécable plus
+    haut qu'une page entière est dessiné sur chaque page sous un masque.
+    """
+    from pypdf import PdfReader, PdfWriter
+    from pypdf.generic import DictionaryObject, NameObject, StreamObject
+
+    from .pdf_optimize import compress_streams
+
+    writer = PdfWriter()
+    resources = {}
+    pages, cursor = [], None
+    for index, fragment in enumerate(fragments):
+        signature, height = fragment['fonts'], fragment['height']
+        if signature not in resources:
+            resources[signature] = writer._add_object(
+                PdfReader(io.BytesIO(fonts[signature])).pages[0]['/Resources'].clone(writer))
+        name = NameObject(f'/R{index}')
+
+        # (page, position, portion [offset, cut])
+        portions, offset = [], 0
+        while offset < height:
+            if cursor is None:
+                pages.append(([], {}))
+                cursor = CONTENT_TOP
+            room = cursor - CONTENT_BOTTOM
+            if height - offset <= room:
+                cut = resume = height
+            else:
+                last = bisect.bisect_right(fragment['breaks'], offset + room) - 1
+                if last >= 0 and fragment['breaks'][last] > offset:
+                    cut, resume = fragment['breaks'][last], fragment['resumes'][last]
+                elif cursor < CONTENT_TOP:
+                    cursor = None
+                    continue
+                else:
+                    # Élément plus haut qu'une page entière : coupé à la hauteur de la page
+                    cut = resume = offset + room
+
+            portions.append((pages[-1], cursor, offset, cut))
+            cursor -= cut - offset
+            offset = resume
+            if offset < height:
+                cursor = None
+
+        if len(portions) == 1:
+            contents = [(fragment['content'], fragment['filters'])]
+        else:
+            # Fragment coupé (un par page au plus) : son flux est décodé et partagé entre les pages
+            data = _decoded(fragment['content'], fragment['filters'])
+            contents = [(zlib.compress(_portion_content(fragment, data, offset, cut)), ['/FlateDecode'])
+                        for _, _, offset, cut in portions]
+
+        for ((operators, forms), top, offset, cut), (content, filters) in zip(portions, contents):
+            forms[name] = _form_xobject(writer, content, filters, STRIP_WIDTH, height, resources[signature])
+            operators.append(
+                f'q {PAGE_MARGIN} {top - (cut - offset):.2f} {STRIP_WIDTH:.2f} {cut - offset:.2f} re W n '
+                f'1 0 0 1 {PAGE_MARGIN} {top - (height - offset):.2f} cm {name} Do Q'
+            )
+
+    # Pieds de page dessinés d'un coup pour toutes les pages, repris dans le flux de chaque page
+    buffer = io.BytesIO()
+    overlay = canvas.Canvas(buffer, pagesize=A4)
+    for page_number in range(1, len(pages) + 1):
+        draw_page_footer(overlay, page_number, len(pages))
+        overlay.showPage()
+    overlay.save()
+    footers = PdfReader(buffer).pages
+    first_footer_object = len(writer._objects)
+    footer_fonts = writer._add_object(footers[0]['/Resources']['/Font'].clone(writer))
+    compress_streams(writer, start=first_footer_object)
+
+    for (operators, forms), footer in zip(pages, footers):
+        page = writer.add_blank_page(*A4)
+        page[NameObject('/Resources')] = DictionaryObject({
+            NameObject('/Font'): footer_fonts,
+            NameObject('/XObject'): DictionaryObject(forms),
+        })
+        page_content = StreamObject()
+        page_content.set_data('\n'.join(operators + ['q', '']).encode('ascii')
+                              + _decoded(*_page_content(footer)) + b'\nQ')
+        page.replace_contents(page_content.flate_encode())
+
+    buffer = io.BytesIO()
+    writer.write(buffer)
     buffer.seek(0)
-    
-    return buffer
\ No newline at end of file
+    return buffer
+
+def generate_medical_record_pdf_incremental(medical_records, patient, max_workers=None):
+    """
+    Générer le carnet à partir de fragments par dossier mis en cache.
+
+    Seuls l'en-tête patient et les dossiers nouveaux ou modifiés sont rendus ;
+    les autres fragments viennent du cache (clé : identifiant et empreinte du
+    dossier), puis tous sont posés à la suite et la numérotation apposée. Les
+    flux sont compressés à leur création : le carnet assemblé ne repasse pas
+    par optimize_output, dont le coût dépend de tout le document. Sans pypdf,
+    rendu complet par generate_medical_record_pdf.
+    """
+    try:
+        import pypdf  # noqa: F401
+    except ImportError:
+        return generate_medical_record_pdf(medical_records, patient)
+
+    styles = build_styles()
+    medical_records = list(medical_records)
+
+    header = patient_story(patient, styles)
+    if medical_records:
+        header.append(Paragraph("HISTORIQUE MÉDICAL", styles['heading']))
+    else:
+        header.append(Paragraph("Aucun dossier médical trouvé.", styles['normal']))
+    (header_fragment,), header_fonts = render_strips([header])
+
+    fragments, fonts = record_fragments(medical_records, max_workers=max_workers)
+    fonts.setdefault(header_fragment['fonts'], header_fonts)
+    return assemble_fragments([header_fragment] + fragments, fonts)
@@ -0,0 +1,214 @@
+"""
+Étape d'optimisation des PDF générés, avant envoi.
+
+- Flux : la couche ASCII85 ajoutée par reportlab est retirée (seule la
+  compression Flate reste) et les flux non compressés (contenus de pages
+  assemblées par pypdf) sont compressés.
+- Objets identiques (polices et ressources répétées par les rendus en
+  portions ou par fragments) : une seule copie, les références sont réécrites.
+- Images : réduites à PDF_IMAGE_MAX_DPI pour la taille de la page qui les
+  porte, puis recompressées en JPEG si le résultat est plus léger. Seules les
+  images RGB ou en niveaux de gris 8 bits, JPEG ou Flate, sans transparence,
+  sont traitées ; les autres sont laissées telles quelles.
+- Polices : reportlab n'embarque que des sous-ensembles des polices TrueType ;
+  font_report() le vérifie sur un document.
+"""
+import hashlib
+import io
+import math
+import re
+
+from django.conf import settings
+from pypdf import PdfReader, PdfWriter
+from pypdf.filters import ASCII85Decode
+from pypdf.generic import (
+    ArrayObject, DictionaryObject, IndirectObject, NameObject, NullObject, NumberObject, StreamObject,
+)
+
+# En dessous, la compression d'un flux coûte plus qu'elle ne rapporte
+MIN_COMPRESSED_STREAM = 64
+
+SUBSET_TAG = re.compile(r'^[A-Z]{6}\+')
+
+
+def _filters(stream):
+    filters = stream.get('/Filter', [])
+    return [str(name) for name in ([filters] if isinstance(filters, str) else filters)]
+
+
+def compress_streams(writer, start=0):
+    """Retirer la couche ASCII85 et compresser les flux non compressés des objets à partir de l'indice start"""
+    for index, obj in enumerate(writer._objects[start:], start=start):
+        if not isinstance(obj, StreamObject):
+            continue
+        filters = _filters(obj)
+        if filters[:1] == ['/ASCII85Decode']:
+            obj._data = ASCII85Decode.decode(obj._data)
+            if len(filters) > 1:
+                obj[NameObject('/Filter')] = ArrayObject([NameObject(name) for name in filters[1:]])
+            else:
+                del obj['/Filter']
+                filters = []
+        if not filters and '/DecodeParms' not in obj and len(obj._data) >= MIN_COMPRESSED_STREAM:
+            encoded = obj.flate_encode()
+            encoded.indirect_reference = obj.indirect_reference
+            writer._objects[index] = encoded
+
+
+def _page_images(writer):
+    """Images (XObject) des pages et des formulaires qu'elles incluent : {idnum: (flux, plus grande page)}"""
+    images = {}
+    for page in writer.pages:
+        size = (float(page.mediabox.width), float(page.mediabox.height))
+        stack, seen = [page.get('/Resources')], set()
+        while stack:
+            resources = stack.pop()
+            resources = resources.get_object() if resources is not None else None
+            if not resources or id(resources) in seen:
+                continue
+            seen.add(id(resources))
+            for reference in (resources.get('/XObject') or {}).values():
+                xobject = reference.get_object()
+                if xobject.get('/Subtype') == '/Form':
+                    stack.append(xobject.get('/Resources'))
+                elif xobject.get('/Subtype') == '/Image' and isinstance(reference, IndirectObject):
+                    _, largest = images.get(reference.idnum, (None, (0, 0)))
+                    images[reference.idnum] = (xobject, max(largest, size))
+    return images
+
+
+def _decode_image(stream):
+    """Image PIL des cas courants (JPEG, pixels RGB ou gris 8 bits compressés Flate), sinon None"""
+    from PIL import Image
+
+    if '/SMask' in stream or '/Mask' in stream or stream.get('/BitsPerComponent') != 8:
+        return None
+    mode = {'/DeviceRGB': 'RGB', '/DeviceGray': 'L'}.get(stream.get('/ColorSpace'))
+    filters = _filters(stream)
+    if mode is None or '/Decode' in stream:
+        return None
+    if filters == ['/DCTDecode']:
+        return Image.open(io.BytesIO(stream._data))
+    if filters in (['/FlateDecode'], []):
+        return Image.frombytes(mode, (int(stream['/Width']), int(stream['/Height'])), stream.get_data())
+    return None
+
+
+def _downscale_images(writer, max_dpi, jpeg_quality):
+    """Réduire à max_dpi sur la plus grande page qui porte l'image et recompresser en JPEG si c'est plus léger"""
+    from PIL import Image
+
+    for idnum, (stream, (page_width, page_height)) in _page_images(writer).items():
+        picture = _decode_image(stream)
+        if picture is None:
+            continue
+        # Une image ne peut pas être affichée plus grande que sa page
+        scale = min(1.0, math.ceil(page_width / 72 * max_dpi) / picture.width,
+                    math.ceil(page_height / 72 * max_dpi) / picture.height)
+        if scale < 1.0:
+            picture = picture.resize((max(1, round(picture.width * scale)), max(1, round(picture.height * scale))),
+                                     Image.LANCZOS)
+        buffer = io.BytesIO()
+        picture.convert('RGB' if picture.mode != 'L' else 'L').save(buffer, 'JPEG', quality=jpeg_quality, optimize=True)
+        if scale == 1.0 and buffer.tell() >= len(stream._data):
+            continue
+
+        image = StreamObject()
+        image.set_data(buffer.getvalue())
+        image.update({
+            NameObject('/Type'): NameObject('/XObject'),
+            NameObject('/Subtype'): NameObject('/Image'),
+            NameObject('/Width'): NumberObject(picture.width),
+            NameObject('/Height'): NumberObject(picture.height),
+            NameObject('/ColorSpace'): NameObject('/DeviceGray' if picture.mode == 'L' else '/DeviceRGB'),
+            NameObject('/BitsPerComponent'): NumberObject(8),
+            NameObject('/Filter'): NameObject('/DCTDecode'),
+        })
+        image.indirect_reference = IndirectObject(idnum, 0, writer)
+        writer._objects[idnum - 1] = image
+
+
+def _remap(value, canonical):
+    """Réécrire les références vers des doublons ; renvoie la valeur (éventuellement remplacée)"""
+    if isinstance(value, IndirectObject):
+        return canonical.get(value.idnum, value)
+    if isinstance(value, DictionaryObject):
+        for key, item in list(value.items()):
+            remapped = _remap(item, canonical)
+            if remapped is not item:
+                value[key] = remapped
+    elif isinstance(value, ArrayObject):
+        for position, item in enumerate(value):
+            remapped = _remap(item, canonical)
+            if remapped is not item:
+                value[position] = remapped
+    return value
+
+
+def _deduplicate(writer):
+    """Fusionner les objets identiques jusqu'à stabilité (des parents deviennent identiques à leur tour)"""
+    # Catalogue, informations et pages restent uniques même si leur contenu coïncide
+    protected = {id(writer._root_object), id(writer._info.get_object()) if writer._info is not None else None}
+    protected.update(id(page) for page in writer.pages)
+    removed = 0
+    while True:
+        seen, canonical = {}, {}
+        for index, obj in enumerate(writer._objects):
+            idnum = index + 1
+            if obj is None or isinstance(obj, NullObject) or id(obj) in protected:
+                continue
+            buffer = io.BytesIO()
+            obj.write_to_stream(buffer)
+            digest = hashlib.sha1(buffer.getvalue()).digest()
+            if digest in seen:
+                canonical[idnum] = seen[digest]
+            else:
+                seen[digest] = IndirectObject(idnum, 0, writer)
+        if not canonical:
+            return removed
+        for index, obj in enumerate(writer._objects):
+            if obj is not None and index + 1 not in canonical:
+                _remap(obj, canonical)
+        # Le tableau d'objets ne peut pas avoir de trou : les doublons deviennent null
+        for idnum in canonical:
+            writer._objects[idnum - 1] = NullObject()
+        removed += len(canonical)
+
+
+def optimize_pdf(data, max_dpi=None, jpeg_quality=None):
+    """Optimiser un PDF (octets) ; renvoie les octets du PDF optimisé"""
+    max_dpi = max_dpi or settings.PDF_IMAGE_MAX_DPI
+    jpeg_quality = jpeg_quality or settings.PDF_IMAGE_JPEG_QUALITY
+
+    writer = PdfWriter(clone_from=PdfReader(io.BytesIO(data)))
+    # Couche ASCII85 retirée d'abord : les images deviennent lisibles en JPEG ou Flate
+    compress_streams(writer)
+    _downscale_images(writer, max_dpi, jpeg_quality)
+    _deduplicate(writer)
+
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def font_report(data):
+    """Polices embarquées d'un PDF : [(nom, sous-ensemble ?)] ; un sous-ensemble porte un préfixe 'ABCDEF+'"""
+    fonts = set()
+    for page in PdfReader(io.BytesIO(data)).pages:
+        stack = [page.get('/Resources')]
+        while stack:
+            resources = stack.pop()
+            resources = resources.get_object() if resources is not None else None
+            if not resources:
+                continue
+            for font in (resources.get('/Font') or {}).values():
+                font = font.get_object()
+                descriptor = font.get('/FontDescriptor')
+                if descriptor is not None and any(key in descriptor.get_object()
+                                                  for key in ('/FontFile', '/FontFile2', '/FontFile3')):
+                    fonts.add(str(font['/BaseFont']).lstrip('/'))
+            for xobject in (resources.get('/XObject') or {}).values():
+                xobject = xobject.get_object()
+                if xobject.get('/Subtype') == '/Form':
+                    stack.append(xobject.get('/Resources'))
+    return sorted((name, SUBSET_TAG.match(name) is not None) for name in fonts)
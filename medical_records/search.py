@@ -0,0 +1,215 @@
+"""
+Recherche plein texte dans le contenu clinique des dossiers.
+
+PostgreSQL : colonne search_vector (tsvector) tenue à jour par déclencheur,
+index GIN, configuration 'fr_unaccent' (racinisation française, accents
+ignorés), classement ts_rank_cd et extraits ts_headline.
+SQLite : table FTS5 à contenu externe tenue à jour par déclencheurs,
+tokenizer unicode61 sans diacritiques ; sans racinisation française, chaque
+terme est cherché comme préfixe. Ailleurs : icontains, sans index.
+
+La colonne et les tables de recherche n'existent qu'en base : elles restent
+hors du modèle (sérialiseurs, archivage et exports ne les voient pas). Les
+dossiers archivés ne sont pas indexés.
+"""
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+
+from .models import MedicalRecord
+
+TABLE = MedicalRecord._meta.db_table
+FTS_TABLE = 'medical_records_search'
+PG_CONFIG = 'fr_unaccent'
+
+# Champ -> poids PostgreSQL (A le plus fort) ; même ordre que les colonnes FTS5
+SEARCH_FIELDS = (
+    ('title', 'A'),
+    ('diagnosis', 'A'),
+    ('prescription', 'B'),
+    ('description', 'C'),
+    ('notes', 'D'),
+)
+FTS_WEIGHTS = {'A': 10.0, 'B': 5.0, 'C': 2.0, 'D': 1.0}
+
+# Marqueurs des extraits, remplacés par <mark> après échappement du texte
+START, STOP = '\x02', '\x03'
+
+
+def _pg_vector(prefix):
+    return ' || '.join(
+        f"setweight(to_tsvector('{PG_CONFIG}', coalesce({prefix}{field}, '')), '{weight}')"
+        for field, weight in SEARCH_FIELDS
+    )
+
+
+def _fts_columns(prefix=''):
+    return ', '.join(prefix + field for field, _ in SEARCH_FIELDS)
+
+
+def install(schema_editor):
+    """Créer l'index de recherche propre à la base (appelé par la migration)"""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        statements = [
+            "CREATE EXTENSION IF NOT EXISTS unaccent",
+            f"DO $$ BEGIN "
+            f"IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = '{PG_CONFIG}') THEN "
+            f"CREATE TEXT SEARCH CONFIGURATION {PG_CONFIG} (COPY = french); "
+            f"ALTER TEXT SEARCH CONFIGURATION {PG_CONFIG} "
+            f"ALTER MAPPING FOR hword, hword_part, word WITH unaccent, french_stem; "
+            f"END IF; END $$",
+            f"ALTER TABLE {TABLE} ADD COLUMN search_vector tsvector",
+            f"CREATE FUNCTION {TABLE}_search_vector() RETURNS trigger AS $$ "
+            f"BEGIN NEW.search_vector := {_pg_vector('NEW.')}; RETURN NEW; END; "
+            f"$$ LANGUAGE plpgsql",
+            f"CREATE TRIGGER {TABLE}_search_vector BEFORE INSERT OR UPDATE OF {_fts_columns()} "
+            f"ON {TABLE} FOR EACH ROW EXECUTE FUNCTION {TABLE}_search_vector()",
+            f"UPDATE {TABLE} SET search_vector = {_pg_vector('')}",
+            f"CREATE INDEX {TABLE}_search_idx ON {TABLE} USING GIN (search_vector)",
+        ]
+    elif vendor == 'sqlite':
+        columns = _fts_columns()
+        statements = [
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5({columns}, content='{TABLE}', "
+            f"content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+            f"CREATE TRIGGER {FTS_TABLE}_insert AFTER INSERT ON {TABLE} BEGIN "
+            f"INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {_fts_columns('new.')}); END",
+            f"CREATE TRIGGER {FTS_TABLE}_delete AFTER DELETE ON {TABLE} BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) "
+            f"VALUES ('delete', old.id, {_fts_columns('old.')}); END",
+            f"CREATE TRIGGER {FTS_TABLE}_update AFTER UPDATE OF {columns} ON {TABLE} BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) "
+            f"VALUES ('delete', old.id, {_fts_columns('old.')}); "
+            f"INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {_fts_columns('new.')}); END",
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+        ]
+    else:
+        return
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def uninstall(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(f"DROP FUNCTION IF EXISTS {TABLE}_search_vector() CASCADE")
+        schema_editor.execute(f"ALTER TABLE {TABLE} DROP COLUMN IF EXISTS search_vector")
+    elif vendor == 'sqlite':
+        for suffix in ('insert', 'delete', 'update'):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def backend(using='default'):
+    """'postgresql', 'fts5' ou None (recherche non indexée)"""
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        return 'postgresql'
+    if connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names():
+        return 'fts5'
+    return None
+
+
+def fts5_query(text):
+    """Requête utilisateur -> expression FTS5 : termes (préfixes) en ET, -terme exclu"""
+    included, excluded = [], []
+    for negate, phrase, word in re.findall(r'(-?)(?:"([^"]+)"|(\S+))', text):
+        if phrase:
+            term = '"' + phrase.replace('"', '') + '"'
+        else:
+            word = re.sub(r'\W+', ' ', word).strip()
+            if not word:
+                continue
+            term = ' '.join(f'"{part}"*' for part in word.split())
+        (excluded if negate else included).append(term)
+    if not included:
+        return None
+    expression = ' AND '.join(included)
+    for term in excluded:
+        expression += f' NOT {term}'
+    return expression
+
+
+def search(queryset, text):
+    """Filtrer les dossiers correspondant à text et annoter leur pertinence (rank)"""
+    engine = backend(queryset.db)
+    if engine == 'postgresql':
+        tsquery = f"websearch_to_tsquery('{PG_CONFIG}', %s)"
+        return queryset.filter(
+            RawSQL(f'"{TABLE}"."search_vector" @@ {tsquery}', [text], output_field=BooleanField())
+        ).annotate(rank=RawSQL(f'ts_rank_cd("{TABLE}"."search_vector", {tsquery})', [text], output_field=FloatField()))
+
+    if engine == 'fts5':
+        expression = fts5_query(text)
+        if expression is None:
+            # Aucun terme inclus (-terme seul) : rien, mais rank reste annoté pour le tri
+            return queryset.none().annotate(rank=Value(0.0, output_field=FloatField()))
+        weights = ', '.join(str(FTS_WEIGHTS[weight]) for _, weight in SEARCH_FIELDS)
+        # bm25 : plus petit = plus pertinent
+        return queryset.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [expression])
+        ).annotate(rank=RawSQL(
+            f'(SELECT -bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = "{TABLE}"."id")',
+            [expression], output_field=FloatField(),
+        ))
+
+    condition = Q()
+    for term in text.split():
+        term_condition = Q()
+        for field, _ in SEARCH_FIELDS:
+            term_condition |= Q(**{f'{field}__icontains': term})
+        condition &= term_condition
+    return queryset.filter(condition).annotate(rank=Value(0.0, output_field=FloatField()))
+
+
+def _render(snippet):
+    if snippet is None or START not in snippet:
+        return None
+    return escape(snippet).replace(START, '<mark>').replace(STOP, '</mark>')
+
+
+def highlights(record_ids, text, using='default'):
+    """Extraits des champs correspondant à text, termes entourés de <mark> : {id: {champ: extrait}}"""
+    record_ids = list(record_ids)
+    engine = backend(using)
+    if not record_ids or engine is None:
+        return {}
+
+    placeholders = ', '.join(['%s'] * len(record_ids))
+    if engine == 'postgresql':
+        options = f'StartSel={START}, StopSel={STOP}, MaxWords=25, MinWords=8, MaxFragments=2'
+        columns = ', '.join(
+            f"CASE WHEN to_tsvector('{PG_CONFIG}', coalesce({field}, '')) @@ query "
+            f"THEN ts_headline('{PG_CONFIG}', {field}, query, %s) END"
+            for field, _ in SEARCH_FIELDS
+        )
+        sql = (f"SELECT id, {columns} FROM {TABLE}, websearch_to_tsquery('{PG_CONFIG}', %s) query "
+               f"WHERE id IN ({placeholders})")
+        params = [options] * len(SEARCH_FIELDS) + [text] + record_ids
+    else:
+        expression = fts5_query(text)
+        if expression is None:
+            return {}
+        columns = ', '.join(
+            f"snippet({FTS_TABLE}, {index}, '{START}', '{STOP}', '…', 24)"
+            for index in range(len(SEARCH_FIELDS))
+        )
+        sql = (f"SELECT rowid, {columns} FROM {FTS_TABLE} "
+               f"WHERE {FTS_TABLE} MATCH %s AND rowid IN ({placeholders})")
+        params = [expression] + record_ids
+
+    result = {}
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, params)
+        for record_id, *snippets in cursor.fetchall():
+            result[record_id] = {
+                field: rendered
+                for (field, _), snippet in zip(SEARCH_FIELDS, snippets)
+                if (rendered := _render(snippet)) is not None
+            }
+    return result
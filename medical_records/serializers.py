@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import MedicalRecord, MedicalTest
+from core.models import Patient
 from core.serializers import PatientProfileSerializer, DoctorProfileSerializer
 
 class MedicalTestSerializer(serializers.ModelSerializer):
@@ -12,13 +13,104 @@ class MedicalRecordSerializer(serializers.ModelSerializer):
     created_by = DoctorProfileSerializer(read_only=True)
     tests = MedicalTestSerializer(many=True, read_only=True)
     
+    # Relations imbriquées pouvant être réduites à leurs identifiants
+    EXPANDABLE_FIELDS = ('patient', 'created_by', 'tests')
+    
     class Meta:
         model = MedicalRecord
         fields = '__all__'
         read_only_fields = ('patient', 'created_by', 'date')
+    
+    def __init__(self, *args, **kwargs):
+        # fields: champs à conserver (None = tous)
+        # expand: relations à imbriquer (None = toutes)
+        fields = kwargs.pop('fields', None)
+        expand = kwargs.pop('expand', None)
+        super().__init__(*args, **kwargs)
+        
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        
+        if expand is not None:
+            for name in set(self.EXPANDABLE_FIELDS) - set(expand):
+                if name in self.fields:
+                    self.fields[name] = serializers.PrimaryKeyRelatedField(
+                        read_only=True, many=(name == 'tests')
+                    )
+
+class ClinicalSearchResultSerializer(serializers.ModelSerializer):
+    """Résultat de recherche clinique : dossier résumé, pertinence et extraits surlignés"""
+    patient_name = serializers.CharField(source='patient.user.get_full_name', read_only=True)
+    rank = serializers.FloatField(read_only=True)
+    highlights = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = MedicalRecord
+        fields = ('id', 'patient', 'patient_name', 'created_by', 'date', 'record_type',
+                  'title', 'is_emergency', 'rank', 'highlights')
+    
+    def get_highlights(self, obj):
+        return self.context.get('highlights', {}).get(obj.id, {})
+
+class ClinicalSearchParamsSerializer(serializers.Serializer):
+    """Paramètres de la recherche clinique (?q=, filtres optionnels)"""
+    q = serializers.CharField(min_length=2, max_length=200)
+    record_type = serializers.ChoiceField(choices=MedicalRecord.RECORD_TYPE_CHOICES, required=False)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    patient_id = serializers.IntegerField(required=False)
 
 class MedicalRecordCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = MedicalRecord
         fields = ('record_type', 'title', 'description', 'diagnosis', 
-                 'prescription', 'notes', 'file', 'is_emergency')
\ No newline at end of file
+                 'prescription', 'notes', 'file', 'is_emergency')
+
+class CohortExportSerializer(serializers.Serializer):
+    """Sélection des patients d'un export PDF groupé"""
+    patient_ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+    blood_type = serializers.CharField(required=False, max_length=5)
+    record_type = serializers.ChoiceField(choices=MedicalRecord.RECORD_TYPE_CHOICES, required=False)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    
+    def validate(self, data):
+        if not data:
+            raise serializers.ValidationError("Indiquez patient_ids ou au moins un filtre.")
+        return data
+    
+    def get_patients(self):
+        data = self.validated_data
+        patients = Patient.objects.all()
+        
+        if 'patient_ids' in data:
+            patients = patients.filter(id__in=data['patient_ids'])
+        if 'blood_type' in data:
+            patients = patients.filter(blood_type=data['blood_type'])
+        
+        # Filtres sur les dossiers : patients ayant au moins un dossier correspondant
+        record_filters = {}
+        if 'record_type' in data:
+            record_filters['medical_records__record_type'] = data['record_type']
+        if 'date_from' in data:
+            record_filters['medical_records__date__date__gte'] = data['date_from']
+        if 'date_to' in data:
+            record_filters['medical_records__date__date__lte'] = data['date_to']
+        if record_filters:
+            patients = patients.filter(**record_filters).distinct()
+        
+        return patients.order_by('id')
+
+class AnalyticsExportSerializer(serializers.Serializer):
+    """Paramètres de l'export analytique (GET /api/medical-records/analytics/export/)"""
+    table = serializers.ChoiceField(choices=('records', 'tests'))
+    output = serializers.ChoiceField(choices=('csv', 'ndjson'), default='csv')
+    since = serializers.DateField(required=False)
+    until = serializers.DateField(required=False)
+    pseudonymize = serializers.BooleanField(default=True)
+    
+    def validate(self, data):
+        if 'since' in data and 'until' in data and data['since'] >= data['until']:
+            raise serializers.ValidationError("since doit précéder until.")
+        return data
@@ -1,3 +1,977 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import tempfile
+import time
+import zipfile
+from concurrent.futures import Future
+from datetime import date, datetime, timedelta, timezone
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone as django_timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+
+from audit.models import AccessEvent
+from core.care_team import can_access_patient, care_team_scope
+from core.models import CareTeamMembership, Doctor, Patient, User
+from core.permissions import IsOwnerOrDoctor
+from core.throttling import ConcurrencySlots
+from .analytics_export import export_parallel, export_stream, pseudonym
+from .archive import archive_batch, archived_records_for, iter_archived_records
+from .changes import compact, make_token, read_token
+from .emergency import issue_token, revoke_token, token_hash
+from .fast_serializers import get_row_serializer
+from .models import ArchivedMedicalRecord, EmergencyCard, MedicalRecord, MedicalTest, RecordChange
+from .pdf_export import cohort_filename, records_for_pdf, render_patient_pdf
+from .pdf_generator import fragment_cache_key, generate_medical_record_pdf, generate_medical_record_pdf_incremental
+from .search import backend as search_backend
+from .serializers import MedicalRecordSerializer
+
+
+def create_patient(email='patient@tohpitoh.local', **fields):
+    user = User.objects.create_user(email=email, password='motdepasse', user_type='patient',
+                                    first_name='Awa', last_name='Diallo')
+    return Patient.objects.create(user=user, **fields)
+
+
+def create_doctor(email='docteur@tohpitoh.local', medical_license='LIC-001'):
+    user = User.objects.create_user(email=email, password='motdepasse', user_type='doctor',
+                                    first_name='Koffi', last_name='Mensah', date_of_birth=date(1975, 3, 14))
+    return Doctor.objects.create(user=user, medical_license=medical_license, specialization='Cardiologie',
+                                 years_of_experience=12, is_verified=True)
+
+
+@override_settings(AUDIT_ENABLED=True, AUDIT_ASYNC=False)
+class EmergencyCardViewTests(TestCase):
+    def setUp(self):
+        # Allergies assez longues pour dépasser COMPRESSION_MIN_SIZE
+        self.patient = create_patient(blood_type='O+', allergies='Pénicilline, arachides. ' * 80)
+        self.token, _ = issue_token(self.patient)
+        self.url = reverse('emergency-card', args=[self.token])
+
+    def test_token_never_reaches_access_log(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+
+        event = AccessEvent.objects.get(action='emergency_card')
+        self.assertEqual(event.patient_id, self.patient.pk)
+        self.assertNotIn(self.token, event.path)
+        self.assertNotIn(self.token, json.dumps(event.detail))
+        self.assertEqual(event.detail['token_hash'], token_hash(self.token))
+
+    def test_gzip_revalidation_returns_not_modified(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('W/'))
+
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_identity_revalidation_returns_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_revoked_token_refused_while_card_still_cached(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        # Révocation dans un autre worker : son on_commit ne vide pas ce cache-ci
+        revoke_token(self.patient)
+        self.assertIsNotNone(cache.get(f'emergency-card:{token_hash(self.token)}'))
+
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_card_rebuilt_elsewhere_served_fresh(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        EmergencyCard.objects.filter(patient=self.patient).update(payload=b'{"blood_type":"AB-"}', etag='"autre"')
+
+        response = self.client.get(self.url)
+        self.assertEqual(response['ETag'], '"autre"')
+        self.assertEqual(response.json(), {'blood_type': 'AB-'})
+
+
+@override_settings(AUDIT_ENABLED=False, THROTTLE_ENABLED=False, SINGLEFLIGHT_ENABLED=False)
+class RowSerializerParityTests(TestCase):
+    """fast_serializers doit produire exactement la sortie de MedicalRecordSerializer"""
+
+    @classmethod
+    def setUpTestData(cls):
+        doctor = create_doctor()
+        # Taille et poids non entiers : IMC arrondi ; date de naissance absente (None)
+        cls.patient = create_patient(blood_type='A-', height=172.5, weight=68.35, allergies='Latex')
+        with_tests = MedicalRecord.objects.create(
+            patient=cls.patient, created_by=doctor, record_type='test', title='Bilan sanguin',
+            description='Bilan annuel', diagnosis='RAS', file='medical_files/2024/01/15/bilan.pdf',
+        )
+        MedicalTest.objects.create(record=with_tests, test_name='Glycémie', test_date=date(2024, 1, 15),
+                                   result='0.95', unit='g/L', normal_range='0.70-1.10', lab_name='Labo Central')
+        MedicalTest.objects.create(record=with_tests, test_name='Cholestérol', test_date=date(2024, 1, 16),
+                                   result='1.80', unit='g/L')
+        # Auteur supprimé (clé étrangère nulle), aucun test, fichier absent
+        orphan = MedicalRecord.objects.create(
+            patient=cls.patient, created_by=None, record_type='consultation', title='Consultation',
+            description='Toux', is_emergency=True,
+        )
+        # Dates distinctes avec microsecondes : tri stable et rendu des datetimes
+        MedicalRecord.objects.filter(pk=with_tests.pk).update(
+            date=datetime(2024, 1, 15, 9, 30, 12, 123456, tzinfo=timezone.utc))
+        MedicalRecord.objects.filter(pk=orphan.pk).update(
+            date=datetime(2024, 2, 1, 17, 5, tzinfo=timezone.utc))
+
+    def setUp(self):
+        self.request = Request(RequestFactory().get('/api/medical-records/'))
+
+    def assertParity(self, fields=None, expand=None):
+        queryset = MedicalRecord.objects.filter(patient=self.patient).order_by('-date', '-id')
+        context = {'request': self.request}
+        expected = MedicalRecordSerializer(queryset, many=True, context=context, fields=fields, expand=expand).data
+        row_serializer = get_row_serializer(fields=fields, expand=expand, context=context)
+        self.assertIsNotNone(row_serializer)
+        actual = row_serializer.serialize(row_serializer.values(queryset))
+        self.assertEqual(actual, expected)
+        # Même JSON, ordre des clés compris
+        self.assertEqual(JSONRenderer().render(actual), JSONRenderer().render(expected))
+        return actual
+
+    def test_default_fields(self):
+        data = self.assertParity()
+        orphan, with_tests = data
+        self.assertIsNone(orphan['created_by'])
+        self.assertEqual(orphan['tests'], [])
+        self.assertIsNone(orphan['file'])
+        self.assertEqual(len(with_tests['tests']), 2)
+        self.assertEqual(with_tests['patient']['bmi'], self.patient.calculate_bmi())
+
+    def test_field_subsets(self):
+        for fields in (['id'], ['id', 'title'], ['id', 'patient', 'tests'], ['date', 'file', 'is_emergency'],
+                       ['created_by', 'diagnosis']):
+            with self.subTest(fields=fields):
+                self.assertParity(fields=fields)
+
+    def test_expand(self):
+        for expand in ([], ['patient'], ['tests'], ['created_by', 'tests'], ['patient', 'created_by', 'tests']):
+            with self.subTest(expand=expand):
+                self.assertParity(expand=expand)
+
+    def test_fields_and_expand(self):
+        self.assertParity(fields=['id', 'patient', 'created_by', 'tests'], expand=['created_by'])
+
+    def test_list_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(self.patient.user)
+        for query in ('', '?fields=id,title,date', '?expand=', '?expand=tests',
+                      '?fields=id,created_by,tests&expand=created_by'):
+            with self.subTest(query=query):
+                with override_settings(MEDICAL_RECORDS_FAST_SERIALIZER=False):
+                    expected = client.get('/api/medical-records/' + query)
+                actual = client.get('/api/medical-records/' + query)
+                self.assertEqual(actual.status_code, 200)
+                self.assertEqual(len(actual.json()['results']), 2)
+                self.assertEqual(actual.content, expected.content)
+
+
+@override_settings(AUDIT_ENABLED=False, THROTTLE_ENABLED=False, SINGLEFLIGHT_ENABLED=False,
+                   MEDICAL_RECORDS_FAST_SERIALIZER=False)
+class SparseFieldsetTests(TestCase):
+    """?fields= et ?expand= par le sérialiseur DRF : forme de la réponse et requêtes émises"""
+
+    @classmethod
+    def setUpTestData(cls):
+        doctor = create_doctor()
+        cls.doctor_user = doctor.user
+        for index in range(3):
+            patient = create_patient(email=f'patient-{index}@tohpitoh.local')
+            record = MedicalRecord.objects.create(patient=patient, created_by=doctor, record_type='test',
+                                                  title=f'Bilan {index}', description='Bilan annuel')
+            MedicalTest.objects.create(record=record, test_name='Glycémie', test_date=date(2024, 1, 15),
+                                       result='0.95')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor_user)
+
+    def listed(self, query=''):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/medical-records/' + query)
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual(len(results), 3)
+        return results, [query['sql'] for query in queries.captured_queries]
+
+    def test_serializer_keeps_requested_fields(self):
+        record = MedicalRecord.objects.first()
+        self.assertEqual(set(MedicalRecordSerializer(record, fields=['id', 'title']).data), {'id', 'title'})
+
+        data = MedicalRecordSerializer(record, expand=['tests']).data
+        self.assertEqual(data['patient'], record.patient_id)
+        self.assertEqual(data['created_by'], record.created_by_id)
+        self.assertEqual(data['tests'][0]['test_name'], 'Glycémie')
+
+    def test_fields_reduce_payload_and_queries(self):
+        full, full_queries = self.listed()
+        self.assertIn('description', full[0])
+        self.assertIsInstance(full[0]['patient'], dict)
+
+        sparse, sparse_queries = self.listed('?fields=id,title')
+        self.assertEqual([set(result) for result in sparse], [{'id', 'title'}] * 3)
+        # Ni prefetch des tests ni jointure des profils ; colonnes non demandées non lues
+        self.assertLess(len(sparse_queries), len(full_queries))
+        records_query = sparse_queries[-1]
+        self.assertNotIn('"description"', records_query)
+        self.assertNotIn('JOIN', records_query)
+
+    def test_expand_reduces_relations_to_ids(self):
+        full, full_queries = self.listed()
+        collapsed, collapsed_queries = self.listed('?expand=')
+        self.assertEqual([set(result) for result in collapsed], [set(result) for result in full])
+        for result in collapsed:
+            self.assertIsInstance(result['patient'], int)
+            self.assertIsInstance(result['created_by'], int)
+            self.assertEqual(len(result['tests']), 1)
+            self.assertIsInstance(result['tests'][0], int)
+
+        # Mêmes requêtes en nombre, sans jointure des profils patient et docteur
+        self.assertEqual(len(collapsed_queries), len(full_queries))
+        self.assertTrue(any('JOIN' in sql for sql in full_queries))
+        self.assertFalse(any('JOIN' in sql for sql in collapsed_queries))
+
+
+def pdf_pages(data):
+    """Texte extrait de chaque page d'un carnet, sans la ligne horodatée de l'en-tête"""
+    from pypdf import PdfReader
+
+    return [[line for line in page.extract_text().splitlines() if not line.startswith('Généré le')]
+            for page in PdfReader(io.BytesIO(data)).pages]
+
+
+class IncrementalPdfTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        doctor = create_doctor()
+        cls.patient = create_patient(blood_type='B+')
+        for index in range(30):
+            record = MedicalRecord.objects.create(
+                patient=cls.patient, created_by=doctor, record_type='consultation', title=f'Visite-{index:02d}',
+                description='Douleurs abdominales depuis trois jours, sans fièvre. ' * (index % 7 + 1),
+                diagnosis='Gastrite', prescription='Réhydratation orale',
+            )
+            for number in range(index % 5):
+                MedicalTest.objects.create(record=record, test_name=f'Test-{index:02d}-{number}',
+                                           test_date=date(2024, 1, 15), result='0.95 g/L', normal_range='0.70-1.10')
+        cls.records = list(records_for_pdf(cls.patient))
+
+    def setUp(self):
+        caches['pdf_fragments'].clear()
+
+    def test_fragments_kept_out_of_shared_cache(self):
+        generate_medical_record_pdf_incremental(self.records, self.patient)
+        key = fragment_cache_key(self.records[0])
+        self.assertIsNotNone(caches['pdf_fragments'].get(key))
+        self.assertIsNone(cache.get(key))
+
+    def test_same_pages_as_full_render(self):
+        # Coupes entre lignes et rangées, espaces supprimés en haut de page : la pagination de reportlab
+        full = pdf_pages(generate_medical_record_pdf(self.records, self.patient).getvalue())
+        incremental = pdf_pages(generate_medical_record_pdf_incremental(self.records, self.patient).getvalue())
+        self.assertGreater(len(full), 3)
+        self.assertEqual(incremental, full)
+        # Un dossier coupé entre deux pages n'y est pas dessiné deux fois
+        text = [line for page in incremental for line in page]
+        for index in range(30):
+            self.assertEqual(text.count(f'Visite-{index:02d}'), 1)
+
+    def test_assembled_carnet_skips_whole_document_optimization(self):
+        from pypdf import PdfReader
+        from pypdf.generic import StreamObject
+
+        with mock.patch('medical_records.pdf_optimize.optimize_pdf') as optimize_pdf:
+            generate_medical_record_pdf_incremental(self.records, self.patient)
+            # Second export : tous les fragments viennent du cache
+            data = generate_medical_record_pdf_incremental(self.records, self.patient).getvalue()
+        optimize_pdf.assert_not_called()
+
+        # Flux déjà compressés, sans couche ASCII85
+        reader = PdfReader(io.BytesIO(data))
+        for number in range(1, reader.trailer['/Size']):
+            obj = reader.get_object(number)
+            if isinstance(obj, StreamObject):
+                filters = obj.get('/Filter')
+                self.assertIn(filters, ('/FlateDecode', ['/FlateDecode']), number)
+
+
+@override_settings(AUDIT_ENABLED=False, THROTTLE_ENABLED=False)
+class AdminChangelistTests(TestCase):
+    """Nombre de requêtes des listes de l'admin indépendant du nombre de lignes affichées"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(email='admin@tohpitoh.local', password='motdepasse')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def add_records(self, count):
+        start = MedicalRecord.objects.count()
+        for index in range(start, start + count):
+            doctor = create_doctor(email=f'docteur-{index}@tohpitoh.local', medical_license=f'LIC-{index:03d}')
+            patient = create_patient(email=f'patient-{index}@tohpitoh.local')
+            record = MedicalRecord.objects.create(patient=patient, created_by=doctor, record_type='consultation',
+                                                  title=f'Consultation {index}', description='Contrôle')
+            MedicalTest.objects.create(record=record, test_name='Glycémie', test_date=date(2024, 1, 15),
+                                       result='0.95')
+
+    def queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        urls = [reverse('admin:medical_records_medicalrecord_changelist'),
+                reverse('admin:medical_records_medicaltest_changelist'),
+                reverse('admin:core_patient_changelist'),
+                reverse('admin:core_doctor_changelist'),
+                reverse('admin:autocomplete') + '?app_label=medical_records&model_name=medicalrecord'
+                                                '&field_name=patient&term=patient']
+        self.add_records(2)
+        few = [self.queries(url) for url in urls]
+        self.add_records(10)
+        self.assertEqual([self.queries(url) for url in urls], few)
+
+    def test_forms_use_autocomplete_and_raw_id_widgets(self):
+        self.add_records(2)
+        record = MedicalRecord.objects.get(title='Consultation 0')
+        content = self.client.get(reverse('admin:medical_records_medicalrecord_change', args=[record.pk])).content
+        self.assertIn(b'admin-autocomplete', content)
+        # Seuls le patient et le docteur choisis sont rendus, pas la liste de tous les comptes
+        self.assertEqual(content.count(b'Patient: Awa Diallo'), 1)
+        self.assertEqual(content.count(b'Dr. Koffi Mensah'), 1)
+
+        test = record.tests.get()
+        content = self.client.get(reverse('admin:medical_records_medicaltest_change', args=[test.pk])).content
+        self.assertIn(b'vForeignKeyRawIdAdminField', content)
+        self.assertNotIn(b'Consultation 1', content)
+
+
+@override_settings(AUDIT_ENABLED=False, THROTTLE_ENABLED=False, SINGLEFLIGHT_ENABLED=False, CARE_TEAM_ENFORCEMENT=True)
+class CareTeamTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = create_doctor()
+        cls.followed = create_patient(email='suivi@tohpitoh.local')
+        cls.other = create_patient(email='autre@tohpitoh.local')
+        cls.membership = CareTeamMembership.objects.create(doctor=cls.doctor, patient=cls.followed)
+        cls.followed_record = MedicalRecord.objects.create(patient=cls.followed, created_by=cls.doctor,
+                                                           record_type='consultation', title='Suivi', description='-')
+        cls.other_record = MedicalRecord.objects.create(patient=cls.other, created_by=cls.doctor,
+                                                        record_type='consultation', title='Autre', description='-')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor.user)
+
+    def listed(self):
+        response = self.client.get('/api/medical-records/')
+        self.assertEqual(response.status_code, 200)
+        return [record['id'] for record in response.json()['results']]
+
+    def test_list_limited_to_followed_patients(self):
+        self.assertEqual(self.listed(), [self.followed_record.pk])
+        with override_settings(CARE_TEAM_ENFORCEMENT=False):
+            self.assertCountEqual(self.listed(), [self.followed_record.pk, self.other_record.pk])
+
+    def test_object_permission(self):
+        request = Request(RequestFactory().get('/'))
+        request.user = self.doctor.user
+        permission = IsOwnerOrDoctor()
+        self.assertTrue(permission.has_object_permission(request, None, self.followed_record))
+        self.assertFalse(permission.has_object_permission(request, None, self.other_record))
+        self.assertFalse(permission.has_object_permission(request, None, self.other))
+
+        self.assertEqual(self.client.get(f'/api/medical-records/{self.other_record.pk}/').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/medical-records/export/?patient_id={self.other.pk}').status_code, 404)
+
+    def test_create_refused_outside_team(self):
+        payload = {'record_type': 'consultation', 'title': 'Visite', 'description': '-'}
+        response = self.client.post('/api/medical-records/', dict(payload, patient_id=self.other.pk), format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(MedicalRecord.objects.filter(patient=self.other, title='Visite').exists())
+
+        response = self.client.post('/api/medical-records/', dict(payload, patient_id=self.followed.pk), format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_access_revoked_as_soon_as_membership_deleted(self):
+        self.assertEqual(self.client.get(f'/api/medical-records/{self.followed_record.pk}/').status_code, 200)
+        scope = care_team_scope(self.doctor.user)
+
+        # Aucun cache vidé : un autre worker doit voir le retrait immédiatement
+        self.membership.delete()
+        self.assertFalse(can_access_patient(self.doctor.user, self.followed.pk))
+        self.assertNotEqual(care_team_scope(self.doctor.user), scope)
+        self.assertEqual(self.listed(), [])
+        self.assertEqual(self.client.get(f'/api/medical-records/{self.followed_record.pk}/').status_code, 404)
+
+
+@override_settings(AUDIT_ENABLED=False, THROTTLE_ENABLED=False, SINGLEFLIGHT_ENABLED=True)
+class PatientSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = create_doctor()
+        cls.patient = create_patient()
+        MedicalRecord.objects.create(patient=cls.patient, created_by=cls.doctor, record_type='consultation',
+                                     title='Visite', description='-')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor.user)
+
+    def search(self, term):
+        response = self.client.get('/api/medical-records/search/patients/', {'search': term})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_identical_search_shared_until_account_edited(self):
+        self.assertEqual(self.search('Diallo')['X-Single-Flight'], 'computed')
+        self.assertEqual(self.search('Diallo')['X-Single-Flight'], 'shared')
+
+        # Nom modifié : la version des données change, le résultat partagé n'est plus servi
+        user = self.patient.user
+        user.last_name = 'Traoré'
+        user.save()
+        response = self.search('Diallo')
+        self.assertEqual(response['X-Single-Flight'], 'computed')
+        self.assertEqual(response.json()['results'], [])
+        self.assertEqual(len(self.search('Traoré').json()['results']), 1)
+
+
+@override_settings(AUDIT_ENABLED=False, THROTTLE_ENABLED=False, SINGLEFLIGHT_ENABLED=False)
+class ClinicalSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        doctor = create_doctor()
+        patient = create_patient()
+        cls.doctor_user = doctor.user
+
+        def record(record_type='consultation', **fields):
+            return MedicalRecord.objects.create(patient=patient, created_by=doctor, record_type=record_type,
+                                                **dict({'title': 'Visite', 'description': '-'}, **fields))
+
+        cls.titled = record(title='Hypertension artérielle', diagnosis='Hypertension sévère')
+        cls.noted = record(notes="Antécédents familiaux d'hypertension, suivi annuel sans traitement particulier")
+        cls.prescribed = record('prescription', title='Ordonnance', prescription='Amlodipine pour hypertension',
+                                description='Tension <b>élevée</b> au repos')
+        MedicalRecord.objects.filter(pk=cls.noted.pk).update(date=datetime(2026, 1, 10, 9, tzinfo=timezone.utc))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor_user)
+
+    def search(self, **params):
+        response = self.client.get('/api/medical-records/search/clinical/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['results']
+
+    def found(self, **params):
+        return [result['id'] for result in self.search(**params)]
+
+    def test_indexed_search_active(self):
+        self.assertEqual(search_backend(), 'fts5')
+
+    def test_accents_ignored_and_terms_used_as_prefixes(self):
+        self.assertEqual(self.found(q='elevee'), [self.prescribed.pk])
+        self.assertEqual(self.found(q='ÉLEVÉE'), [self.prescribed.pk])
+        self.assertCountEqual(self.found(q='hyperten'), [self.titled.pk, self.noted.pk, self.prescribed.pk])
+        self.assertEqual(self.found(q='hyperten amlo'), [self.prescribed.pk])
+
+    def test_excluded_term(self):
+        self.assertCountEqual(self.found(q='hypertension -amlodipine'), [self.titled.pk, self.noted.pk])
+        self.assertEqual(self.found(q='-hypertension'), [])
+
+    def test_ranked_by_weighted_fields(self):
+        results = self.search(q='hypertension')
+        # Titre et diagnostic (poids A) avant l'ordonnance (B), puis les notes (D)
+        self.assertEqual([result['id'] for result in results], [self.titled.pk, self.prescribed.pk, self.noted.pk])
+        ranks = [result['rank'] for result in results]
+        self.assertEqual(ranks, sorted(ranks, reverse=True))
+
+    def test_highlights_escaped(self):
+        highlights = self.search(q='elevee')[0]['highlights']
+        self.assertEqual(highlights, {'description': 'Tension &lt;b&gt;<mark>élevée</mark>&lt;/b&gt; au repos'})
+        self.assertEqual(set(self.search(q='hypertension')[0]['highlights']), {'title', 'diagnosis'})
+
+    def test_record_type_and_date_filters(self):
+        self.assertEqual(self.found(q='hypertension', record_type='prescription'), [self.prescribed.pk])
+        self.assertEqual(self.found(q='hypertension', date_to='2026-01-31'), [self.noted.pk])
+        self.assertCountEqual(self.found(q='hypertension', date_from='2026-02-01'),
+                              [self.titled.pk, self.prescribed.pk])
+        self.assertEqual(self.found(q='hypertension', date_from='2026-01-10', date_to='2026-01-10'), [self.noted.pk])
+
+        response = self.client.get('/api/medical-records/search/clinical/', {'q': 'hypertension', 'record_type': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(AUDIT_ENABLED=False, THROTTLE_ENABLED=False, SINGLEFLIGHT_ENABLED=False,
+                   MEDICAL_RECORDS_EXPORT_CHUNK_SIZE=2)
+class HistoryExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = create_doctor()
+        cls.patient = create_patient()
+        cls.other = create_patient(email='autre@tohpitoh.local')
+        for index, patient in enumerate([cls.patient] * 5 + [cls.other]):
+            record = MedicalRecord.objects.create(patient=patient, created_by=cls.doctor, record_type='test',
+                                                  title=f'Bilan {index}', description='Bilan "annuel"\nà jeun')
+            MedicalTest.objects.create(record=record, test_name='Glycémie', test_date=date(2024, 1, 15),
+                                       result='0.95')
+            MedicalRecord.objects.filter(pk=record.pk).update(date=datetime(2024, 1, 1 + index, tzinfo=timezone.utc))
+        # Deux plus anciens archivés : l'export couvre tout l'historique
+        oldest = list(records_for_pdf(cls.patient).order_by('date')[:2])
+        cls.archived_ids = [record.pk for record in oldest]
+        archive_batch(oldest)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient.user)
+
+    def expected(self):
+        """Même contenu que l'API : dossiers courants puis archivés, rendus en JSON"""
+        current = MedicalRecord.objects.filter(patient=self.patient)
+        archived = archived_records_for(self.patient)
+        data = MedicalRecordSerializer([*current, *archived], many=True).data
+        return json.loads(JSONRenderer().render(data))
+
+    def export(self, **params):
+        response = self.client.get('/api/medical-records/export/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode('utf-8')
+
+    def test_ndjson_stream(self):
+        response, content = self.export()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="carnet_medical_Diallo.ndjson"')
+        lines = content.splitlines()
+        # Retours à la ligne des champs échappés : un dossier par ligne
+        self.assertEqual(len(lines), 5)
+        self.assertTrue(content.endswith('\n'))
+        records = [json.loads(line) for line in lines]
+        self.assertEqual(records, self.expected())
+        self.assertEqual([record['id'] for record in records[-2:]], sorted(self.archived_ids, reverse=True))
+        self.assertEqual(records[0]['description'], 'Bilan "annuel"\nà jeun')
+        self.assertEqual(records[-1]['tests'][0]['test_name'], 'Glycémie')
+
+    def test_json_array(self):
+        response, content = self.export(output='json')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(content), self.expected())
+
+        response = self.client.get('/api/medical-records/export/', {'output': 'csv'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_access_control(self):
+        # Un patient n'exporte que son propre carnet, patient_id ignoré
+        _, content = self.export(patient_id=self.other.pk)
+        self.assertEqual(len(content.splitlines()), 5)
+
+        self.client.force_authenticate(self.doctor.user)
+        self.assertEqual(self.client.get('/api/medical-records/export/').status_code, 400)
+        self.assertEqual(self.client.get('/api/medical-records/export/', {'patient_id': 0}).status_code, 404)
+        _, content = self.export(patient_id=self.other.pk)
+        self.assertEqual(len(content.splitlines()), 1)
+        with override_settings(CARE_TEAM_ENFORCEMENT=True):
+            response = self.client.get('/api/medical-records/export/', {'patient_id': self.other.pk})
+            self.assertEqual(response.status_code, 404)
+
+        admin = User.objects.create_user(email='admin@tohpitoh.local', user_type='admin')
+        self.client.force_authenticate(admin)
+        self.assertEqual(self.client.get('/api/medical-records/export/').status_code, 403)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get('/api/medical-records/export/').status_code, 401)
+
+
+class InlinePool:
+    """Rendus exécutés sur place : la base de test n'est pas visible des processus du pool"""
+
+    def submit(self, function, *args):
+        future = Future()
+        try:
+            future.set_result(function(*args))
+        except Exception as exc:
+            future.set_exception(exc)
+        return future
+
+
+@override_settings(AUDIT_ENABLED=False, THROTTLE_ENABLED=False)
+class CohortExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = create_doctor()
+        cls.patients = [create_patient(email=f'patient-{index}@tohpitoh.local') for index in range(2)]
+        for patient in cls.patients:
+            MedicalRecord.objects.create(patient=patient, created_by=cls.doctor, record_type='consultation',
+                                         title='Visite', description='Contrôle de routine.')
+
+    def setUp(self):
+        cache.clear()
+        caches['pdf_fragments'].clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor.user)
+        pool = mock.patch('medical_records.pdf_export.pdf_pool', return_value=InlinePool())
+        pool.start()
+        self.addCleanup(pool.stop)
+
+    def post(self, **data):
+        return self.client.post('/api/medical-records/export_cohort/', data, format='json')
+
+    def archive(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        return zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_one_carnet_per_patient(self):
+        archive = self.archive(self.post(patient_ids=[patient.pk for patient in self.patients]))
+        expected = [cohort_filename(patient.pk, 'Diallo') for patient in self.patients]
+        self.assertCountEqual(archive.namelist(), expected)
+        for name in expected:
+            self.assertIn('Visite', [line for page in pdf_pages(archive.read(name)) for line in page])
+
+    def test_failed_patient_noted_without_losing_the_others(self):
+        failing = self.patients[1].pk
+
+        def render(patient_id):
+            if patient_id == failing:
+                raise MemoryError
+            return render_patient_pdf(patient_id)
+
+        with mock.patch('medical_records.pdf_export.render_patient_pdf', side_effect=render):
+            archive = self.archive(self.post(patient_ids=[patient.pk for patient in self.patients]))
+        self.assertCountEqual(archive.namelist(),
+                              [cohort_filename(self.patients[0].pk, 'Diallo'), 'erreurs.txt'])
+        self.assertIn(cohort_filename(failing, 'Diallo'), archive.read('erreurs.txt').decode())
+
+    def test_selection_limits(self):
+        self.assertEqual(self.post().status_code, 400)
+        self.assertEqual(self.post(patient_ids=[0]).status_code, 404)
+        with override_settings(PDF_COHORT_MAX_PATIENTS=1):
+            self.assertEqual(self.post(patient_ids=[patient.pk for patient in self.patients]).status_code, 400)
+
+    @override_settings(THROTTLE_ENABLED=True)
+    def test_cost_throttled(self):
+        # Place simultanée de l'utilisateur déjà prise par un autre export
+        slots = ConcurrencySlots(f'throttle:slots:pdf:user:{self.doctor.user.pk}', 1)
+        self.assertTrue(slots.acquire())
+        response = self.post(patient_ids=[self.patients[0].pk])
+        self.assertEqual(response.status_code, 429)
+        slots.release()
+
+    @override_settings(THROTTLE_ENABLED=True)
+    def test_slot_held_until_stream_closed(self):
+        patient_ids = [self.patients[0].pk]
+        first = self.post(patient_ids=patient_ids)
+        self.assertEqual(first.status_code, 200)
+        # ZIP pas encore produit : la place de l'utilisateur reste prise
+        self.assertEqual(self.post(patient_ids=patient_ids).status_code, 429)
+
+        self.assertEqual(len(self.archive(first).namelist()), 1)
+        first.close()
+        response = self.post(patient_ids=patient_ids)
+        self.assertEqual(response.status_code, 200)
+        # Flux abandonné sans lecture : la fermeture libère aussi la place
+        response.close()
+        self.assertEqual(self.post(patient_ids=patient_ids).status_code, 200)
+
+
+@override_settings(AUDIT_ENABLED=False, THROTTLE_ENABLED=False)
+class ArchiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = create_doctor()
+        cls.patient = create_patient()
+        cls.other = create_patient(email='autre@tohpitoh.local')
+        for index, patient in enumerate([cls.patient] * 5 + [cls.other]):
+            record = MedicalRecord.objects.create(patient=patient, created_by=cls.doctor, record_type='consultation',
+                                                  title=f'Ancien {index}', description='Contrôle',
+                                                  file='medical_files/2014/03/02/bilan.pdf')
+            MedicalTest.objects.create(record=record, test_name='Glycémie', test_date=date(2014, 3, 2),
+                                       result='0.95', unit='g/L')
+            # Horodatage à la microseconde, conservé par l'archive
+            MedicalRecord.objects.filter(pk=record.pk).update(
+                date=datetime(2014, 3, 2 + index % 3, 8, 30, 15, 123456, tzinfo=timezone.utc))
+
+    def records(self, patient):
+        return list(records_for_pdf(patient).order_by('-date', '-id'))
+
+    def test_round_trip(self):
+        records = self.records(self.patient)
+        before = MedicalRecordSerializer(records, many=True).data
+        changes = RecordChange.objects.count()
+
+        self.assertEqual(archive_batch(records), 5)
+
+        self.assertFalse(MedicalRecord.objects.filter(patient=self.patient).exists())
+        self.assertFalse(MedicalTest.objects.filter(record_id__in=[record.pk for record in records]).exists())
+        # Le dossier change de stockage sans changer : rien à synchroniser
+        self.assertEqual(RecordChange.objects.count(), changes)
+        restored = archived_records_for(self.patient)
+        self.assertEqual(MedicalRecordSerializer(restored, many=True).data, before)
+        self.assertEqual(restored[0].created_by.user.last_name, 'Mensah')
+        self.assertEqual(restored[0].file.name, 'medical_files/2014/03/02/bilan.pdf')
+
+    def test_archived_record_served_by_the_api(self):
+        record = self.records(self.patient)[0]
+        archive_batch([record])
+        client = APIClient()
+        client.force_authenticate(self.patient.user)
+        response = client.get(f'/api/medical-records/{record.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['title'], record.title)
+        client.force_authenticate(self.other.user)
+        self.assertEqual(client.get(f'/api/medical-records/{record.pk}/').status_code, 404)
+
+    def test_iter_archived_records(self):
+        expected = [record.pk for record in self.records(self.patient)]
+        archive_batch(self.records(self.patient) + self.records(self.other))
+
+        # Blocs de 2 : l'ordre (-date, -id) est conservé d'un bloc à l'autre
+        records = list(iter_archived_records(self.patient, chunk_size=2))
+        self.assertEqual([record.pk for record in records], expected)
+        self.assertTrue(all(record.patient is self.patient for record in records))
+        self.assertEqual([len(record.tests.all()) for record in records], [1] * 5)
+
+    def test_command_archives_only_old_records(self):
+        recent = MedicalRecord.objects.create(patient=self.patient, created_by=self.doctor,
+                                              record_type='consultation', title='Récent', description='-')
+        call_command('archive_medical_records', older_than_years=5, batch_size=4, stdout=io.StringIO())
+        self.assertEqual(list(MedicalRecord.objects.values_list('pk', flat=True)), [recent.pk])
+        self.assertEqual(ArchivedMedicalRecord.objects.count(), 6)
+
+    def test_test_to_record_foreign_key_kept_in_database(self):
+        constraints = connection.introspection.get_constraints(connection.cursor(), MedicalTest._meta.db_table)
+        self.assertIn((MedicalRecord._meta.db_table, 'id'),
+                      [constraint['foreign_key'] for constraint in constraints.values()])
+
+
+@override_settings(AUDIT_ENABLED=False, THROTTLE_ENABLED=False, SYNC_SAFETY_SECONDS=0)
+class SyncTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = create_doctor()
+        cls.patient = create_patient()
+        cls.records = [MedicalRecord.objects.create(patient=cls.patient, created_by=cls.doctor,
+                                                    record_type='consultation', title=f'Visite {index}',
+                                                    description='-') for index in range(3)]
+        cls.test = MedicalTest.objects.create(record=cls.records[0], test_name='Glycémie',
+                                              test_date=date(2024, 1, 15), result='0.95')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient.user)
+
+    def sync(self, token=None, status=200):
+        response = self.client.get('/api/medical-records/sync/', {'token': token} if token else {})
+        self.assertEqual(response.status_code, status)
+        return response.json()
+
+    def test_first_sync_returns_everything(self):
+        data = self.sync()
+        self.assertTrue(data['reset'])
+        self.assertFalse(data['has_more'])
+        self.assertCountEqual([record['id'] for record in data['records']], [record.pk for record in self.records])
+        self.assertEqual(read_token(data['token'], self.patient), RecordChange.objects.order_by('-id').first().pk)
+
+    def test_delta_after_update(self):
+        token = self.sync()['token']
+        self.assertEqual(self.sync(token)['records'], [])
+
+        record = self.records[1]
+        record.title = 'Visite corrigée'
+        record.save()
+        self.test.result = '1.02'
+        self.test.save()
+        data = self.sync(token)
+        self.assertFalse(data['reset'])
+        self.assertEqual([(item['id'], item['title']) for item in data['records']], [(record.pk, 'Visite corrigée')])
+        self.assertEqual([(item['id'], item['result']) for item in data['tests']], [(self.test.pk, '1.02')])
+
+    def test_tombstones_after_delete(self):
+        token = self.sync()['token']
+        record_id, test_id = self.records[2].pk, self.test.pk
+        self.test.delete()
+        self.records[2].delete()
+        data = self.sync(token)
+        self.assertEqual(data['deleted'], {'records': [record_id], 'tests': [test_id]})
+        self.assertEqual(data['records'], [])
+
+    def test_cascade_deletes_tests_of_the_record(self):
+        token = self.sync()['token']
+        record_id, test_id = self.records[0].pk, self.test.pk
+        self.records[0].delete()
+        data = self.sync(token)
+        self.assertEqual(data['deleted'], {'records': [record_id], 'tests': [test_id]})
+
+    def test_expired_or_tampered_token(self):
+        token = self.sync()['token']
+        later = time.time() + (settings.SYNC_RETENTION_DAYS + 1) * 86400
+        with mock.patch('django.core.signing.time.time', return_value=later):
+            self.assertTrue(self.sync(token)['reset'])
+
+        self.sync(token[:-1] + ('A' if token[-1] != 'A' else 'B'), status=400)
+        other = create_patient(email='autre@tohpitoh.local')
+        self.sync(make_token(other, 0), status=400)
+
+    @override_settings(SYNC_PAGE_SIZE=2)
+    def test_paging_with_has_more(self):
+        token, seen, pages = make_token(self.patient, 0), set(), 0
+        while True:
+            data = self.sync(token)
+            pages += 1
+            seen.update(item['id'] for item in data['records'])
+            token = data['token']
+            if not data['has_more']:
+                break
+        # 3 dossiers et 1 test : 4 entrées, 2 par page
+        self.assertEqual(pages, 2)
+        self.assertEqual(seen, {record.pk for record in self.records})
+        self.assertEqual(self.sync(token)['records'], [])
+
+    @override_settings(SYNC_PAGE_SIZE=2, SYNC_SAFETY_SECONDS=3600)
+    def test_full_page_does_not_skip_the_safety_cutoff(self):
+        data = self.sync(make_token(self.patient, 0))
+        self.assertEqual(len(data['records']), 2)
+        # Entrées trop récentes : position inchangée, renvoyées à l'appel suivant
+        self.assertFalse(data['has_more'])
+        self.assertEqual(read_token(data['token'], self.patient), 0)
+
+    def test_compact_keeps_newest_entry_per_object(self):
+        for title in ('Première', 'Deuxième', 'Dernière'):
+            self.records[0].title = title
+            self.records[0].save()
+        newest = RecordChange.objects.filter(kind='record', object_id=self.records[0].pk).order_by('-id').first()
+        RecordChange.objects.filter(kind='record', object_id=self.records[1].pk).update(
+            changed_at=django_timezone.now() - timedelta(days=settings.SYNC_RETENTION_DAYS + 1))
+
+        self.assertEqual(compact(dry_run=True), (1, 3))
+        self.assertEqual(compact(), (1, 3))
+        remaining = RecordChange.objects.values_list('kind', 'object_id')
+        self.assertEqual(len(remaining), len(set(remaining)))
+        self.assertNotIn(('record', self.records[1].pk), remaining)
+        self.assertTrue(RecordChange.objects.filter(pk=newest.pk).exists())
+
+
+class InlineProcessPool(InlinePool):
+    """process_pool() remplacé : même interface de gestionnaire de contexte, rendus sur place"""
+
+    def __init__(self, max_workers=None, memory_limit_mb=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+@override_settings(AUDIT_ENABLED=False, THROTTLE_ENABLED=False)
+class AnalyticsExportTests(TestCase):
+    # Minuit heure locale : bornes des tranches [since, until[
+    DAYS = (date(2024, 1, 1), date(2024, 1, 15), date(2024, 1, 31), date(2024, 2, 1), date(2024, 3, 10))
+
+    @classmethod
+    def setUpTestData(cls):
+        doctor = create_doctor()
+        cls.patients = [create_patient(email=f'patient-{index}@tohpitoh.local') for index in range(2)]
+        cls.admin = User.objects.create_superuser(email='admin@tohpitoh.local', password='motdepasse',
+                                                  user_type='admin')
+        # Dates croissantes avec les identifiants : l'ordre des tranches est celui de l'export complet
+        for index, day in enumerate(cls.DAYS):
+            record = MedicalRecord.objects.create(patient=cls.patients[index % 2], created_by=doctor,
+                                                  record_type='consultation', title=f'Visite, "{index}"',
+                                                  description='Ligne 1\nLigne 2', is_emergency=index == 1)
+            moment = django_timezone.make_aware(datetime.combine(day, datetime.min.time()))
+            MedicalRecord.objects.filter(pk=record.pk).update(date=moment)
+            MedicalTest.objects.create(record=record, test_name='Glycémie', test_date=day, result='0.95')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def export(self, table, output, **params):
+        response = self.client.get('/api/medical-records/analytics/export/',
+                                   dict(params, table=table, output=output))
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def rows(self, table, output, **params):
+        content = self.export(table, output, **params)
+        if output == 'csv':
+            return list(csv.DictReader(io.StringIO(content)))
+        # Valeurs comparées sous leur forme CSV
+        return [{name: '' if value is None else str(value) for name, value in json.loads(line).items()}
+                for line in content.splitlines()]
+
+    def test_csv_and_ndjson_rows_match(self):
+        for table in ('records', 'tests'):
+            with self.subTest(table=table):
+                rows = self.rows(table, 'csv')
+                self.assertEqual(len(rows), len(self.DAYS))
+                self.assertEqual(rows, self.rows(table, 'ndjson'))
+        self.assertEqual(self.rows('records', 'csv')[1]['description'], 'Ligne 1\nLigne 2')
+
+    def test_pseudonym_replaces_patient_id(self):
+        rows = self.rows('records', 'csv')
+        expected = [pseudonym(self.patients[index % 2].pk) for index in range(len(self.DAYS))]
+        self.assertEqual([row['patient_id'] for row in rows], expected)
+        self.assertNotEqual(expected[0], expected[1])
+        self.assertRegex(expected[0], r'^[0-9a-f]{32}$')
+        # Stable d'un export et d'une table à l'autre : jointures possibles
+        self.assertEqual([row['patient_id'] for row in self.rows('tests', 'ndjson')], expected)
+
+        rows = self.rows('records', 'csv', pseudonymize='0')
+        self.assertEqual([row['patient_id'] for row in rows],
+                         [str(self.patients[index % 2].pk) for index in range(len(self.DAYS))])
+
+    def test_half_open_date_range(self):
+        records = list(MedicalRecord.objects.order_by('pk').values_list('pk', flat=True))
+        tests = list(MedicalTest.objects.order_by('pk').values_list('pk', flat=True))
+        for table, ids in (('records', records), ('tests', tests)):
+            with self.subTest(table=table):
+                # Minuit du 15 inclus, minuit du 1er février exclu (heure locale pour les dossiers)
+                rows = self.rows(table, 'ndjson', since='2024-01-15', until='2024-02-01')
+                self.assertEqual([row['id'] for row in rows], [str(pk) for pk in ids[1:3]])
+                rows = self.rows(table, 'csv', since='2024-02-01')
+                self.assertEqual([row['id'] for row in rows], [str(pk) for pk in ids[3:]])
+
+    def test_parallel_files_concatenate_to_the_full_export(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        for table in ('records', 'tests'):
+            for output in ('csv', 'ndjson'):
+                with self.subTest(table=table, output=output):
+                    full = b''.join(export_stream(table, output, chunk_size=2)).decode()
+                    with mock.patch('medical_records.analytics_export.process_pool', InlineProcessPool):
+                        files = export_parallel(table, output, directory.name, parts=3, chunk_size=2)
+                    self.assertEqual(len(files), 3)
+                    self.assertEqual(sum(stats.rows for _, stats in files), len(self.DAYS))
+                    parts = []
+                    for index, (path, _) in enumerate(files):
+                        with open(path, encoding='utf-8') as part:
+                            lines = part.read().splitlines(keepends=True)
+                        # En-tête CSV répété dans chaque fichier
+                        parts.extend(lines[1:] if output == 'csv' and index else lines)
+                    self.assertEqual(''.join(parts), full)
+
+    def test_reserved_to_admins(self):
+        self.client.force_authenticate(self.patients[0].user)
+        response = self.client.get('/api/medical-records/analytics/export/', {'table': 'records'})
+        self.assertEqual(response.status_code, 403)
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import MedicalRecordViewSet, PatientSearchView
+from .views import MedicalRecordViewSet, PatientSearchView, ClinicalSearchView, AnalyticsExportView
 
 app_name = 'medical_records'
 
@@ -10,4 +10,6 @@ router.register(r'', MedicalRecordViewSet, basename='medical-record')
 urlpatterns = [
     path('', include(router.urls)),
     path('search/patients/', PatientSearchView.as_view(), name='patient-search'),
+    path('search/clinical/', ClinicalSearchView.as_view(), name='clinical-search'),
+    path('analytics/export/', AnalyticsExportView.as_view(), name='analytics-export'),
 ]
\ No newline at end of file
@@ -1,42 +1,179 @@
-from rest_framework import generics, viewsets, status, filters
+from rest_framework import generics, viewsets, status, filters, serializers
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
-from django.http import FileResponse
+from django.conf import settings
+from django.db import transaction
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from django.views.decorators.http import require_safe
 import io
+import json
 
 from .models import MedicalRecord, MedicalTest
-from .serializers import MedicalRecordSerializer, MedicalRecordCreateSerializer
-from .pdf_generator import generate_medical_record_pdf
-from core.permissions import IsDoctor, IsPatient, IsOwnerOrDoctor
-from core.models import Patient, Doctor
+from .serializers import MedicalRecordSerializer, MedicalRecordCreateSerializer, CohortExportSerializer, MedicalTestSerializer, \
+    ClinicalSearchResultSerializer, ClinicalSearchParamsSerializer, AnalyticsExportSerializer
+from .fieldsets import SparseFieldsetMixin
+from .fast_serializers import RowSerializerListMixin
+from .exports import EXPORT_FORMATS
+from .analytics_export import FORMATS as ANALYTICS_FORMATS, export_stream
+from .pdf_export import full_history_for_pdf, carnet_version, cohort_filename, stream_cohort_zip
+from .archive import iter_archived_records, load_archived
+from .search import highlights, search
+from .emergency import build_card, card_for_token, issue_token, revoke_token, token_hash
+from .changes import ChangeSet, InvalidSyncToken, current_position, latest_position, make_token, read_token
+from .models import ArchivedMedicalRecord, EmergencyCard
+from core.permissions import IsAdmin, IsDoctor, IsPatient, IsOwnerOrDoctor
+from core.models import Patient, Doctor, User
+from core.throttling import CostThrottleMixin
+from core.db_router import ReplicaReadMixin
+from core.singleflight import coalesce, request_key
+from core.care_team import can_access_patient, care_team_scope, filter_for_care_team
+from audit.events import record_access, record_response_access, record_rows_access
+from notifications.outbox import notify_record_created
 
-class MedicalRecordViewSet(viewsets.ModelViewSet):
+def search_cost(text):
+    # Plus le terme le plus long est court, plus la recherche parcourt de lignes
+    longest = max((len(term) for term in text.replace(',', ' ').split()), default=0)
+    return 1 + max(0, settings.THROTTLE_SEARCH_SHORT_TERM - longest)
+
+def search_version():
+    """
+    Version des données cherchées : journal des écritures, archivage (qui n'écrit pas au journal)
+    et dernière modification d'un compte (nom, email et téléphone cherchés, nom affiché)
+    """
+    archived = ArchivedMedicalRecord.objects.order_by('-id').values_list('id', flat=True).first()
+    user_updated = User.objects.order_by('-updated_at').values_list('updated_at', flat=True).first()
+    return latest_position(), archived or 0, user_updated
+
+def single_flight_header(response, shared):
+    response['X-Single-Flight'] = 'shared' if shared else 'computed'
+    return response
+
+class MedicalRecordViewSet(ReplicaReadMixin, CostThrottleMixin, RowSerializerListMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated, IsOwnerOrDoctor]
+    throttle_cost_scope = 'pdf'
+    throttle_cost_actions = ('download_pdf', 'download_all_pdf', 'export_cohort')
+    # Jeton et données lus sur la même base : un réplica en retard fausserait la position
+    primary_read_actions = ('sync',)
     
     def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            # Génération du schéma OpenAPI
+            return MedicalRecord.objects.none()
+        
         user = self.request.user
         
         if user.user_type == 'doctor':
-            # Les docteurs voient tous les dossiers
-            return MedicalRecord.objects.all()
+            # Les docteurs voient les dossiers des patients de leur équipe de soins (tous si non appliquée)
+            queryset = filter_for_care_team(MedicalRecord.objects.all(), user)
         elif user.user_type == 'patient':
             # Les patients voient seulement leurs dossiers
             patient = Patient.objects.get(user=user)
-            return MedicalRecord.objects.filter(patient=patient)
-        return MedicalRecord.objects.none()
+            queryset = MedicalRecord.objects.filter(patient=patient)
+        else:
+            return MedicalRecord.objects.none()
+        return self.optimize_queryset(queryset)
+    
+    def uses_sparse_fieldsets(self):
+        return self.action in ('list', 'retrieve', 'my_records', 'export', 'sync')
+    
+    def get_target_patient(self, request):
+        """Patient visé : soi-même pour un patient, ?patient_id= pour un docteur"""
+        user = request.user
+        
+        if user.user_type == 'patient':
+            return Patient.objects.get(user=user), None
+        elif user.user_type == 'doctor':
+            patient_id = request.query_params.get('patient_id')
+            if not patient_id:
+                return None, Response({"detail": "patient_id requis."}, status=400)
+            
+            try:
+                patient = Patient.objects.get(id=patient_id)
+            except Patient.DoesNotExist:
+                return None, Response({"detail": "Patient non trouvé."}, status=404)
+            # Hors de l'équipe de soins : même réponse qu'un patient inexistant
+            if not can_access_patient(user, patient.pk):
+                return None, Response({"detail": "Patient non trouvé."}, status=404)
+            return patient, None
+        return None, Response({"detail": "Accès non autorisé."}, status=403)
+    
+    def get_throttle_cost(self, request):
+        # Coût d'un PDF : nombre de dossiers à rendre
+        if self.action == 'export_cohort':
+            patients = [patient_id for patient_id, _ in self.get_cohort_patients(request)]
+        elif self.action == 'download_all_pdf':
+            patient, error = self.get_target_patient(request)
+            if error is not None:
+                return 1
+            patients = [patient.pk]
+        else:
+            return 1
+        return max(1, MedicalRecord.objects.filter(patient_id__in=patients).count()
+                   + ArchivedMedicalRecord.objects.filter(patient_id__in=patients).count())
+    
+    def get_cohort_patients(self, request):
+        """Patients d'un export groupé, dans l'équipe de soins : [(id, nom)], au plus la limite + 1"""
+        if not hasattr(self, '_cohort_patients'):
+            serializer = self.get_serializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            patients = filter_for_care_team(serializer.get_patients(), request.user, patient_field='pk')
+            self._cohort_patients = list(
+                patients.values_list('id', 'user__last_name')[:settings.PDF_COHORT_MAX_PATIENTS + 1])
+        return self._cohort_patients
     
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
             return MedicalRecordCreateSerializer
+        if self.action == 'export_cohort':
+            return CohortExportSerializer
         return MedicalRecordSerializer
     
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        record_response_access(request, 'record_list', response)
+        return response
+    
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            instance = self.get_object()
+        except Http404:
+            instance = self.get_archived_object()
+        record_access(request, 'record_view', patient_id=instance.patient_id, record_id=instance.pk)
+        return Response(self.get_serializer(instance).data)
+    
+    def get_archived_object(self):
+        """Dossier archivé de même identifiant, avec les mêmes contrôles d'accès"""
+        archived = ArchivedMedicalRecord.objects.select_related('patient__user').filter(pk=self.kwargs['pk'])
+        if self.request.user.user_type == 'patient':
+            archived = archived.filter(patient__user=self.request.user)
+        elif self.request.user.user_type == 'doctor':
+            archived = filter_for_care_team(archived, self.request.user)
+        else:
+            archived = archived.none()
+        records = load_archived(archived)
+        if not records:
+            raise Http404
+        self.check_object_permissions(self.request, records[0])
+        return records[0]
+    
+    def iter_full_history(self, patient, chunk_size):
+        """Dossiers courants puis archivés d'un patient, sérialisés au fil de l'eau"""
+        yield from self.iter_records(MedicalRecord.objects.filter(patient=patient), chunk_size)
+        for record in iter_archived_records(patient, chunk_size):
+            yield self.get_serializer(record).data
+    
     def perform_create(self, serializer):
         user = self.request.user
         
         if user.user_type == 'doctor':
-            doctor = Doctor.objects.get(user=user)
+            doctor = Doctor.objects.select_related('user').get(user=user)
             patient_id = self.request.data.get('patient_id')
             
             if not patient_id:
@@ -46,8 +183,13 @@ class MedicalRecordViewSet(viewsets.ModelViewSet):
                 patient = Patient.objects.get(id=patient_id)
             except Patient.DoesNotExist:
                 raise serializers.ValidationError({"patient_id": "Patient non trouvé."})
+            if not can_access_patient(user, patient.pk):
+                raise serializers.ValidationError({"patient_id": "Patient non trouvé."})
             
-            serializer.save(patient=patient, created_by=doctor)
+            # Notification écrite dans la même transaction que le dossier, livrée hors requête
+            with transaction.atomic():
+                record = serializer.save(patient=patient, created_by=doctor)
+                notify_record_created(record)
         else:
             # Un patient ne peut pas créer son propre dossier médical
             raise serializers.ValidationError({"detail": "Vous n'avez pas la permission de créer des dossiers médicaux."})
@@ -60,8 +202,89 @@ class MedicalRecordViewSet(viewsets.ModelViewSet):
         
         patient = Patient.objects.get(user=request.user)
         records = MedicalRecord.objects.filter(patient=patient)
-        serializer = self.get_serializer(records, many=True)
-        return Response(serializer.data)
+        data = self.serialize_records(records)
+        if request.query_params.get('history') == 'full':
+            data = list(data) + self.get_serializer(list(iter_archived_records(patient)), many=True).data
+        record_rows_access(request, 'record_list', data)
+        return Response(data)
+    
+    @action(detail=False, methods=['get', 'post', 'delete'], url_path='emergency-card')
+    def emergency_card(self, request):
+        """
+        Fiche d'urgence du patient connecté. GET : contenu et état du jeton ;
+        POST : nouveau jeton (l'ancien est révoqué) et son URL, à encoder en
+        QR code ; DELETE : révoquer le jeton.
+        """
+        if request.user.user_type != 'patient':
+            return Response({"detail": "Réservé aux patients."}, status=403)
+        patient = Patient.objects.select_related('user').get(user=request.user)
+        
+        if request.method == 'POST':
+            token, card = issue_token(patient)
+            return Response({
+                'token': token,
+                'url': request.build_absolute_uri(reverse('emergency-card', args=[token])),
+                'created_at': card.token_created_at,
+            }, status=201)
+        if request.method == 'DELETE':
+            if not revoke_token(patient):
+                return Response({"detail": "Aucun jeton actif."}, status=404)
+            return Response(status=204)
+        
+        card = EmergencyCard.objects.filter(patient=patient).first() or build_card(patient)
+        return Response({
+            'card': json.loads(bytes(card.payload)),
+            'token_active': bool(card.token_hash),
+            'token_created_at': card.token_created_at,
+        })
+    
+    @action(detail=False, methods=['get'])
+    def sync(self, request):
+        """
+        Synchronisation incrémentale : ?token= renvoyé par l'appel précédent.
+
+        Sans jeton (ou jeton expiré), tous les dossiers courants sont renvoyés
+        avec reset=true ; sinon seuls les dossiers et tests créés, modifiés ou
+        supprimés depuis le jeton. Rappeler avec le nouveau jeton tant que
+        has_more est vrai.
+        """
+        patient, error = self.get_target_patient(request)
+        if error is not None:
+            return error
+        
+        token = request.query_params.get('token')
+        try:
+            since = read_token(token, patient) if token else None
+        except InvalidSyncToken as exc:
+            return Response({"detail": str(exc)}, status=400)
+        
+        if since is None:
+            position = current_position()
+            records = self.serialize_records(MedicalRecord.objects.filter(patient=patient))
+            data = {
+                'token': make_token(patient, position),
+                'reset': True,
+                'has_more': False,
+                'records': records,
+                'tests': [],
+                'deleted': {'records': [], 'tests': []},
+            }
+        else:
+            changes = ChangeSet(patient, since, settings.SYNC_PAGE_SIZE)
+            records = self.serialize_records(
+                MedicalRecord.objects.filter(patient=patient, id__in=changes.upserted['record'])
+            )
+            tests = MedicalTest.objects.filter(record__patient=patient, id__in=changes.upserted['test']).order_by('pk')
+            data = {
+                'token': make_token(patient, changes.position),
+                'reset': False,
+                'has_more': changes.has_more,
+                'records': records,
+                'tests': MedicalTestSerializer(tests, many=True, context=self.get_serializer_context()).data,
+                'deleted': {'records': changes.deleted['record'], 'tests': changes.deleted['test']},
+            }
+        record_rows_access(request, 'record_list', records, sync=True)
+        return Response(data)
     
     @action(detail=True, methods=['get'])
     def download_pdf(self, request, pk=None):
@@ -72,8 +295,10 @@ class MedicalRecordViewSet(viewsets.ModelViewSet):
         if request.user.user_type == 'patient' and record.patient.user != request.user:
             return Response({"detail": "Accès non autorisé."}, status=403)
         
-        # Générer le PDF
+        # Générer le PDF (reportlab n'est chargé qu'à la première génération)
+        from .pdf_generator import generate_medical_record_pdf
         buffer = generate_medical_record_pdf([record], record.patient)
+        record_access(request, 'pdf_download', patient_id=record.patient_id, record_id=record.id)
         
         return FileResponse(
             buffer,
@@ -84,40 +309,188 @@ class MedicalRecordViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def download_all_pdf(self, request):
         """Télécharger tous les dossiers d'un patient en PDF"""
-        user = request.user
+        patient, error = self.get_target_patient(request)
+        if error is not None:
+            return error
         
-        if user.user_type == 'patient':
-            patient = Patient.objects.get(user=user)
-            records = MedicalRecord.objects.filter(patient=patient)
-        elif user.user_type == 'doctor':
-            patient_id = request.query_params.get('patient_id')
-            if not patient_id:
-                return Response({"detail": "patient_id requis."}, status=400)
-            
-            try:
-                patient = Patient.objects.get(id=patient_id)
-                records = MedicalRecord.objects.filter(patient=patient)
-            except Patient.DoesNotExist:
-                return Response({"detail": "Patient non trouvé."}, status=404)
-        else:
-            return Response({"detail": "Accès non autorisé."}, status=403)
+        def render():
+            # Générer le PDF : seuls l'en-tête et les dossiers nouveaux ou modifiés sont rendus
+            from .pdf_generator import generate_medical_record_pdf_incremental
+            return generate_medical_record_pdf_incremental(full_history_for_pdf(patient), patient).getvalue()
         
-        # Générer le PDF
-        buffer = generate_medical_record_pdf(records, patient)
+        # Téléchargements simultanés du même carnet (double appui, plusieurs écrans) : un seul rendu
+        content, shared = coalesce(request_key('pdf-carnet', patient.pk, {}, carnet_version(patient)), render)
+        record_access(request, 'pdf_download', patient_id=patient.id, scope='all')
         
-        return FileResponse(
-            buffer,
+        response = FileResponse(
+            io.BytesIO(content),
             as_attachment=True,
             filename=f"carnet_medical_complet_{patient.user.last_name}.pdf"
         )
+        return single_flight_header(response, shared)
+    
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Exporter tout l'historique d'un patient en flux NDJSON (?output=ndjson) ou JSON (?output=json)"""
+        output = request.query_params.get('output', 'ndjson')
+        if output not in EXPORT_FORMATS:
+            return Response({"detail": "output doit valoir 'ndjson' ou 'json'."}, status=400)
+        
+        patient, error = self.get_target_patient(request)
+        if error is not None:
+            return error
+        
+        content_type, extension, stream = EXPORT_FORMATS[output]
+        records = self.iter_full_history(patient, chunk_size=settings.MEDICAL_RECORDS_EXPORT_CHUNK_SIZE)
+        response = StreamingHttpResponse(stream(records), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="carnet_medical_{patient.user.last_name}.{extension}"'
+        record_access(request, 'export', patient_id=patient.id, output=output)
+        return response
+    
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated, IsDoctor])
+    def export_cohort(self, request):
+        """Télécharger en ZIP les carnets PDF d'une liste ou d'une sélection de patients"""
+        limit = settings.PDF_COHORT_MAX_PATIENTS
+        patients = self.get_cohort_patients(request)
+        if not patients:
+            return Response({"detail": "Aucun patient ne correspond."}, status=404)
+        if len(patients) > limit:
+            return Response({"detail": f"Au plus {limit} patients par export."}, status=400)
+        
+        files = [(patient_id, cohort_filename(patient_id, last_name)) for patient_id, last_name in patients]
+        for patient_id, _ in patients:
+            record_access(request, 'export', patient_id=patient_id, output='pdf_zip')
+        response = StreamingHttpResponse(stream_cohort_zip(files), content_type='application/zip')
+        response['Content-Disposition'] = 'attachment; filename="carnets_medicaux.zip"'
+        return response
 
-class PatientSearchView(generics.ListAPIView):
+class PatientSearchView(ReplicaReadMixin, CostThrottleMixin, RowSerializerListMixin, SparseFieldsetMixin, generics.ListAPIView):
     """Vue pour rechercher des patients (réservée aux docteurs)"""
     serializer_class = MedicalRecordSerializer
     permission_classes = [IsAuthenticated, IsDoctor]
+    throttle_cost_scope = 'search'
     filter_backends = [filters.SearchFilter, DjangoFilterBackend]
     search_fields = ['patient__user__first_name', 'patient__user__last_name', 
                     'patient__user__email', 'patient__user__phone_number']
     
     def get_queryset(self):
-        return MedicalRecord.objects.all()
\ No newline at end of file
+        return self.optimize_queryset(filter_for_care_team(MedicalRecord.objects.all(), self.request.user))
+    
+    def get_throttle_cost(self, request):
+        return search_cost(request.query_params.get(api_settings.SEARCH_PARAM, ''))
+    
+    def list(self, request, *args, **kwargs):
+        # Recherches identiques simultanées des docteurs d'une même portée : une seule exécution
+        # (hôte dans la portée : les liens de pagination sont absolus)
+        scope = (care_team_scope(request.user), request.get_host())
+        key = request_key('patient-search', scope, request.query_params, search_version())
+        data, shared = coalesce(key, lambda: super(PatientSearchView, self).list(request, *args, **kwargs).data)
+        response = Response(data)
+        record_response_access(request, 'search', response, query=request.query_params.get('search', ''))
+        return single_flight_header(response, shared)
+
+class ClinicalSearchView(ReplicaReadMixin, CostThrottleMixin, generics.ListAPIView):
+    """
+    Recherche plein texte dans le titre, la description, le diagnostic, la
+    prescription et les notes des dossiers (réservée aux docteurs).
+    
+    ?q= (syntaxe web : "expression exacte", -exclu), filtres record_type,
+    date_from, date_to et patient_id ; résultats classés par pertinence.
+    """
+    serializer_class = ClinicalSearchResultSerializer
+    permission_classes = [IsAuthenticated, IsDoctor]
+    throttle_cost_scope = 'search'
+    
+    def get_params(self):
+        if not hasattr(self, '_params'):
+            serializer = ClinicalSearchParamsSerializer(data=self.request.query_params)
+            serializer.is_valid(raise_exception=True)
+            self._params = serializer.validated_data
+        return self._params
+    
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            return MedicalRecord.objects.none()
+        
+        params = self.get_params()
+        queryset = filter_for_care_team(MedicalRecord.objects.select_related('patient__user'), self.request.user)
+        if 'record_type' in params:
+            queryset = queryset.filter(record_type=params['record_type'])
+        if 'date_from' in params:
+            queryset = queryset.filter(date__date__gte=params['date_from'])
+        if 'date_to' in params:
+            queryset = queryset.filter(date__date__lte=params['date_to'])
+        if 'patient_id' in params:
+            queryset = queryset.filter(patient_id=params['patient_id'])
+        return search(queryset, params['q']).order_by('-rank', '-date', '-id')
+    
+    def get_throttle_cost(self, request):
+        return search_cost(request.query_params.get('q', ''))
+    
+    def list(self, request, *args, **kwargs):
+        query = self.get_params()['q']
+        scope = (care_team_scope(request.user), request.get_host())
+        key = request_key('clinical-search', scope, request.query_params, search_version())
+        payload, shared = coalesce(key, self.search_payload)
+        # Journal d'accès écrit pour chaque requête, y compris celles servies par un calcul partagé
+        record_rows_access(request, 'search', payload['results'] if isinstance(payload, dict) else payload, query=query)
+        return single_flight_header(Response(payload), shared)
+    
+    def search_payload(self):
+        queryset = self.get_queryset()
+        page = self.paginate_queryset(queryset)
+        records = page if page is not None else list(queryset)
+        
+        # Extraits calculés pour la seule page renvoyée
+        query = self.get_params()['q']
+        context = dict(self.get_serializer_context(),
+                       highlights=highlights([record.id for record in records], query, using=queryset.db))
+        data = self.get_serializer(records, many=True, context=context).data
+        
+        if page is not None:
+            return self.get_paginated_response(data).data
+        return data
+
+class AnalyticsExportView(APIView):
+    """
+    Export analytique d'une table entière en flux CSV ou NDJSON (administrateurs) :
+    ?table=records|tests&output=csv|ndjson&since=AAAA-MM-JJ&until=AAAA-MM-JJ&pseudonymize=0|1
+    """
+    permission_classes = [IsAuthenticated, IsAdmin]
+    
+    def get(self, request):
+        # dict() : un QueryDict sans la clé ferait valoir False au BooleanField au lieu de son défaut
+        serializer = AnalyticsExportSerializer(data=request.query_params.dict())
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        
+        content_type, extension = ANALYTICS_FORMATS[params['output']]
+        stream = export_stream(params['table'], params['output'], start=params.get('since'),
+                               end=params.get('until'), pseudonymize=params['pseudonymize'])
+        response = StreamingHttpResponse(stream, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{params["table"]}.{extension}"'
+        record_access(request, 'export', output=f'analytics_{params["output"]}', table=params['table'],
+                      pseudonymized=params['pseudonymize'])
+        return response
+
+@require_safe
+def emergency_card_view(request, token):
+    """Fiche d'urgence publique (jeton du QR code) : depuis le cache, sans jointure, avec un ETag"""
+    card = card_for_token(token)
+    if card is None:
+        return JsonResponse({"detail": "Fiche introuvable ou jeton révoqué."}, status=404)
+    # Le jeton donne accès à la fiche : jamais en clair dans le journal d'accès, seulement son empreinte
+    record_access(request, 'emergency_card', patient_id=card.patient_id,
+                  path=reverse('emergency-card', args=['redacted']), token_hash=token_hash(token))
+    
+    # Comparaison faible : CompressionMiddleware renvoie W/"…" pour la représentation compressée
+    etags = [etag.removeprefix('W/') for etag in parse_etags(request.headers.get('If-None-Match', ''))]
+    if card.etag in etags or '*' in etags:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(card.payload, content_type='application/json')
+    response['ETag'] = card.etag
+    # Données de santé : revalidation obligatoire, jamais dans un cache partagé
+    patch_cache_control(response, private=True, no_cache=True)
+    response['X-Robots-Tag'] = 'noindex'
+    return response
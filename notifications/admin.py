@@ -0,0 +1,25 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import OutboxMessage
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'kind', 'recipient', 'status', 'attempts', 'available_at', 'sent_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('=recipient__id', 'recipient__email')
+    raw_id_fields = ('recipient',)
+    readonly_fields = ('recipient', 'kind', 'payload', 'attempts', 'created_at', 'sent_at', 'last_error')
+    actions = ('retry',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('recipient')
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description="Renvoyer les messages sélectionnés")
+    def retry(self, request, queryset):
+        count = queryset.exclude(status='sent').update(status='pending', attempts=0, available_at=timezone.now())
+        self.message_user(request, f"{count} messages remis en file.")
@@ -0,0 +1,98 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+
+from core.models import Doctor, Patient, User
+from medical_records.models import MedicalRecord
+from notifications.models import OutboxMessage
+from notifications.outbox import dispatch_batch, notify_record_created, render
+from notifications.transports import BaseTransport, Delivery
+
+
+class _Rollback(Exception):
+    pass
+
+
+class SlowTransport(BaseTransport):
+    """Transport simulé avec une latence réseau fixe"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.deliveries = 0
+
+    def send(self, delivery):
+        time.sleep(self.latency)
+        self.deliveries += 1
+
+
+class Command(BaseCommand):
+    help = ("Création de dossiers avec envoi de la notification dans la requête contre écriture dans la "
+            "boîte d'envoi, puis débit du dispatcher (données générées puis annulées)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--records', type=int, default=200)
+        parser.add_argument('--patients', type=int, default=20)
+        parser.add_argument('--latency-ms', type=float, default=50.0, help="Latence simulée d'un envoi.")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                doctor, patients = self._seed(options['patients'])
+                with override_settings(NOTIFICATIONS_ENABLED=True):
+                    self._run(doctor, patients, options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _seed(self, count):
+        doctor_user = User.objects.create_user(email='bench-outbox-doctor@tohpitoh.local', user_type='doctor')
+        doctor = Doctor.objects.create(user=doctor_user, medical_license='BENCH-OUTBOX', specialization='Généraliste')
+        patients = [
+            Patient.objects.create(user=User.objects.create_user(email=f'bench-outbox-{i}@tohpitoh.local',
+                                                                 user_type='patient'))
+            for i in range(count)
+        ]
+        return doctor, patients
+
+    def _create(self, doctor, patient, i):
+        return MedicalRecord.objects.create(patient=patient, created_by=doctor, record_type='consultation',
+                                            title=f'Visite {i}', description='Contrôle de routine.')
+
+    def _run(self, doctor, patients, options):
+        count = options['records']
+        transport = SlowTransport(options['latency_ms'] / 1000)
+        self.stdout.write(f"{count} dossiers pour {len(patients)} patients, envoi simulé à {options['latency_ms']:.0f} ms")
+
+        # Envoi dans la requête : chaque création attend le transport
+        start = time.perf_counter()
+        for i in range(count):
+            with transaction.atomic():
+                record = self._create(doctor, patients[i % len(patients)], i)
+            subject, body = render(record.patient.user, [OutboxMessage(payload={'record_type': record.record_type})])
+            transport.send(Delivery(record.patient.user, subject, body, []))
+        inline = (time.perf_counter() - start) / count
+
+        # Boîte d'envoi : une ligne de plus dans la transaction du dossier
+        start = time.perf_counter()
+        for i in range(count):
+            with transaction.atomic():
+                notify_record_created(self._create(doctor, patients[i % len(patients)], i))
+        outbox = (time.perf_counter() - start) / count
+        self.stdout.write(f"{'dans la requête':<16} {inline * 1000:>8.2f} ms par création")
+        self.stdout.write(f"{'outbox':<16} {outbox * 1000:>8.2f} ms par création")
+
+        transport.deliveries = 0
+        start = time.perf_counter()
+        sent = 0
+        while True:
+            batch_sent, _, failed = dispatch_batch(transport)
+            sent += batch_sent
+            if not batch_sent and not failed:
+                break
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Dispatcher : {sent} messages en {transport.deliveries} envois (regroupés par patient), "
+            f"{elapsed:.2f} s, {sent / elapsed:.0f} messages/s"
+        ))
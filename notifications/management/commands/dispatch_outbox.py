@@ -0,0 +1,59 @@
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from notifications.outbox import dispatch_batch, purge_sent
+from notifications.transports import get_transport
+
+# Purge des messages envoyés au plus une fois par période (secondes)
+PURGE_INTERVAL = 3600
+
+
+class Command(BaseCommand):
+    help = ("Livrer les notifications de la boîte d'envoi par lots (regroupées par destinataire, "
+            "nouvelles tentatives avec backoff) ; en continu, ou jusqu'à vider la file avec --once")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="S'arrêter quand plus aucun message n'est dû.")
+        parser.add_argument('--batch-size', type=int, default=settings.NOTIFICATIONS_BATCH_SIZE)
+        parser.add_argument('--interval', type=float, default=settings.NOTIFICATIONS_POLL_INTERVAL,
+                            help="Attente (secondes) quand la file est vide.")
+
+    def handle(self, *args, **options):
+        self._stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        transport = get_transport()
+        batch_size = options['batch_size']
+        totals = {'sent': 0, 'deliveries': 0, 'failed': 0}
+        last_purge = 0.0
+
+        while not self._stopping:
+            close_old_connections()
+            sent, deliveries, failed = dispatch_batch(transport, batch_size)
+            totals['sent'] += sent
+            totals['deliveries'] += deliveries
+            totals['failed'] += failed
+            if sent or failed:
+                self.stdout.write(f"{sent} messages livrés en {deliveries} envois, {failed} en échec")
+            if sent + failed == batch_size:
+                continue
+            # File vide (ou seulement des messages en attente de nouvelle tentative)
+            if time.monotonic() - last_purge > PURGE_INTERVAL:
+                purged = purge_sent()
+                if purged:
+                    self.stdout.write(f"{purged} messages envoyés purgés")
+                last_purge = time.monotonic()
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Total : {totals['sent']} messages livrés en {totals['deliveries']} envois, {totals['failed']} en échec."
+        ))
+
+    def _stop(self, signum, frame):
+        # Terminer le lot en cours avant de s'arrêter
+        self._stopping = True
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.utils import timezone
+
+
+class OutboxMessage(models.Model):
+    """
+    Notification à envoyer, écrite dans la transaction de l'écriture qui la
+    cause (boîte d'envoi transactionnelle) puis livrée par manage.py
+    dispatch_outbox. available_at est la date de la prochaine tentative :
+    repoussée le temps d'une livraison (bail) puis selon le backoff en cas
+    d'échec.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'En attente'),
+        ('sent', 'Envoyée'),
+        ('failed', 'Abandonnée'),
+    )
+    KIND_CHOICES = (
+        ('record_created', 'Nouveau dossier'),
+    )
+
+    recipient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='outbox_messages')
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    payload = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['available_at', 'id']
+        indexes = [
+            # File des messages dus
+            models.Index(fields=['status', 'available_at'], name='outbox_due_idx'),
+            # Purge des messages envoyés
+            models.Index(fields=['status', 'sent_at'], name='outbox_sent_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} -> {self.recipient_id} ({self.get_status_display()})"
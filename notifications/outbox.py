@@ -0,0 +1,148 @@
+"""
+Boîte d'envoi transactionnelle et dispatcher par lots.
+
+Les vues n'écrivent qu'une ligne OutboxMessage dans la transaction de leur
+propre écriture : la notification existe si et seulement si le dossier existe,
+et aucun appel réseau n'a lieu pendant la requête.
+
+dispatch_batch() (manage.py dispatch_outbox) :
+1. réserve jusqu'à NOTIFICATIONS_BATCH_SIZE messages dus, en repoussant leur
+   available_at du bail NOTIFICATIONS_LEASE_SECONDS (lignes verrouillées avec
+   SKIP LOCKED sous PostgreSQL : plusieurs dispatchers se partagent la file) ;
+2. regroupe les messages par destinataire : un seul envoi par destinataire ;
+3. hors transaction, livre chaque envoi par le transport ;
+4. marque les messages envoyés, ou les replanifie avec un backoff exponentiel
+   (avec gigue) jusqu'à NOTIFICATIONS_MAX_ATTEMPTS, puis les abandonne.
+
+Livraison au moins une fois : un dispatcher arrêté entre l'envoi et le
+marquage laisse expirer le bail et le message est renvoyé.
+"""
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from medical_records.models import MedicalRecord
+from .models import OutboxMessage
+from .transports import Delivery, get_transport
+
+logger = logging.getLogger(__name__)
+
+RECORD_TYPE_LABELS = dict(MedicalRecord.RECORD_TYPE_CHOICES)
+
+
+def enqueue(recipient_id, kind, payload):
+    """Ajouter un message ; à appeler dans la transaction de l'écriture qui le cause"""
+    if not settings.NOTIFICATIONS_ENABLED:
+        return None
+    return OutboxMessage.objects.create(recipient_id=recipient_id, kind=kind, payload=payload)
+
+
+def notify_record_created(record):
+    """
+    Prévenir le patient d'un nouveau dossier. Le contenu médical (titre,
+    diagnostic) n'est pas copié : le message renvoie vers l'application.
+    """
+    doctor = record.created_by
+    return enqueue(record.patient.user_id, 'record_created', {
+        'record_id': record.pk,
+        'record_type': record.record_type,
+        'date': record.date,
+        'doctor': doctor.user.get_full_name() if doctor is not None else '',
+    })
+
+
+def _describe(payload):
+    label = RECORD_TYPE_LABELS.get(payload.get('record_type'), "Dossier")
+    return f"{label} (Dr {payload['doctor']})" if payload.get('doctor') else label
+
+
+def render(recipient, messages):
+    """Sujet et corps d'un envoi regroupant les messages d'un destinataire"""
+    lines = [f"Bonjour {recipient.first_name}," if recipient.first_name else "Bonjour,", ""]
+    if len(messages) == 1:
+        subject = "Nouveau dossier dans votre carnet médical"
+        lines.append(f"Un nouveau dossier a été ajouté à votre carnet médical : {_describe(messages[0].payload)}.")
+    else:
+        subject = f"{len(messages)} nouveaux dossiers dans votre carnet médical"
+        lines.append(f"{len(messages)} nouveaux dossiers ont été ajoutés à votre carnet médical :")
+        lines += [f"- {_describe(message.payload)}" for message in messages]
+    lines += ["", "Connectez-vous à Tohpitoh pour les consulter."]
+    return subject, "\n".join(lines)
+
+
+def backoff(attempts):
+    """Délai avant la tentative suivante : exponentiel, plafonné, avec gigue (moitié à totalité)"""
+    delay = min(settings.NOTIFICATIONS_BACKOFF_MAX_SECONDS,
+                settings.NOTIFICATIONS_BACKOFF_BASE_SECONDS * 2 ** (attempts - 1))
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+def claim(batch_size):
+    """Réserver des messages dus : le bail les rend invisibles aux autres dispatchers"""
+    now = timezone.now()
+    with transaction.atomic():
+        messages = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', available_at__lte=now)
+            .select_related('recipient')
+            .order_by('available_at', 'id')[:batch_size]
+        )
+        if messages:
+            OutboxMessage.objects.filter(pk__in=[message.pk for message in messages]).update(
+                available_at=now + timedelta(seconds=settings.NOTIFICATIONS_LEASE_SECONDS)
+            )
+    return messages
+
+
+def _group(messages):
+    groups = {}
+    for message in messages:
+        groups.setdefault(message.recipient_id, []).append(message)
+    return groups.values()
+
+
+def dispatch_batch(transport=None, batch_size=None):
+    """Livrer un lot ; renvoie (messages envoyés, envois, messages en échec)"""
+    transport = transport or get_transport()
+    messages = claim(batch_size or settings.NOTIFICATIONS_BATCH_SIZE)
+    sent, deliveries, failed = [], 0, []
+    for group in _group(messages):
+        recipient = group[0].recipient
+        subject, body = render(recipient, group)
+        try:
+            transport.send(Delivery(recipient, subject, body, [message.payload for message in group]))
+        except Exception as exc:
+            logger.warning("Échec d'envoi à l'utilisateur %s : %s", recipient.pk, exc)
+            for message in group:
+                message.last_error = f"{type(exc).__name__}: {exc}"[:1000]
+            failed.extend(group)
+        else:
+            sent.extend(group)
+            deliveries += 1
+
+    now = timezone.now()
+    if sent:
+        OutboxMessage.objects.filter(pk__in=[message.pk for message in sent]).update(
+            status='sent', sent_at=now, attempts=F('attempts') + 1, last_error=''
+        )
+    for message in failed:
+        message.attempts += 1
+        if message.attempts >= settings.NOTIFICATIONS_MAX_ATTEMPTS:
+            message.status = 'failed'
+        else:
+            message.available_at = now + backoff(message.attempts)
+    if failed:
+        OutboxMessage.objects.bulk_update(failed, ['attempts', 'status', 'available_at', 'last_error'])
+    return len(sent), deliveries, len(failed)
+
+
+def purge_sent(days=None):
+    """Supprimer les messages envoyés depuis plus de NOTIFICATIONS_RETENTION_DAYS jours"""
+    cutoff = timezone.now() - timedelta(days=settings.NOTIFICATIONS_RETENTION_DAYS if days is None else days)
+    deleted, _ = OutboxMessage.objects.filter(status='sent', sent_at__lt=cutoff).delete()
+    return deleted
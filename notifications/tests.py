@@ -0,0 +1,132 @@
+import json
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.db import DatabaseError, transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.models import Doctor, Patient, User
+from medical_records.models import MedicalRecord
+from .models import OutboxMessage
+from .outbox import backoff, claim, dispatch_batch, notify_record_created
+from .transports import FileTransport
+
+
+@override_settings(AUDIT_ENABLED=False, THROTTLE_ENABLED=False, NOTIFICATIONS_ENABLED=True,
+                   NOTIFICATIONS_BACKOFF_BASE_SECONDS=30, NOTIFICATIONS_BACKOFF_MAX_SECONDS=3600,
+                   NOTIFICATIONS_LEASE_SECONDS=60)
+class OutboxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        doctor_user = User.objects.create_user(email='docteur@tohpitoh.local', user_type='doctor',
+                                               first_name='Koffi', last_name='Mensah')
+        cls.doctor = Doctor.objects.create(user=doctor_user, medical_license='LIC-001')
+        cls.patients = [
+            Patient.objects.create(user=User.objects.create_user(
+                email=f'patient-{index}@tohpitoh.local', user_type='patient', first_name='Awa'))
+            for index in range(2)
+        ]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'notifications.ndjson')
+        file_path = override_settings(NOTIFICATIONS_FILE_PATH=self.path)
+        file_path.enable()
+        self.addCleanup(file_path.disable)
+
+    def create_record(self, patient, title='Visite'):
+        record = MedicalRecord.objects.create(patient=patient, created_by=self.doctor, record_type='consultation',
+                                              title=title, description='-')
+        return notify_record_created(record)
+
+    def deliveries(self):
+        with open(self.path, encoding='utf-8') as lines:
+            return [json.loads(line) for line in lines]
+
+    def make_due(self):
+        OutboxMessage.objects.update(available_at=timezone.now() - timedelta(seconds=1))
+
+    def test_message_rolled_back_with_the_record(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.create_record(self.patients[0])
+            raise RuntimeError
+        self.assertFalse(MedicalRecord.objects.exists())
+        self.assertFalse(OutboxMessage.objects.exists())
+
+        # Même transaction dans la vue : l'échec de la notification annule le dossier
+        client = APIClient()
+        client.force_authenticate(self.doctor.user)
+        payload = {'patient_id': self.patients[0].pk, 'record_type': 'consultation', 'title': 'Visite',
+                   'description': '-'}
+        with mock.patch('medical_records.views.notify_record_created', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                client.post('/api/medical-records/', payload, format='json')
+        self.assertFalse(MedicalRecord.objects.exists())
+
+        self.assertEqual(client.post('/api/medical-records/', payload, format='json').status_code, 201)
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.recipient_id, self.patients[0].user_id)
+        self.assertEqual(message.payload['record_id'], MedicalRecord.objects.get().pk)
+
+    def test_one_delivery_per_recipient(self):
+        for title in ('Visite 1', 'Visite 2', 'Visite 3'):
+            self.create_record(self.patients[0], title)
+        self.create_record(self.patients[1])
+
+        self.assertEqual(dispatch_batch(FileTransport()), (4, 2, 0))
+        deliveries = {delivery['email']: delivery for delivery in self.deliveries()}
+        self.assertEqual(len(deliveries['patient-0@tohpitoh.local']['payloads']), 3)
+        self.assertEqual(deliveries['patient-0@tohpitoh.local']['subject'],
+                         "3 nouveaux dossiers dans votre carnet médical")
+        self.assertEqual(len(deliveries['patient-1@tohpitoh.local']['payloads']), 1)
+        self.assertEqual(set(OutboxMessage.objects.values_list('status', flat=True)), {'sent'})
+        self.assertEqual(dispatch_batch(FileTransport()), (0, 0, 0))
+
+    @override_settings(NOTIFICATIONS_MAX_ATTEMPTS=3)
+    def test_retries_with_backoff_then_gives_up(self):
+        message = self.create_record(self.patients[0])
+        # Chemin de fichier qui est un répertoire : chaque envoi échoue
+        os.mkdir(self.path)
+
+        before = timezone.now()
+        with self.assertLogs('notifications.outbox', 'WARNING'):
+            self.assertEqual(dispatch_batch(FileTransport()), (0, 0, 1))
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('pending', 1))
+        self.assertIn('IsADirectoryError', message.last_error)
+        self.assertGreaterEqual(message.available_at, before + timedelta(seconds=15))
+        self.assertLessEqual(message.available_at, timezone.now() + timedelta(seconds=30))
+        # Pas encore dû
+        self.assertEqual(dispatch_batch(FileTransport()), (0, 0, 0))
+
+        for _ in range(2):
+            self.make_due()
+            with self.assertLogs('notifications.outbox', 'WARNING'):
+                self.assertEqual(dispatch_batch(FileTransport()), (0, 0, 1))
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('failed', 3))
+        self.make_due()
+        self.assertEqual(dispatch_batch(FileTransport()), (0, 0, 0))
+
+    def test_backoff_doubles_up_to_the_cap(self):
+        for attempts, delay in ((1, 30), (2, 60), (5, 480), (20, 3600)):
+            with self.subTest(attempts=attempts):
+                wait = backoff(attempts).total_seconds()
+                self.assertGreaterEqual(wait, delay / 2)
+                self.assertLessEqual(wait, delay)
+
+    def test_lease_hides_claimed_messages(self):
+        self.create_record(self.patients[0])
+        self.create_record(self.patients[1])
+
+        self.assertEqual(len(claim(10)), 2)
+        self.assertEqual(claim(10), [])
+        # Dispatcher arrêté avant le marquage : le bail expire et les messages sont repris
+        self.make_due()
+        self.assertEqual(len(claim(1)), 1)
+        self.assertEqual(len(claim(10)), 1)
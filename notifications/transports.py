@@ -0,0 +1,63 @@
+"""
+Transports des notifications (NOTIFICATIONS_TRANSPORT, chemin d'une classe).
+
+Un transport reçoit une Delivery (un destinataire, ses messages regroupés) et
+lève une exception si l'envoi échoue : le dispatcher replanifie alors les
+messages. ConsoleTransport et FileTransport n'envoient rien vers l'extérieur
+(développement, tests).
+"""
+import json
+import sys
+import threading
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+
+# recipient : utilisateur ; payloads : contenus des messages regroupés
+Delivery = namedtuple('Delivery', 'recipient subject body payloads')
+
+
+class BaseTransport:
+    def send(self, delivery):
+        raise NotImplementedError
+
+
+class ConsoleTransport(BaseTransport):
+    """Écrire chaque envoi sur la sortie standard"""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    def send(self, delivery):
+        self.stream.write(f"À : {delivery.recipient.email}\nObjet : {delivery.subject}\n\n{delivery.body}\n\n")
+        self.stream.flush()
+
+
+class FileTransport(BaseTransport):
+    """Ajouter chaque envoi, en JSON, à NOTIFICATIONS_FILE_PATH (une ligne par envoi)"""
+    _lock = threading.Lock()
+
+    def send(self, delivery):
+        line = json.dumps({
+            'recipient': delivery.recipient.pk,
+            'email': delivery.recipient.email,
+            'subject': delivery.subject,
+            'body': delivery.body,
+            'payloads': delivery.payloads,
+        }, cls=DjangoJSONEncoder, ensure_ascii=False)
+        with self._lock, open(settings.NOTIFICATIONS_FILE_PATH, 'a', encoding='utf-8') as output:
+            output.write(line + '\n')
+
+
+class EmailTransport(BaseTransport):
+    """Courriel via le backend de messagerie de Django (EMAIL_BACKEND)"""
+
+    def send(self, delivery):
+        send_mail(delivery.subject, delivery.body, settings.DEFAULT_FROM_EMAIL, [delivery.recipient.email])
+
+
+def get_transport():
+    return import_string(settings.NOTIFICATIONS_TRANSPORT)()
@@ -0,0 +1,132 @@
+"""
+Génération et mise en cache du schéma OpenAPI
+"""
+import gzip
+import hashlib
+import json
+import threading
+
+from django.conf import settings
+from drf_yasg import openapi
+from drf_yasg.codecs import OpenAPICodecJson
+from drf_yasg.generators import OpenAPISchemaGenerator
+
+from .schemas import INFO, TAGS, SECURITY_SCHEMES, SCHEMA_DEFINITIONS, EXTERNAL_DOCS
+
+
+class TohpitohSchemaGenerator(OpenAPISchemaGenerator):
+    """Générateur qui complète le schéma introspecté avec tohpitoh_backend/docs/schemas.py"""
+
+    def get_schema(self, request=None, public=False):
+        schema = super().get_schema(request, public)
+        schema['tags'] = TAGS
+        schema['externalDocs'] = EXTERNAL_DOCS
+        schema['securityDefinitions'] = SECURITY_SCHEMES
+        definitions = schema.setdefault('definitions', openapi.SwaggerDict())
+        for name, definition in SCHEMA_DEFINITIONS.items():
+            definitions.setdefault(name, definition)
+        return schema
+
+
+def available_validators():
+    """Validateurs drf_yasg utilisables (swagger_spec_validator est optionnel)"""
+    try:
+        import swagger_spec_validator  # noqa: F401
+    except ImportError:
+        return []
+    return ['ssv']
+
+
+def _unresolved_refs(node, definitions, path='#'):
+    if isinstance(node, dict):
+        ref = node.get('$ref')
+        if isinstance(ref, str) and ref.startswith('#/definitions/'):
+            if ref.split('/')[-1] not in definitions:
+                yield f"{path}: {ref}"
+        for key, value in node.items():
+            yield from _unresolved_refs(value, definitions, f"{path}/{key}")
+    elif isinstance(node, list):
+        for index, value in enumerate(node):
+            yield from _unresolved_refs(value, definitions, f"{path}/{index}")
+
+
+def validate_schema(content):
+    """Contrôles de cohérence du schéma encodé ; renvoie la liste des erreurs"""
+    document = json.loads(content)
+    errors = []
+    if not document.get('paths'):
+        errors.append("Aucun endpoint dans le schéma.")
+    definitions = document.get('definitions', {})
+    for name in SCHEMA_DEFINITIONS:
+        if name not in definitions:
+            errors.append(f"Définition personnalisée absente : {name}")
+    errors.extend(f"Référence introuvable {ref}" for ref in _unresolved_refs(document, definitions))
+    return errors
+
+
+def build_schema():
+    """Générer le schéma complet (public) et l'encoder en JSON"""
+    generator = TohpitohSchemaGenerator(INFO, INFO._default_version)
+    schema = generator.get_schema(request=None, public=True)
+    return OpenAPICodecJson(available_validators()).encode(schema)
+
+
+class SchemaArtifact:
+    """Schéma encodé, sa version compressée et l'ETag de chacune"""
+
+    def __init__(self, content, gzipped=None):
+        self.content = content
+        self.gzipped = gzipped if gzipped is not None else gzip.compress(content, compresslevel=9, mtime=0)
+        digest = hashlib.sha256(content).hexdigest()[:16]
+        self.version = INFO._default_version
+        self.etag = f'"{self.version}-{digest}"'
+        # Représentation distincte : son propre ETag fort
+        self.gzip_etag = f'"{self.version}-{digest}-gzip"'
+
+    @classmethod
+    def path(cls):
+        return settings.OPENAPI_SCHEMA_DIR / f'openapi-{INFO._default_version}.json'
+
+    @staticmethod
+    def gzip_path(path):
+        return path.with_name(path.name + '.gz')
+
+    def write(self):
+        path = self.path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(self.content)
+        self.gzip_path(path).write_bytes(self.gzipped)
+        return path
+
+    @classmethod
+    def read(cls):
+        """Artefact du build ; la version .gz est reprise telle quelle si elle correspond au JSON"""
+        path = cls.path()
+        if not path.exists():
+            return None
+        content = path.read_bytes()
+        gzipped = None
+        gzip_path = cls.gzip_path(path)
+        if gzip_path.exists():
+            gzipped = gzip_path.read_bytes()
+            # Décompresser coûte peu au regard d'une compression niveau 9 ; .gz périmé ou abîmé : recompressé
+            try:
+                if gzip.decompress(gzipped) != content:
+                    gzipped = None
+            except (OSError, EOFError):
+                gzipped = None
+        return cls(content, gzipped)
+
+
+_artifact = None
+_artifact_lock = threading.Lock()
+
+
+def get_schema_artifact():
+    """Schéma servi par /swagger.json : l'artefact généré au build, sinon généré une seule fois"""
+    global _artifact
+    if _artifact is None:
+        with _artifact_lock:
+            if _artifact is None:
+                _artifact = SchemaArtifact.read() or SchemaArtifact(build_schema())
+    return _artifact
@@ -0,0 +1,64 @@
+from functools import lru_cache
+
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+from django.views.decorators.http import require_safe
+
+from core.compression import parse_accept_encoding
+
+# drf_yasg n'est importé qu'au premier appel d'une vue de documentation
+
+
+@lru_cache(maxsize=None)
+def _schema_ui_view(renderer):
+    from drf_yasg.views import get_schema_view, UI_RENDERERS
+    from rest_framework import permissions
+
+    from .generator import TohpitohSchemaGenerator
+    from .schemas import INFO
+
+    # Les interfaces Swagger/ReDoc ne génèrent pas le schéma : elles chargent
+    # /swagger.json, servi depuis l'artefact précalculé (manage.py generate_openapi_schema)
+    schema_view = get_schema_view(
+        INFO,
+        public=True,
+        generator_class=TohpitohSchemaGenerator,
+        permission_classes=(permissions.AllowAny,),
+    )
+    return schema_view.as_cached_view(renderer_classes=UI_RENDERERS[renderer])
+
+
+def schema_ui_view(renderer):
+    """Vue Swagger UI ('swagger') ou ReDoc ('redoc') construite à la première requête"""
+    def view(request, *args, **kwargs):
+        return _schema_ui_view(renderer)(request, *args, **kwargs)
+    return view
+
+
+@require_safe
+def openapi_schema_view(request):
+    """Servir le schéma OpenAPI précalculé (gzip négocié, un ETag par encodage)"""
+    from .generator import get_schema_artifact
+
+    artifact = get_schema_artifact()
+
+    accepted = parse_accept_encoding(request.headers.get('Accept-Encoding', ''))
+    gzipped = accepted.get('gzip', accepted.get('*', 0.0)) > 0
+    etag = artifact.gzip_etag if gzipped else artifact.etag
+
+    # Comparaison faible : CompressionMiddleware renvoie W/"…" s'il compresse la version non gzip
+    etags = [value.removeprefix('W/') for value in parse_etags(request.headers.get('If-None-Match', ''))]
+    if etag in etags or '*' in etags:
+        response = HttpResponseNotModified()
+    elif gzipped:
+        response = HttpResponse(artifact.gzipped, content_type='application/json')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(artifact.content, content_type='application/json')
+
+    response['ETag'] = etag
+    response['X-Schema-Version'] = artifact.version
+    patch_vary_headers(response, ('Accept-Encoding',))
+    patch_cache_control(response, public=True, max_age=3600)
+    return response
@@ -5,7 +5,7 @@ Django settings for tohpitoh_backend project.
 from pathlib import Path
 from datetime import timedelta
 import os
-from decouple import config
+from decouple import config, Csv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -38,11 +38,15 @@ INSTALLED_APPS = [
     'core',
     'medical_records',
     'authentication',
+    'audit',
+    'notifications',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'core.middleware.ProfilingMiddleware',
+    'core.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -87,6 +91,14 @@ DATABASES = {
     "default": dj_database_url.config(default=os.environ.get("DATABASE_URL"))
 }
 
+# Réplicas en lecture (URLs séparées par des virgules) : replica_0, replica_1...
+DATABASE_REPLICA_URLS = config('DATABASE_REPLICA_URLS', default='', cast=Csv())
+for index, url in enumerate(DATABASE_REPLICA_URLS):
+    DATABASES[f'replica_{index}'] = dict(dj_database_url.parse(url), TEST={'MIRROR': 'default'})
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+# Après une écriture, les lectures de l'utilisateur restent N secondes sur la base principale
+DATABASE_READ_YOUR_WRITES_SECONDS = config('DATABASE_READ_YOUR_WRITES_SECONDS', default=5, cast=int)
+
 
 # Pour PostgreSQL (production)
 # DATABASES = {
@@ -146,6 +158,218 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 20,
 }
 
+# Sérialisation rapide (values_list) des listes de dossiers médicaux
+MEDICAL_RECORDS_FAST_SERIALIZER = config('MEDICAL_RECORDS_FAST_SERIALIZER', default=True, cast=bool)
+
+# Taille des blocs lus par curseur serveur lors des exports en flux
+MEDICAL_RECORDS_EXPORT_CHUNK_SIZE = config('MEDICAL_RECORDS_EXPORT_CHUNK_SIZE', default=500, cast=int)
+
+# Pool de processus pour les rendus PDF (0 = nombre de cœurs)
+PROCESS_POOL_MAX_WORKERS = config('PROCESS_POOL_MAX_WORKERS', default=0, cast=int)
+PROCESS_POOL_START_METHOD = config('PROCESS_POOL_START_METHOD', default='forkserver')
+
+# Export PDF groupé (ZIP) de plusieurs patients
+PDF_EXPORT_MAX_WORKERS = config('PDF_EXPORT_MAX_WORKERS', default=0, cast=int)
+PDF_EXPORT_JOB_MEMORY_LIMIT_MB = config('PDF_EXPORT_JOB_MEMORY_LIMIT_MB', default=1024, cast=int)
+PDF_COHORT_MAX_PATIENTS = config('PDF_COHORT_MAX_PATIENTS', default=200, cast=int)
+
+# Rendu parallèle des longs carnets : portions de N dossiers à partir de M dossiers
+PDF_PARALLEL_CHUNK_SIZE = config('PDF_PARALLEL_CHUNK_SIZE', default=50, cast=int)
+PDF_PARALLEL_MIN_RECORDS = config('PDF_PARALLEL_MIN_RECORDS', default=1000, cast=int)
+
+# Fragments PDF par dossier mis en cache pour l'assemblage incrémental du carnet (0 : pas de cache).
+# Données de santé : cache dédié 'pdf_fragments' (instance Redis distincte possible), durée courte
+PDF_FRAGMENT_CACHE_SECONDS = config('PDF_FRAGMENT_CACHE_SECONDS', default=24 * 3600, cast=int)
+PDF_FRAGMENT_CACHE_URL = config('PDF_FRAGMENT_CACHE_URL', default='')
+
+# Optimisation des PDF avant envoi : flux compressés, objets dédoublonnés, images réduites et recompressées
+PDF_OPTIMIZE_ENABLED = config('PDF_OPTIMIZE_ENABLED', default=True, cast=bool)
+PDF_IMAGE_MAX_DPI = config('PDF_IMAGE_MAX_DPI', default=150, cast=int)
+PDF_IMAGE_JPEG_QUALITY = config('PDF_IMAGE_JPEG_QUALITY', default=75, cast=int)
+
+# Archivage à froid des dossiers anciens (manage.py archive_medical_records)
+MEDICAL_RECORDS_ARCHIVE_AFTER_YEARS = config('MEDICAL_RECORDS_ARCHIVE_AFTER_YEARS', default=5, cast=int)
+MEDICAL_RECORDS_ARCHIVE_BATCH_SIZE = config('MEDICAL_RECORDS_ARCHIVE_BATCH_SIZE', default=500, cast=int)
+# Partitions annuelles des dossiers et tests créées à l'avance (manage.py partition_medical_records)
+MEDICAL_RECORDS_PARTITION_YEARS_AHEAD = config('MEDICAL_RECORDS_PARTITION_YEARS_AHEAD', default=1, cast=int)
+
+# Démarrage à froid : budget du temps d'import (manage.py profile_startup --check)
+STARTUP_IMPORT_BUDGET_MS = config('STARTUP_IMPORT_BUDGET_MS', default=800, cast=int)
+# Modules lourds qui ne doivent être chargés qu'à la première utilisation
+STARTUP_LAZY_MODULES = ('reportlab', 'pypdf', 'drf_yasg.generators', 'drf_yasg.views')
+
+# Cache partagé entre workers (Redis) ; mémoire locale à défaut (développement)
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+if PDF_FRAGMENT_CACHE_URL or REDIS_URL:
+    CACHES['pdf_fragments'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': PDF_FRAGMENT_CACHE_URL or REDIS_URL,
+        'KEY_PREFIX': 'pdf-fragments',
+        'TIMEOUT': PDF_FRAGMENT_CACHE_SECONDS,
+    }
+else:
+    # Un fragment par dossier : de quoi garder l'historique de plusieurs patients
+    CACHES['pdf_fragments'] = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'pdf-fragments',
+        'TIMEOUT': PDF_FRAGMENT_CACHE_SECONDS,
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    }
+
+# Limitation pondérée par le coût (PDF : dossiers rendus ; recherche : étendue des termes)
+THROTTLE_ENABLED = config('THROTTLE_ENABLED', default=True, cast=bool)
+THROTTLE_SCOPES = {
+    'pdf': {
+        'user_rate': config('THROTTLE_PDF_USER_RATE', default=2.0, cast=float),
+        'user_burst': config('THROTTLE_PDF_USER_BURST', default=200, cast=int),
+        'global_rate': config('THROTTLE_PDF_GLOBAL_RATE', default=20.0, cast=float),
+        'global_burst': config('THROTTLE_PDF_GLOBAL_BURST', default=1000, cast=int),
+        'max_concurrent': config('THROTTLE_PDF_MAX_CONCURRENT', default=2, cast=int),
+        'max_concurrent_per_user': config('THROTTLE_PDF_MAX_CONCURRENT_PER_USER', default=1, cast=int),
+    },
+    'search': {
+        'user_rate': config('THROTTLE_SEARCH_USER_RATE', default=5.0, cast=float),
+        'user_burst': config('THROTTLE_SEARCH_USER_BURST', default=50, cast=int),
+        'global_rate': config('THROTTLE_SEARCH_GLOBAL_RATE', default=50.0, cast=float),
+        'global_burst': config('THROTTLE_SEARCH_GLOBAL_BURST', default=300, cast=int),
+        'max_concurrent': config('THROTTLE_SEARCH_MAX_CONCURRENT', default=2, cast=int),
+        'max_concurrent_per_user': config('THROTTLE_SEARCH_MAX_CONCURRENT_PER_USER', default=1, cast=int),
+    },
+}
+# Une recherche dont le terme le plus long fait moins de N caractères coûte davantage
+THROTTLE_SEARCH_SHORT_TERM = config('THROTTLE_SEARCH_SHORT_TERM', default=6, cast=int)
+# Retry-After (secondes) quand toutes les places simultanées sont prises
+THROTTLE_RETRY_AFTER = config('THROTTLE_RETRY_AFTER', default=2, cast=int)
+# Expiration de secours des compteurs de places (worker tué pendant une requête)
+THROTTLE_SLOT_TIMEOUT = config('THROTTLE_SLOT_TIMEOUT', default=300, cast=int)
+
+# Journal d'accès : file bornée écrite par lots par un thread de fond
+AUDIT_ENABLED = config('AUDIT_ENABLED', default=True, cast=bool)
+AUDIT_ASYNC = config('AUDIT_ASYNC', default=True, cast=bool)
+AUDIT_BUFFER_SIZE = config('AUDIT_BUFFER_SIZE', default=10000, cast=int)
+AUDIT_BATCH_SIZE = config('AUDIT_BATCH_SIZE', default=500, cast=int)
+AUDIT_FLUSH_INTERVAL = config('AUDIT_FLUSH_INTERVAL', default=1.0, cast=float)
+# Mandataires de confiance devant l'application (1 derrière un seul reverse proxy) : l'adresse journalisée
+# est l'entrée de X-Forwarded-For ajoutée par le premier d'entre eux ; 0 = REMOTE_ADDR uniquement
+AUDIT_TRUSTED_PROXIES = config('AUDIT_TRUSTED_PROXIES', default=0, cast=int)
+# Partitions mensuelles créées à l'avance (manage.py create_audit_partitions)
+AUDIT_PARTITION_MONTHS_AHEAD = config('AUDIT_PARTITION_MONTHS_AHEAD', default=3, cast=int)
+
+# Export analytique (manage.py export_analytics, GET /api/medical-records/analytics/export/) :
+# lignes lues par blocs sur un curseur côté serveur
+ANALYTICS_EXPORT_CHUNK_SIZE = config('ANALYTICS_EXPORT_CHUNK_SIZE', default=2000, cast=int)
+# Clé HMAC des pseudonymes de patients (vide = SECRET_KEY) ; la changer change tous les pseudonymes
+ANALYTICS_EXPORT_PSEUDONYM_SECRET = config('ANALYTICS_EXPORT_PSEUDONYM_SECRET', default='')
+
+# Notifications (boîte d'envoi transactionnelle, livrée par manage.py dispatch_outbox)
+NOTIFICATIONS_ENABLED = config('NOTIFICATIONS_ENABLED', default=True, cast=bool)
+# Transport : ConsoleTransport ou FileTransport (développement, tests), EmailTransport (EMAIL_BACKEND)
+NOTIFICATIONS_TRANSPORT = config('NOTIFICATIONS_TRANSPORT', default='notifications.transports.ConsoleTransport')
+NOTIFICATIONS_FILE_PATH = config('NOTIFICATIONS_FILE_PATH', default=str(BASE_DIR / 'notifications.ndjson'))
+# Messages réservés par lot et durée du bail (secondes) pendant laquelle un lot réservé n'est pas repris
+NOTIFICATIONS_BATCH_SIZE = config('NOTIFICATIONS_BATCH_SIZE', default=100, cast=int)
+NOTIFICATIONS_LEASE_SECONDS = config('NOTIFICATIONS_LEASE_SECONDS', default=60, cast=int)
+# Nouvelles tentatives : délai doublé à chaque échec (secondes), plafonné, puis abandon
+NOTIFICATIONS_MAX_ATTEMPTS = config('NOTIFICATIONS_MAX_ATTEMPTS', default=8, cast=int)
+NOTIFICATIONS_BACKOFF_BASE_SECONDS = config('NOTIFICATIONS_BACKOFF_BASE_SECONDS', default=30, cast=int)
+NOTIFICATIONS_BACKOFF_MAX_SECONDS = config('NOTIFICATIONS_BACKOFF_MAX_SECONDS', default=3600, cast=int)
+# Attente du dispatcher quand la file est vide (secondes) et conservation des messages envoyés (jours)
+NOTIFICATIONS_POLL_INTERVAL = config('NOTIFICATIONS_POLL_INTERVAL', default=2.0, cast=float)
+NOTIFICATIONS_RETENTION_DAYS = config('NOTIFICATIONS_RETENTION_DAYS', default=7, cast=int)
+
+# Import en masse de comptes : taille maximale, blocs de bulk_create, lien d'activation envoyé aux comptes
+ONBOARDING_MAX_ROWS = config('ONBOARDING_MAX_ROWS', default=10000, cast=int)
+ONBOARDING_CHUNK_SIZE = config('ONBOARDING_CHUNK_SIZE', default=500, cast=int)
+ONBOARDING_ACTIVATION_URL = config('ONBOARDING_ACTIVATION_URL', default='http://localhost:3000/activate')
+
+# Listes de l'admin : au-delà de ce nombre de lignes estimé (PostgreSQL), pas de COUNT(*) exact (0 : toujours exact)
+ADMIN_ESTIMATED_COUNT_THRESHOLD = config('ADMIN_ESTIMATED_COUNT_THRESHOLD', default=100000, cast=int)
+
+# Synchronisation incrémentale : durée de validité des jetons et de conservation du journal, taille de page
+SYNC_RETENTION_DAYS = config('SYNC_RETENTION_DAYS', default=30, cast=int)
+SYNC_PAGE_SIZE = config('SYNC_PAGE_SIZE', default=500, cast=int)
+# Le jeton ne dépasse pas les modifications plus récentes que ce délai (transactions encore ouvertes)
+SYNC_SAFETY_SECONDS = config('SYNC_SAFETY_SECONDS', default=5, cast=int)
+
+# Compression des réponses : encodages par ordre de préférence (br et zstd si brotli/zstandard sont installés)
+COMPRESSION_ENABLED = config('COMPRESSION_ENABLED', default=True, cast=bool)
+COMPRESSION_ENCODINGS = config('COMPRESSION_ENCODINGS', default='zstd,br,gzip', cast=Csv())
+# Niveaux choisis pour la latence (manage.py bench_compression) plutôt que pour le taux maximal
+COMPRESSION_LEVELS = {
+    'gzip': config('COMPRESSION_GZIP_LEVEL', default=5, cast=int),
+    'br': config('COMPRESSION_BROTLI_LEVEL', default=4, cast=int),
+    'zstd': config('COMPRESSION_ZSTD_LEVEL', default=3, cast=int),
+}
+# En dessous de cette taille (octets), le gain ne compense pas le coût ; ne s'applique pas aux flux
+COMPRESSION_MIN_SIZE = config('COMPRESSION_MIN_SIZE', default=1024, cast=int)
+# Flux : octets reçus entre deux vidages du compresseur (latence contre taux de compression)
+COMPRESSION_STREAM_FLUSH_SIZE = config('COMPRESSION_STREAM_FLUSH_SIZE', default=16384, cast=int)
+# Types compressés ('text/' : préfixe) ; les types +json et +xml le sont aussi
+COMPRESSION_CONTENT_TYPES = (
+    'application/json',
+    'application/x-ndjson',
+    'application/javascript',
+    'application/xml',
+    'image/svg+xml',
+    'text/',
+)
+
+# Statistiques de cohorte : durée maximale en cache, tranches d'âge (bornes basses), largeur des classes d'IMC
+COHORT_STATS_CACHE_SECONDS = config('COHORT_STATS_CACHE_SECONDS', default=600, cast=int)
+COHORT_AGE_BANDS = (0, 18, 40, 65)
+COHORT_BMI_BUCKET_WIDTH = config('COHORT_BMI_BUCKET_WIDTH', default=2.5, cast=float)
+# Maladies chroniques suivies (recherche dans Patient.chronic_diseases)
+COHORT_CHRONIC_DISEASES = config(
+    'COHORT_CHRONIC_DISEASES', default='diabète,hypertension,asthme,drépanocytose,VIH', cast=Csv()
+)
+
+# Fiche d'urgence (medical_records.emergency) : dossiers urgents affichés, taille du jeton public
+# (octets aléatoires) et durée en cache d'une fiche servie
+EMERGENCY_CARD_MAX_RECORDS = config('EMERGENCY_CARD_MAX_RECORDS', default=5, cast=int)
+EMERGENCY_CARD_TOKEN_BYTES = config('EMERGENCY_CARD_TOKEN_BYTES', default=24, cast=int)
+EMERGENCY_CARD_CACHE_SECONDS = config('EMERGENCY_CARD_CACHE_SECONDS', default=86400, cast=int)
+
+# Équipes de soins (core.care_team) : si actif, un docteur ne voit que les patients dont il est membre de
+# l'équipe ; désactivé, tout docteur voit tous les dossiers (à activer une fois les équipes constituées)
+CARE_TEAM_ENFORCEMENT = config('CARE_TEAM_ENFORCEMENT', default=False, cast=bool)
+
+# Regroupement des requêtes identiques simultanées (core.singleflight) : carnet PDF complet et recherches
+SINGLEFLIGHT_ENABLED = config('SINGLEFLIGHT_ENABLED', default=True, cast=bool)
+# Attente maximale (secondes) d'un calcul mené par une autre requête, au-delà la requête calcule elle-même
+SINGLEFLIGHT_WAIT_SECONDS = config('SINGLEFLIGHT_WAIT_SECONDS', default=30, cast=int)
+# Expiration de secours du verrou entre workers, au-delà du plus long calcul attendu
+SINGLEFLIGHT_LOCK_SECONDS = config('SINGLEFLIGHT_LOCK_SECONDS', default=120, cast=int)
+# Durée de publication d'un résultat, et d'une erreur, pour les workers en attente
+SINGLEFLIGHT_RESULT_SECONDS = config('SINGLEFLIGHT_RESULT_SECONDS', default=10, cast=int)
+SINGLEFLIGHT_ERROR_SECONDS = config('SINGLEFLIGHT_ERROR_SECONDS', default=1, cast=int)
+# Intervalle (secondes) entre deux lectures du cache par un worker en attente
+SINGLEFLIGHT_POLL_INTERVAL = config('SINGLEFLIGHT_POLL_INTERVAL', default=0.05, cast=float)
+
+# Profilage à la demande d'une requête (core.profiling) : désactivé, le middleware est retiré de la chaîne
+PROFILING_ENABLED = config('PROFILING_ENABLED', default=False, cast=bool)
+# Durée de validité (secondes) d'un jeton de profilage et durée de conservation des artefacts
+PROFILING_TOKEN_MAX_AGE = config('PROFILING_TOKEN_MAX_AGE', default=900, cast=int)
+PROFILING_ARTIFACT_SECONDS = config('PROFILING_ARTIFACT_SECONDS', default=3600, cast=int)
+# Mode 'sampling' : intervalle entre deux relevés de pile (millisecondes) ; en dessous de
+# sys.getswitchinterval() (5 ms) le GIL ne laisse pas le thread d'échantillonnage suivre
+PROFILING_SAMPLE_INTERVAL_MS = config('PROFILING_SAMPLE_INTERVAL_MS', default=5, cast=float)
+# Mode 'memory' : profondeur des piles d'allocation et nombre de lignes du rapport
+PROFILING_MEMORY_FRAMES = config('PROFILING_MEMORY_FRAMES', default=10, cast=int)
+PROFILING_MEMORY_TOP = config('PROFILING_MEMORY_TOP', default=50, cast=int)
+
 # JWT Settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
@@ -185,8 +409,16 @@ SWAGGER_SETTINGS = {
         }
     },
     'USE_SESSION_AUTH': False,
+    'SPEC_URL': 'schema-json',
+}
+
+REDOC_SETTINGS = {
+    'SPEC_URL': 'schema-json',
 }
 
+# Schéma OpenAPI précalculé (manage.py generate_openapi_schema)
+OPENAPI_SCHEMA_DIR = BASE_DIR / 'tohpitoh_backend' / 'docs' / 'build'
+
 # File upload settings
 FILE_UPLOAD_MAX_MEMORY_SIZE = 5242880  # 5MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 5242880  # 5MB
\ No newline at end of file
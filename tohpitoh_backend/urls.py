@@ -4,27 +4,11 @@ from django.conf import settings
 from django.conf.urls.static import static
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
-# Import pour la documentation Swagger
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
-from rest_framework import permissions
-
-
-schema_view = get_schema_view(
-    openapi.Info(
-        title="API TOHPITOH - Dossier Électronique du Patient",
-        default_version='v1',
-        description="""
-        API complète pour le système de Dossier Électronique du Patient (DEP) TOHPITOH.
-        
-        """,
-        terms_of_service="https://www.tohpitoh.ci/terms/",
-        contact=openapi.Contact(email="contact@tohpitoh.ci"),
-        license=openapi.License(name="Propriétaire"),
-    ),
-    public=True,
-    permission_classes=(permissions.AllowAny,),
-)
+from medical_records.views import emergency_card_view
+
+# Documentation Swagger (drf_yasg chargé à la première requête)
+from tohpitoh_backend.docs.views import openapi_schema_view, schema_ui_view
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -36,11 +20,14 @@ urlpatterns = [
     # App URLs
     path('api/auth/', include('authentication.urls')),
     path('api/medical-records/', include('medical_records.urls')),
+    path('api/ops/', include('core.urls')),
+    # Fiche d'urgence publique (jeton du QR code)
+    path('api/emergency/<str:token>/', emergency_card_view, name='emergency-card'),
 
     # Documentation API
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
-    path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
-    path('swagger.json', schema_view.without_ui(cache_timeout=0), name='schema-json'),
+    path('swagger/', schema_ui_view('swagger'), name='schema-swagger-ui'),
+    path('redoc/', schema_ui_view('redoc'), name='schema-redoc'),
+    path('swagger.json', openapi_schema_view, name='schema-json'),
     
 ]
 